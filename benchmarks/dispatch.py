@@ -0,0 +1,116 @@
+"""Measures the per-message cost of delivering tiny messages to a local actor.
+
+Also compares classifying messages by their tag (as `Cell` does) against the chain of pattern comparisons that was
+used before, so as to show the per-message classification cost in isolation; and likewise a `receive` written as a
+chain of `NUM_BRANCHES` pattern comparisons against the same written with `@on` handlers, for messages handled by the
+first and by the last branch.
+
+Run with:
+
+    $ python benchmarks/dispatch.py [NUM_MESSAGES]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from spinoff.actor import Actor, Node, on
+from spinoff.actor._actor import _tag_of
+from spinoff.actor.exceptions import Unhandled
+from spinoff.actor.remoting import HubWithNoRemoting
+from spinoff.util.pattern_matching import ANY
+
+
+_LEGACY_SYSTEM_MESSAGES = ('_start', '_stop', '_restart', '_suspend', '_resume', ('_child_terminated', ANY))
+
+
+def legacy_classify(message):
+    # the checks done by `Cell.receive` and `Cell._process_one_message` before messages were tagged
+    if message == ('_watched', ANY) or message == ('_unwatched', ANY) or message == ('_node_down', ANY):
+        return True
+    elif ('terminated', ANY) == message:
+        return True
+    elif message in _LEGACY_SYSTEM_MESSAGES:
+        return True
+    return ('_error', ANY, ANY, ANY) == message or ('_child_terminated', ANY) == message
+
+
+class Sink(Actor):
+    count = 0
+
+    def receive(self, msg):
+        self.count += 1
+
+
+NUM_BRANCHES = 40
+_TAGS = ['msg%d' % (i,) for i in range(NUM_BRANCHES)]
+
+
+def _chain_receive():
+    def receive(message):
+        for tag in _TAGS:  # stands for an `if (tag, ANY, ANY) == message: ... elif ...` chain
+            if (tag, ANY, ANY) == message:
+                return tag
+        raise Unhandled
+    return receive
+
+
+def _on_receive():
+    def handler(tag):
+        @on((tag, ANY, ANY))
+        def handle(self, message):
+            return tag
+        return handle
+    Handlers = type('Handlers', (Actor,), dict(('handle_' + tag, handler(tag)) for tag in _TAGS))
+    handlers = Handlers.__new__(Handlers)
+    return lambda message: handlers.receive(message)
+
+
+def _report(label, dt, n):
+    print("%-32s %8.3f us/msg  (%d msgs in %.3fs)" % (label, dt / n * 1e6, n, dt))
+
+
+def bench_send(label, messages, n):
+    node = Node(hub=HubWithNoRemoting())
+    ref = node.spawn(Sink)
+    send = ref.send
+    msgs = (messages * (n // len(messages) + 1))[:n]
+    t0 = time.time()
+    for msg in msgs:
+        send(msg)
+    _report('send ' + label, time.time() - t0, n)
+
+
+def bench_classify(label, classify, messages, n):
+    msgs = (messages * (n // len(messages) + 1))[:n]
+    t0 = time.time()
+    for msg in msgs:
+        classify(msg)
+    _report(label, time.time() - t0, n)
+
+
+def main(n=200000):
+    Actor.SPAWNING_IS_ASYNC = False
+
+    other = Node(hub=HubWithNoRemoting()).spawn(Actor)
+
+    user_msgs = ['tick', 1, ('tick', 1, 2), ('terminated-ish', 1)]
+    system_msgs = ['_stop', ('_unwatched', other), ('terminated', other), ('_error', other, None, None)]
+    for label, msgs in [('user', user_msgs), ('system', system_msgs)]:
+        bench_classify('classify %s: patterns' % (label,), legacy_classify, msgs, n)
+        bench_classify('classify %s: tags' % (label,), _tag_of, msgs, n)
+
+    for label, msgs in [('first', [(_TAGS[0], 1, 2)]), ('last', [(_TAGS[-1], 1, 2)])]:
+        bench_classify('receive %s: if/elif chain' % (label,), _chain_receive(), msgs, n)
+        bench_classify('receive %s: @on handlers' % (label,), _on_receive(), msgs, n)
+
+    bench_send('str', ['tick'], n)
+    bench_send('int', [1], n)
+    bench_send('tuple', [('tick', 1, 2)], n)
+    bench_send('system: _unwatched', [('_unwatched', other)], n)
+    bench_send('system: unwanted terminated', [('terminated', other)], n)
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
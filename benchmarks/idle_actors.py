@@ -0,0 +1,55 @@
+"""Measures the memory cost of idle actors by spawning a large number of them and reporting the bytes per actor.
+
+The actors are spawned under a single parent so as to also include the cost of the bookkeeping in the parent and in the
+node-wide path index.
+
+Run with:
+
+    $ python benchmarks/idle_actors.py [NUM_ACTORS]
+
+"""
+from __future__ import print_function
+
+import gc
+import resource
+import sys
+import time
+
+from spinoff.actor import Actor, Node
+from spinoff.actor.remoting import HubWithNoRemoting
+
+
+class Idle(Actor):
+    def receive(self, message):
+        pass
+
+
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except IOError:  # not Linux; the peak is the best we can do, which is fine as memory only grows here
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def main(n=1000000):
+    Actor.SPAWNING_IS_ASYNC = False
+
+    node = Node(hub=HubWithNoRemoting())
+    parent = node.spawn(Actor, name='sessions')
+    spawn = parent._cell.spawn
+
+    gc.collect()
+    before = rss()
+    t0 = time.time()
+    refs = [spawn(Idle) for _ in xrange(n)]
+    dt = time.time() - t0
+    gc.collect()  # spawning leaves reference cycles behind
+    after = rss()
+
+    print("%d idle actors: %.1f bytes/actor, spawned in %.2fs (%.2f us/actor)" % (
+        len(refs), float(after - before) / n, dt, dt / n * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
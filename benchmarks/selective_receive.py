@@ -0,0 +1,50 @@
+"""Measures `Process.get` picking specific replies out of a deep backlog of stashed messages.
+
+A process first has NUM_STASHED unrelated messages stashed and then gets NUM_REPLIES replies one by one by their
+correlation ID, in the reverse order of arrival, which is the worst case for a linear scan of the stash.
+
+Run with:
+
+    $ python benchmarks/selective_receive.py [NUM_STASHED [NUM_REPLIES]]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from twisted.internet.defer import Deferred
+
+from spinoff.actor import Actor, Node
+from spinoff.actor.process import Process
+from spinoff.actor.remoting import HubWithNoRemoting
+from spinoff.util.pattern_matching import ANY
+
+
+def main(num_stashed=10000, num_replies=1000):
+    Actor.SPAWNING_IS_ASYNC = False
+    start = Deferred()
+    timings = []
+
+    class Requester(Process):
+        def run(self):
+            yield start
+            t0 = time.time()
+            for i in reversed(range(num_replies)):
+                yield self.get(('reply', i, ANY))
+            timings.append(time.time() - t0)
+
+    p = Node(hub=HubWithNoRemoting()).spawn(Requester)
+    for i in range(num_stashed):
+        p << ('event', i)
+    for i in range(num_replies):
+        p << ('reply', i, 'payload')
+    start.callback(None)
+
+    dt, = timings
+    print("%d gets with %d stashed messages: %.1f us/get" % (num_replies, num_stashed + num_replies,
+                                                            dt / num_replies * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,47 @@
+"""Measures encoding and decoding remote messages in each wire format of `spinoff.actor.serialization`.
+
+Run with:
+
+    $ python benchmarks/wire.py [NUM_MESSAGES]
+
+"""
+from __future__ import print_function
+
+import sys
+import time
+
+from spinoff.actor import Node, Ref, Uri
+from spinoff.actor.remoting import HubWithNoRemoting
+from spinoff.actor.serialization import Pickle, FastPickle, Compact
+
+
+class _Hub(object):
+    nodeid = 'receiver:123'
+    guardian = Node(hub=HubWithNoRemoting()).guardian
+
+
+def main(n=100000):
+    hub = _Hub()
+    sender = Ref(cell=None, uri=Uri.parse('sender:123/workers/worker-7'), is_local=False, hub=hub)
+    messages = [
+        ('tick', 1, 2),
+        ('result', 1234567, 3.25, u'r\xe9sum\xe9', sender),
+        ('state', sender, ('counters', (1, 2, 3, 4, 5, 6, 7, 8)), 'x' * 200, None, True),
+    ]
+    for msg in messages:
+        print(("%r" % (msg,))[:80] + ":")
+        for serializer in [Pickle, FastPickle, Compact]:
+            t0 = time.time()
+            for _ in xrange(n):
+                data = serializer.dumps('/some/actor', msg)
+            dt_dumps = time.time() - t0
+            t0 = time.time()
+            for _ in xrange(n):
+                serializer.loads(data, hub)
+            dt_loads = time.time() - t0
+            print("    %-10r %4d bytes  dumps %6.2f us  loads %6.2f us" % (
+                serializer, len(data), dt_dumps / n * 1e6, dt_loads / n * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
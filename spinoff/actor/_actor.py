@@ -5,25 +5,30 @@ import abc
 import inspect
 import re
 import sys
+import threading
 import types
 import traceback
 import warnings
-import weakref
 from pickle import PicklingError
 from collections import deque
 from itertools import count, chain
 
 from twisted.internet.defer import inlineCallbacks, Deferred
+from twisted.python.failure import Failure
 from txcoroutine import coroutine
 
 from spinoff.actor.events import (
-    Events, UnhandledMessage, DeadLetter, ErrorIgnored, TopLevelActorTerminated, ErrorReportingFailure, Error, UnhandledError)
+    Events, UnhandledMessage, DeadLetter, ErrorIgnored, TopLevelActorTerminated, ErrorReportingFailure, Error, UnhandledError,
+    MessageDropped)
+from spinoff.actor.mailbox import Overflow, DropNewest, DropOldest, ToDeadLetters, Backpressure
+from spinoff.actor.scheduler import default_scheduler
+from spinoff.actor import dispatch
 from spinoff.actor.supervision import Decision, Resume, Restart, Stop, Escalate, Default
 from spinoff.actor.exceptions import (
     NameConflict, LookupFailed, Unhandled, CreateFailed, UnhandledTermination, BadSupervision, WrappingException)
-from spinoff.util.pattern_matching import IS_INSTANCE, ANY, IN
+from spinoff.util.pattern_matching import IS_INSTANCE, ANY
 from spinoff.util.async import with_timeout, Timeout, sleep, call_when_idle
-from spinoff.util.pattern_matching import Matcher
+from spinoff.util.pattern_matching import Matcher, OR, PatternIndex
 from spinoff.util.logging import logstring, dbg, fail, panic, err
 from spinoff.util.python import clean_tb_twisted
 
@@ -36,8 +41,43 @@ _VALID_HOSTNAME_RE = '(?:(?:[a-zA-Z]|[a-zA-Z][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*(?:[A
 _VALID_NODEID_RE = re.compile('(?:%s|%s):(?P<port>[0-9]+)$' % (_VALID_HOSTNAME_RE, _VALID_IP_RE))
 
 
+# messages that get special handling from the framework are classified by their tag: argumentless messages are bare
+# `str`s and serve as their own tag, the rest are tuples tagged by their first item and have a fixed length.
+_BARE_TAGS = frozenset(['_start', '_stop', '_restart', '_suspend', '_resume'])
+_TUPLE_TAGS = {'_child_terminated': 2, '_error': 4, '_watched': 2, '_unwatched': 2, '_node_down': 2, 'terminated': 2}
+
 # these messages get special handling from the framework and never reach Actor.receive
-_SYSTEM_MESSAGES = ('_start', '_stop', '_restart', '_suspend', '_resume', ('_child_terminated', ANY))
+_SYSTEM_TAGS = frozenset(['_start', '_stop', '_restart', '_suspend', '_resume', '_child_terminated'])
+# messages that are processed even while the actor is suspended
+_UNSUSPENDING_TAGS = frozenset(['_stop', '_restart', '_resume', '_suspend'])
+# messages that are silently discarded when sent to a dead actor
+_DEAD_IGNORED_TAGS = frozenset(['_stop', '_suspend', '_resume', '_restart', 'terminated', '_watched', '_unwatched'])
+
+
+def _tag_of(message):
+    """Returns the tag of a message that the framework handles specially, or `None` for regular user messages.
+
+    This is a single type check plus a dict lookup, as opposed to comparing the message against a chain of patterns.
+
+    """
+    t = type(message)
+    if t is str or t is unicode:  # `unicode` tags compare and hash equal to their `str` counterparts
+        return message if message in _BARE_TAGS else None
+    elif t is tuple and message:
+        tag = message[0]
+        if (type(tag) is str or type(tag) is unicode) and _TUPLE_TAGS.get(tag) == len(message):
+            return tag
+    return None
+
+
+class _Offloaded(threading.local):
+    # `send` is set by pool dispatchers in the threads and processes they run actors in, so that sends done by actors
+    # running off the reactor thread are carried out on the reactor thread; it returns `True` if it took care of the
+    # send; see `spinoff.actor.dispatch`
+    send = None
+
+
+_offloaded = _Offloaded()
 
 
 class Uri(object):
@@ -47,26 +87,59 @@ class Uri(object):
     used **only** as a path separator. Thus, both of the name and path path of the root `Uri` are `''`, and the steps
     are `['']`. The root `Uri` is also only `__eq__` to `''` and not `'/'`.
 
+    `Uri`s are immutable: their path, string representation, hash and root are computed once when they are constructed.
+    `Uri.parse` furthermore returns shared instances for addresses it has already parsed.
+
     """
-    _node = None
+    __slots__ = ('_name', '_parent', '_node', '_root', '_path', '_str', '_hash')
+
+    # the number of parsed `Uri`s kept around for reuse by `Uri.parse`; the table is simply emptied when it fills up
+    INTERN_MAX = 10000
+    _interned = {}
 
     def __init__(self, name, parent, node=None):
         if name and node:
             raise TypeError("node specified for a non-root Uri")  # pragma: no cover
-        self.name, self.parent = name, parent
-        if node:
-            _validate_nodeid(node)
-            self._node = node
+        if parent:
+            root = parent._root
+            node = root._node
+            path = parent._path + '/' + (name or '')
+        else:
+            root = self
+            if node:
+                _validate_nodeid(node)
+            else:
+                node = None
+            path = name or ''
+        setattr_ = object.__setattr__
+        setattr_(self, '_name', name)
+        setattr_(self, '_parent', parent)
+        setattr_(self, '_node', node)
+        setattr_(self, '_root', root)
+        setattr_(self, '_path', path)
+        setattr_(self, '_str', (node or '') + path)
+        setattr_(self, '_hash', hash(self._str))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Uri objects are immutable")
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def parent(self):
+        return self._parent
 
     @property
     def root(self):
         """Returns the topmost `Uri` this `Uri` is part of."""
-        return self.parent.root if self.parent else self
+        return self._root
 
     @property
     def node(self):
         """Returns the node ID this `Uri` points to."""
-        return self.root._node
+        return self._node
 
     def __div__(self, child):
         """Builds a new child `Uri` of this `Uri` with the given `name`."""
@@ -81,25 +154,22 @@ class Uri(object):
     @property
     def path(self):
         """Returns the `Uri` without the `node` part as a `str`."""
-        return '/'.join(self.steps)
+        return self._path
 
     @property
     def steps(self):
-        """Returns an iterable containing the steps to this `Uri` from the root `Uri`, including the root `Uri`."""
-        def _iter(uri, acc):
-            acc.appendleft(uri.name if uri.name else '')
-            return _iter(uri.parent, acc) if uri.parent else acc
-        return _iter(self, acc=deque())
+        """Returns a list containing the steps to this `Uri` from the root `Uri`, including the root `Uri`."""
+        return self._path.split('/')
 
     def __str__(self):
-        return (self.node or '') + self.path
+        return self._str
 
     def __repr__(self):
-        return '<@%s>' % (str(self),)
+        return '<@%s>' % (self._str,)
 
     @property
     def url(self):
-        return 'tcp://' + str(self) if self.node else None
+        return 'tcp://' + self._str if self._node else None
 
     @classmethod
     def parse(cls, addr):
@@ -116,6 +186,11 @@ class Uri(object):
         (None, ['foo', 'bar'], 'foo/bar', 'bar')
 
         """
+        interned = cls._interned
+        try:
+            return interned[addr]
+        except KeyError:
+            pass
         if addr.endswith('/'):
             raise ValueError("Uris must not end in '/'")  # pragma: no cover
         parts = addr.split('/')
@@ -128,18 +203,22 @@ class Uri(object):
         for step in parts:
             ret = Uri(name=step, parent=ret, node=node)
             node = None  # only set the node on the root Uri
+
+        if len(interned) >= cls.INTERN_MAX:
+            interned.clear()
+        interned[addr] = ret
         return ret
 
     @property
     def local(self):
         """Returns a copy of the `Uri` without the node. If the `Uri` has no node, returns the `Uri`."""
-        if not self.node:
+        if not self._node:
             return self
         else:
-            return Uri.parse(self.path)
+            return Uri.parse(self._path)
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __eq__(self, other):
         """Returns `True` if `other` points to the same actor.
@@ -147,17 +226,29 @@ class Uri(object):
         This method is cooperative with the `pattern_matching` module.
 
         """
-        if isinstance(other, str):
-            other = Uri.parse(other)
-        return str(self) == str(other) or isinstance(other, Matcher) and other == self
+        if other is self:
+            return True
+        elif isinstance(other, Uri):
+            return self._hash == other._hash and self._str == other._str
+        elif isinstance(other, basestring):
+            return self._str == other
+        return isinstance(other, Matcher) and other == self
 
     def __ne__(self, other):
         return not (self == other)
 
+    def __reduce__(self):
+        return _parse_uri, (self._str,)
+
+
+def _parse_uri(addr):  # bound classmethods can't be pickled
+    return Uri.parse(addr)
+
 
 class _BaseRef(object):
     """Internal abstract class for all objects that behave like actor references."""
     __metaclass__ = abc.ABCMeta
+    __slots__ = ()
 
     @abc.abstractproperty
     def is_local(self):
@@ -244,14 +335,10 @@ class Ref(_BaseRef):
 
     """
 
-    _cell = None
-
     # XXX: should be is_resolved with perhaps is_local being None while is_resolved is False
     # Ref constructor should set is_resolved=False by default, but that requires is_dead for creating dead refs, because
     # currently dead refs are just Refs with no cell and is_local=True
-    is_local = True
-    uri = None
-    hub = None
+    __slots__ = ('_cell', 'uri', 'hub', 'is_local')
 
     def __init__(self, cell, uri, is_local=True, hub=None):
         assert is_local or not cell
@@ -260,7 +347,7 @@ class Ref(_BaseRef):
         if cell:
             assert not hub
             assert isinstance(cell, Cell)
-            self._cell = cell
+        self._cell = cell
         self.uri = uri
         self.hub = hub
         self.is_local = is_local
@@ -275,17 +362,22 @@ class Ref(_BaseRef):
         passing `force_async=True` to this method, or overridden globally by setting `actor.SENDING_IS_ASYNC = True`;
         globally changing this is not recommended however unless you know what you're doing (e.g. during testing).
 
+        If the message is held back by a full mailbox with the `Backpressure` overflow policy, returns a `Deferred`
+        that fires once the message has been accepted; otherwise returns `None`.
+
         """
+        offloaded_send = _offloaded.send
+        if offloaded_send is not None and offloaded_send(self, message, force_async):
+            return
         if self._cell:
-            self._cell.receive(message, force_async=force_async)
+            return self._cell.receive(message, force_async=force_async)
         elif not self.is_local:
-            self.hub.send(message, to_remote_actor_pointed_to_by=self)
+            return self.hub.send(message, to_remote_actor_pointed_to_by=self)
         else:
-            if ('_watched', ANY) == message:
+            tag = _tag_of(message)
+            if tag == '_watched':
                 message[1].send(('terminated', self))
-            elif message in ('_stop', '_suspend', '_resume', '_restart', (IN(['terminated', '_watched', '_unwatched']), ANY)):
-                pass
-            else:
+            elif tag not in _DEAD_IGNORED_TAGS:
                 Events.log(DeadLetter(self, message))
 
     @property
@@ -327,7 +419,9 @@ class Ref(_BaseRef):
         return str(self.uri)  # if self.is_local else (str(self.uri), self.hub)
 
     def __setstate__(self, uri):
-        # if it's a tuple, it's a remote `Ref` and the tuple origates from IncomingMessageUnpickler,
+        self._cell = self.hub = None
+        self.is_local = True
+        # if it's a tuple, it's a remote `Ref` and the tuple origates from serialization.IncomingMessageUnpickler,
         # otherwise it must be just a local `Ref` being pickled and unpickled for whatever reason:
         if isinstance(uri, tuple):
             self.is_local = False
@@ -337,6 +431,7 @@ class Ref(_BaseRef):
 
 class _BaseCell(object):
     __metaclass__ = abc.ABCMeta
+    __slots__ = ()
 
     _children = {}  # XXX: should be a read-only dict
     _child_name_gen = None
@@ -379,6 +474,8 @@ class _BaseCell(object):
         child = _do_spawn(parent=self.ref, factory=factory, uri=uri, hub=self.hub)
         if name in self._children:  # it might have been removed already
             self._children[name] = child
+            if child._cell:
+                self.root._cells[uri.path] = child._cell
 
         return child
 
@@ -395,7 +492,7 @@ class _BaseCell(object):
 
     @property
     def children(self):
-        return self._children.values()
+        return self._children.values() if self._children else []
 
     def _child_gone(self, child):
         name = child.uri.name  # rsplit('/', 1)[-1]
@@ -404,25 +501,14 @@ class _BaseCell(object):
     def get_child(self, name):
         if not (name and isinstance(name, str)):
             raise TypeError("get_child takes a non-emtpy string")  # pragma: no cover
-        return self._children.get(name, None)
+        return self._children.get(name, None) if self._children else None
 
     def lookup_cell(self, uri):
         """Looks up a local actor by its location relative to this actor."""
-        steps = uri.steps
-
-        if steps[0] == '':
-            found = self.root
-            steps.popleft()
-        else:
-            found = self
-
-        for step in steps:
-            assert step != ''
-            found = found.get_child(step)
-            if not found:
-                break
-            found = found._cell
-        return found
+        path = uri.path
+        if path and path[0] != '/':
+            path = self.uri.path + '/' + path
+        return self.root._cells.get(path)
 
     def lookup_ref(self, uri):
         if not isinstance(uri, (Uri, str)):
@@ -456,6 +542,9 @@ class Guardian(_BaseCell, _BaseRef):
     uri = None
     cell = None
     hub = None
+    scheduler = None
+
+    _cells = None  # path => cell for the entire hierarchy so that lookups are a single dict hit; see `lookup_path`
 
     def __init__(self, uri, node, hub, supervision=Stop):
         if supervision not in (Stop, Restart, Resume):
@@ -465,12 +554,18 @@ class Guardian(_BaseCell, _BaseRef):
         self.root = self
         self._cell = self  # for _BaseCell
         self.hub = hub
+        self.scheduler = node.scheduler
         self.supervision = supervision
+        self._cells = {'': self}
 
     @property
     def ref(self):
         return self
 
+    def lookup_path(self, path):
+        """Returns the cell of the local actor at the absolute `path` (a `str`), or `None` if there is no such actor."""
+        return self._cells.get(path)
+
     def send(self, message, force_async=False):
         if ('_error', ANY, IS_INSTANCE(Exception), IS_INSTANCE(types.TracebackType) | IS_INSTANCE(basestring)) == message:
             _, sender, exc, tb = message
@@ -527,6 +622,7 @@ class Node(object):
 
     """
     hub = None
+    scheduler = None
     _all = []
 
     @classmethod
@@ -544,9 +640,10 @@ class Node(object):
         from .remoting import HubWithNoRemoting
         return cls(hub=HubWithNoRemoting())
 
-    def __init__(self, hub, root_supervision=Stop):
+    def __init__(self, hub, root_supervision=Stop, scheduler=None):
         if not hub:  # pragma: no cover
             raise TypeError("Node instances must be bound to a Hub")
+        self.scheduler = scheduler or default_scheduler
         self._uri = Uri(name=None, parent=None, node=hub.nodeid if hub else None)
         self.guardian = Guardian(uri=self._uri, node=self, hub=hub, supervision=root_supervision)
         self.set_hub(hub)
@@ -606,13 +703,67 @@ class Node(object):
         return type(self)(hub)
 
 
+_on_seqnos = count()
+
+
+def on(*patterns):
+    """Declares the decorated `Actor` method as the handler of the messages that match any of `patterns`.
+
+    An actor class with `@on` handlers gets a `receive` that dispatches every message to the first handler whose pattern
+    matches it, or raises `Unhandled` if none do; handlers are called with the message and can be coroutines just like
+    `receive`. The handlers are tried in the order they are defined in, subclasses first, but messages are routed by
+    their tag and length (see `pattern_matching.PatternIndex`) so only the handlers for messages like the received one
+    are actually tried, no matter how many handlers there are:
+
+        class Publisher(Actor):
+            @on(('publish', ANY, ANY))
+            def publish(self, msg):
+                _, path, pub_id = msg
+                ...
+
+            @on('purge-old', ('purge', ANY))
+            def purge(self, msg):
+                ...
+
+    A class can't have both `@on` handlers and a `receive` of its own or of a base class, but a subclass of a class with
+    handlers can override `receive` and call the dispatching one with `super`.
+
+    Patterns are fixed when the class is created, so instead of e.g. `('terminated', self.child)`, use
+    `('terminated', ANY)` and check the actor in the handler.
+
+    """
+    if not patterns:
+        raise TypeError("on() requires at least one pattern")
+
+    def decorate(fn):
+        # stacked `@on`s add to the patterns of the method but keep its place in the order of the handlers
+        fn._on_patterns = patterns + getattr(fn, '_on_patterns', ())
+        if not hasattr(fn, '_on_seqno'):
+            fn._on_seqno = next(_on_seqnos)
+        return fn
+    return decorate
+
+
+def _dispatching_receive(index):
+    first = index.first
+
+    def receive(self, message):
+        name = first(message)
+        if name is None:
+            raise Unhandled
+        return getattr(self, name)(message)
+    receive._dispatches = True
+    return receive
+
+
 class ActorType(abc.ABCMeta):  # ABCMeta to enable Process.run to be @abstractmethod
     def __new__(self, *args, **kwargs):
         """Automatically wraps any receive methods that are reported to be generators by `inspect` with
-        `txcoroutine.coroutine`.
+        `txcoroutine.coroutine`; also builds the `receive` of classes with `@on` handlers (see `on`).
 
         """
         ret = super(ActorType, self).__new__(self, *args, **kwargs)
+        ret._collect_handlers()
         if inspect.isgeneratorfunction(ret.receive):
             ret.receive = coroutine(ret.receive)
         if hasattr(ret, 'pre_start') and inspect.isgeneratorfunction(ret.pre_start):
@@ -621,6 +772,32 @@ class ActorType(abc.ABCMeta):  # ABCMeta to enable Process.run to be @abstractme
             ret.post_stop = coroutine(ret.post_stop)
         return ret
 
+    def _collect_handlers(cls):
+        own = {}  # name => (seqno, patterns)
+        for name, fn in vars(cls).items():
+            if isinstance(fn, types.FunctionType) and hasattr(fn, '_on_patterns'):
+                own[name] = (fn._on_seqno, fn._on_patterns)
+                if inspect.isgeneratorfunction(fn):
+                    setattr(cls, name, coroutine(fn))
+        cls._on_handlers = own
+
+        handlers = {}  # name => (depth in the MRO, seqno, patterns); overridden handlers are replaced
+        for depth, base in reversed(list(enumerate(cls.__mro__))):
+            for name, (seqno, patterns) in vars(base).get('_on_handlers', {}).items():
+                handlers[name] = (depth, seqno, patterns)
+        if not handlers or not own and 'receive' in vars(cls):  # the latter overrides an inherited dispatching receive
+            return
+
+        receive_owner = next(base for base in cls.__mro__ if 'receive' in vars(base))
+        if not (receive_owner is Actor or getattr(vars(receive_owner)['receive'], '_dispatches', False)):
+            raise TypeError("%s can't have @on handlers as it (or %s) defines receive" % (
+                cls.__name__, receive_owner.__name__))
+
+        index = PatternIndex()
+        for name, (_, _, patterns) in sorted(handlers.items(), key=lambda (name, (depth, seqno, _)): (depth, seqno)):
+            index.add(patterns[0] if len(patterns) == 1 else OR(*patterns), name)
+        cls.receive = _dispatching_receive(index)
+
 
 class Actor(object):
     """Description here.
@@ -634,6 +811,17 @@ class Actor(object):
     SPAWNING_IS_ASYNC = _DEFAULT_SPAWNING_IS_ASYNC = True
     SENDING_IS_ASYNC = _DEFAULT_SENDING_IS_ASYNC = False
 
+    # the maximum number of regular messages waiting in the mailbox, or `None` for no limit; see `spinoff.actor.mailbox`
+    mailbox_size = None
+    mailbox_overflow = DropNewest
+
+    # the maximum number of messages processed back to back in a round of the scheduler before other actors get their
+    # turn; see `spinoff.actor.scheduler`
+    throughput = 100
+
+    # the name of the dispatcher that runs `receive`; see `spinoff.actor.dispatch`
+    dispatcher = 'reactor'
+
     @classmethod
     def using(cls, *args, **kwargs):
         return Props(cls, *args, **kwargs)
@@ -643,11 +831,17 @@ class Actor(object):
         cls.SPAWNING_IS_ASYNC = False if debug else cls._DEFAULT_SPAWNING_IS_ASYNC
         cls.SENDING_IS_ASYNC = cls._DEFAULT_SENDING_IS_ASYNC
 
-    __cell = None  # make it really private so it's hard and unpleasant to access the cell
-    __startargs = ((), {})
+    # the cell is made really private so it's hard and unpleasant to access it; the start args are only stored if there
+    # are any; actors don't get a `__dict__` until one of their (non-slot) attributes is set
+    __slots__ = ('__cell', '__startargs')
 
     def __init__(self, *args, **kwargs):
-        self.__startargs = args, kwargs
+        if args or kwargs:
+            self.__startargs = args, kwargs
+
+    @property
+    def _parent(self):
+        return self.__cell.parent
 
     def receive(self, message):
         raise Unhandled
@@ -686,7 +880,7 @@ class Actor(object):
     # a message already--otherwise this method would not get called.
     def send(self, *args, **kwargs):
         """Alias for self.ref.send"""
-        self.ref.send(*args, **kwargs)
+        return self.ref.send(*args, **kwargs)
 
     def __lshift__(self, message):  # pragma: no cover
         self.ref.send(message)
@@ -707,6 +901,8 @@ class Actor(object):
 
 # TODO: rename to _UnspawnedActor
 class Props(object):
+    settings = {}  # per-spawn overrides of actor class settings such as `mailbox_size`
+
     def __init__(self, cls, *args, **kwargs):
         if hasattr(inspect, 'getcallargs'):
             inspect.getcallargs(cls.__init__, None, *args, **kwargs)
@@ -718,7 +914,33 @@ class Props(object):
     def using(self, *args, **kwargs):
         args += args
         kwargs.update(self.kwargs)
-        return Props(self.cls, *args, **kwargs)
+        ret = Props(self.cls, *args, **kwargs)
+        ret.settings = self.settings
+        return ret
+
+    def with_mailbox(self, size, overflow=DropNewest):
+        """Returns a copy of these `Props` that bounds the actor's mailbox to `size` messages.
+
+        Overrides `Actor.mailbox_size` and `Actor.mailbox_overflow`; see `spinoff.actor.mailbox`.
+
+        """
+        _validate_mailbox(size, overflow)
+        return self._with_settings(mailbox_size=size, mailbox_overflow=overflow)
+
+    def with_throughput(self, throughput):
+        """Returns a copy of these `Props` that overrides `Actor.throughput` for the actor."""
+        _validate_throughput(throughput)
+        return self._with_settings(throughput=throughput)
+
+    def with_dispatcher(self, name):
+        """Returns a copy of these `Props` that overrides `Actor.dispatcher` for the actor."""
+        dispatch.get(name)
+        return self._with_settings(dispatcher=name)
+
+    def _with_settings(self, **settings):
+        ret = Props(self.cls, *self.args, **self.kwargs)
+        ret.settings = dict(self.settings, **settings)
+        return ret
 
     def __repr__(self):
         args = ', '.join(repr(x) for x in self.args)
@@ -726,6 +948,30 @@ class Props(object):
         return '<props:%s(%s%s)>' % (self.cls.__name__, args, ((', ' + kwargs) if args else kwargs) if kwargs else '')
 
 
+_NO_STARTARGS = ((), {})
+
+
+def _actor_setting(factory, name):
+    """Returns the value of an actor setting for actors spawned from `factory`, with `Props` overriding the class."""
+    if isinstance(factory, Props):
+        if name in factory.settings:
+            return factory.settings[name]
+        factory = factory.cls
+    return getattr(factory if isinstance(factory, type) and issubclass(factory, Actor) else Actor, name)
+
+
+def _validate_mailbox(size, overflow):
+    if size is not None and not (isinstance(size, (int, long)) and size > 0):
+        raise TypeError("Mailbox size should be a positive integer or None")
+    if not isinstance(overflow, Overflow):
+        raise TypeError("Mailbox overflow policy should be one of those in spinoff.actor.mailbox")
+
+
+def _validate_throughput(throughput):
+    if not (isinstance(throughput, (int, long)) and throughput > 0):
+        raise TypeError("Throughput should be a positive integer")
+
+
 def _do_spawn(parent, factory, uri, hub):
     cell = Cell(parent=parent, factory=factory, uri=uri, hub=hub)
     cell.receive('_start', force_async=Actor.SPAWNING_IS_ASYNC)
@@ -745,31 +991,27 @@ def default_supervise(exc):
 
 
 class Cell(_BaseCell):
-    constructed = False
-    started = False
-    actor = None
-    inbox = None
-    priority_inbox = None
-
-    # actor has begun shutting itself down but is waiting for all its children to stop first, and its own post_stop;
-    # in the shutting-down state, an actor only accepts '_child_terminated' messages (and '_force_stop' in the future)
-    shutting_down = False
-
-    stopped = False
-
-    suspended = False
-    tainted = False  # true when init or pre_start failed and the actor is waiting for supervisor decision
-    processing_messages = False
-    process_messages_pending = False
-    _ongoing = None
-
-    _ref = None
-    _child_name_gen = None
-    uri = None
-    hub = None
-
-    watchers = None
-    watchees = None
+    # there can be millions of cells per node so they are kept as small as possible: all state is in slots, both inboxes
+    # are only allocated once there are messages to put in them (and the priority inbox is released again when empty),
+    # and so are the sets of watchers and watchees.
+    __slots__ = (
+        'parent', 'factory', 'uri', 'hub', 'ref', 'actor', 'inbox', 'priority_inbox',
+        'constructed', 'started',
+        # actor has begun shutting itself down but is waiting for all its children to stop first, and its own
+        # post_stop; in the shutting-down state, an actor only accepts '_child_terminated' messages (and '_force_stop'
+        # in the future)
+        'shutting_down',
+        'stopped', 'suspended',
+        'tainted',  # true when init or pre_start failed and the actor is waiting for supervisor decision
+        'processing_messages', 'process_messages_pending', '_ongoing',
+        '_children', '_child_name_gen', '_all_children_stopped',
+        'watchers', 'watchees',
+        'mailbox_size', 'mailbox_overflow',
+        '_blocked',  # messages held back by a full mailbox along with the `Deferred`s returned to their senders
+        'throughput', 'scheduler',
+        'dispatcher',  # `None` for calling `receive` directly on the reactor thread
+        '__weakref__',
+    )
 
     def __init__(self, parent, factory, uri, hub):
         if not callable(factory):  # pragma: no cover
@@ -780,8 +1022,28 @@ class Cell(_BaseCell):
 
         self.factory = factory
 
-        self.inbox = deque()
-        self.priority_inbox = deque()
+        self.actor = self.inbox = self.priority_inbox = self._ongoing = None
+        self.constructed = self.started = self.shutting_down = self.stopped = self.suspended = self.tainted = False
+        self.processing_messages = self.process_messages_pending = False
+        self._children = self._child_name_gen = self._all_children_stopped = None
+        self.watchers = self.watchees = self._blocked = None
+
+        mailbox_size = _actor_setting(factory, 'mailbox_size')
+        overflow = DropNewest
+        if mailbox_size is not None:
+            overflow = _actor_setting(factory, 'mailbox_overflow')
+            _validate_mailbox(mailbox_size, overflow)
+        self.mailbox_size, self.mailbox_overflow = mailbox_size, overflow
+
+        throughput = _actor_setting(factory, 'throughput')
+        if throughput != Actor.throughput:
+            _validate_throughput(throughput)
+        self.throughput = throughput
+
+        self.dispatcher = dispatch.get(_actor_setting(factory, 'dispatcher'))
+        self.scheduler = self.root.scheduler
+
+        self.ref = Ref(self, uri)  # the one and only `Ref` that refers to the actor through its cell
 
     @property
     def root(self):
@@ -792,22 +1054,31 @@ class Cell(_BaseCell):
         return self.inbox or self.priority_inbox
 
     def consume_message(self):
-        try:
-            return self.priority_inbox.popleft()
-        except IndexError:
+        priority_inbox = self.priority_inbox
+        if priority_inbox:
+            message = priority_inbox.popleft()
+            if not priority_inbox:
+                self.priority_inbox = None
+            return message
+        else:
             try:
-                return self.inbox.popleft()
-            except IndexError:  # pragma: no cover
+                message = self.inbox.popleft()
+            except (IndexError, AttributeError):  # pragma: no cover
                 assert False, "should not reach here"
+            if self._blocked:
+                # there's room for one more now
+                blocked_message, d = self._blocked.popleft()
+                self.inbox.append(blocked_message)
+                d.callback(None)
+            return message
 
     def peek_message(self):
-        try:
+        if self.priority_inbox:
             return self.priority_inbox[0]
-        except IndexError:
-            try:
-                return self.inbox[0]
-            except IndexError:
-                return None
+        elif self.inbox:
+            return self.inbox[0]
+        else:
+            return None
 
     def logstate(self):  # pragma: no cover
         return {'--\\': self.shutting_down, '+': self.stopped, 'N': not self.started,
@@ -832,145 +1103,243 @@ class Cell(_BaseCell):
         # dbg(message if isinstance(message, str) else repr(message),)
         assert not self.stopped, "should not reach here"
 
+        tag = _tag_of(message)
+
         if self.shutting_down:
             # the shutting_down procedure is waiting for all children to terminate so we make an exception here
             # and handle the message directly, bypassing the standard message handling logic:
             # NB! DO NOT do this with a running actor--it changes the visible state of the actor
-            if message == ('_child_terminated', ANY):
+            if tag == '_child_terminated':
                 _, child = message
                 self._do_child_terminated(child)
             # don't care about any system message if we're already stopping:
-            elif message not in _SYSTEM_MESSAGES:
+            elif tag not in _SYSTEM_TAGS:
                 # so that it could be sent to dead letters when the stopping is complete:
+                if self.inbox is None:
+                    self.inbox = deque()
                 self.inbox.append(message)
             # XXX: untested
             elif self.priority_inbox:
                 self.priority_inbox.append(message)
             return
 
+        if tag is None:  # regular messages skip all of the system message handling
+            inbox = self.inbox
+            if inbox is None:
+                inbox = self.inbox = deque()
+            elif self.mailbox_size is not None and len(inbox) >= self.mailbox_size:
+                return self._overflow(message)
+            inbox.append(message)
+            self.process_messages(force_async=force_async)
+        else:
+            self._receive_dispatch[tag](self, message, force_async)
+
+    def _overflow(self, message):
+        overflow = self.mailbox_overflow
+        if overflow is Backpressure:
+            if not self._blocked:
+                self._blocked = deque()
+            d = Deferred()
+            self._blocked.append((message, d))
+            return d
+        elif overflow is DropOldest:
+            Events.log(MessageDropped(self.ref, self.inbox.popleft()))
+            self.inbox.append(message)
+        elif overflow is ToDeadLetters:
+            Events.log(DeadLetter(self.ref, message))
+        else:
+            Events.log(MessageDropped(self.ref, message))
+
+    def _enqueue(self, message, force_async):
+        if self.inbox is None:
+            self.inbox = deque()
+        self.inbox.append(message)
+        self.process_messages(force_async=force_async)
+
+    def _enqueue_priority(self, message, force_async):
+        if self.priority_inbox is None:
+            self.priority_inbox = deque()
+        self.priority_inbox.append(message)
+        self.process_messages(force_async=force_async)
+
+    def _receive_terminated(self, message, force_async):
         # XXX: should ('terminated', child) also be prioritised?
+        if self.watchees and message[1] in self.watchees:
+            self._enqueue(message, force_async)
+        # ...otherwise ignore unwanted termination message
 
-        # '_watched' is something that is safe to handle immediately as it doesn't change the visible state of the actor;
-        # NB: DO NOT do the same with '_suspend', '_resume' or any other message that changes the visible state of the actor!
-        if message == ('_watched', ANY):
-            self._do_watched(message[1])
-        elif message == ('_unwatched', ANY):
-            self._do_unwatched(message[1])
-        elif ('terminated', ANY) == message and not (self.watchees and message[1] in self.watchees):
-            pass  # ignore unwanted termination message
-        elif message == ('_node_down', ANY):
-            self._do_node_down(message[1])
-        # ...except in case of an ongoing receive in which case the suspend-resume event will be seem atomic to the actor
-        elif self._ongoing and message in ('_suspend', '_resume'):
+    def _receive_suspend_or_resume(self, message, force_async):
+        # in case of an ongoing receive the suspend-resume event will be seem atomic to the actor
+        if self._ongoing:
             if message == '_suspend':
                 self._do_suspend()
             else:
                 self._do_resume()
         else:
-            if message in _SYSTEM_MESSAGES:
-                self.priority_inbox.append(message)
-            else:
-                self.inbox.append(message)
-            self.process_messages(force_async=force_async)
+            self._enqueue_priority(message, force_async)
+
+    # '_watched' is something that is safe to handle immediately as it doesn't change the visible state of the actor;
+    # NB: DO NOT do the same with '_suspend', '_resume' or any other message that changes the visible state of the actor!
+    _receive_dispatch = {
+        '_watched': lambda self, message, _: self._do_watched(message[1]),
+        '_unwatched': lambda self, message, _: self._do_unwatched(message[1]),
+        '_node_down': lambda self, message, _: self._do_node_down(message[1]),
+        'terminated': _receive_terminated,
+        '_suspend': _receive_suspend_or_resume,
+        '_resume': _receive_suspend_or_resume,
+        '_start': _enqueue_priority,
+        '_stop': _enqueue_priority,
+        '_restart': _enqueue_priority,
+        '_child_terminated': _enqueue_priority,
+        '_error': _enqueue,
+    }
 
     @logstring(u'↻')
     def process_messages(self, force_async=False):
-        next_message = self.peek_message()
-        # dbg(next_message)
-
-        is_startstop = next_message in ('_start', '_stop')
-        is_untaint = next_message in ('_resume', '_restart')
-
-        if not self.processing_messages and (self.started or is_startstop or self.tainted and is_untaint) and not self.process_messages_pending:
-            if Actor.SENDING_IS_ASYNC or force_async:
-                # dbg(u'⇝')
-                # dbg("PROCESS-MSGS: async (Actor.SENDING_IS_ASYNC? %s  force_async? %s" % (Actor.SENDING_IS_ASYNC, force_async))
-                call_when_idle(self._process_messages)
-                self.process_messages_pending = True
-            else:
-                # dbg(u'↯')
-                self._process_messages()
-        # else:
-        #     dbg(u'  →X')
+        if self.processing_messages or self.process_messages_pending:
+            return
+        elif not self.started:
+            tag = _tag_of(self.peek_message())
+            # dbg(tag)
+            is_startstop = tag == '_start' or tag == '_stop'
+            is_untaint = tag == '_resume' or tag == '_restart'
+            if not (is_startstop or self.tainted and is_untaint):
+                return
+
+        if Actor.SENDING_IS_ASYNC or force_async:
+            # dbg(u'⇝')
+            # dbg("PROCESS-MSGS: async (Actor.SENDING_IS_ASYNC? %s  force_async? %s" % (Actor.SENDING_IS_ASYNC, force_async))
+            self.process_messages_pending = True
+            self.scheduler.schedule(self)
+        else:
+            # dbg(u'↯')
+            self._process_messages()
+
+    def _can_process_next(self):
+        if self.stopped:
+            return False
+        elif self.shutting_down:
+            return _tag_of(self.peek_message()) == '_child_terminated'
+        elif self.suspended:
+            return _tag_of(self.peek_message()) in _UNSUSPENDING_TAGS
+        else:
+            return bool(self.inbox or self.priority_inbox)
 
     @logstring(u'↻ ↻')
-    @inlineCallbacks
-    def _process_messages(self):
+    def _process_messages(self, scheduled=False):
         self.process_messages_pending = False
 
         # XXX: this method can be called after the actor is stopped--add idle call cancelling
         # dbg(self.peek_message())
-        # first = True
         try:
-            while not self.stopped and (not self.shutting_down) and self.has_message() and (not self.suspended or self.peek_message() in ('_stop', '_restart', '_resume', '_suspend')) or (self.shutting_down and ('_child_terminated', ANY) == self.peek_message()):
-                message = self.consume_message()
-                self.processing_messages = True
-                # if not first:
-                #     dbg(u"↪ %r" % (message,))
-                # first = False
+            message, pending = self._drain(self.throughput if scheduled else None)
+            if pending:
+                self._process_messages_async(message, pending)
+        except Exception:  # pragma: no cover
+            panic(u"!!BUG!!\n", traceback.format_exc())
+            self.report_to_parent()
+
+    def _drain(self, quantum=None):
+        """Processes messages back to back for as long as they can be processed synchronously, but when run by the
+        scheduler, no more than `quantum` regular messages; if there are still messages left after that, the actor is
+        put on the run queue of its scheduler to be continued in the next round. Synchronous delivery is not limited.
+
+        Returns the message whose processing did not complete synchronously together with the `Deferred` representing
+        its completion, or `(None, None)` if there are no more messages to be processed right now.
+
+        """
+        while self._can_process_next():
+            if quantum is not None and not self.priority_inbox:  # system messages don't count against the quantum
+                if not quantum:
+                    self.process_messages_pending = True
+                    self.scheduler.schedule(self)
+                    break
+                quantum -= 1
+            # before consuming, as that can notify senders held back by backpressure, whose sends must not process
+            # messages ahead of this one
+            self.processing_messages = True
+            message = self.consume_message()
+            try:
+                pending = self._process_one_message(message)
+            except Exception:
+                # dbg("☹")
+                self.report_to_parent()
+            else:
+                if pending:
+                    return message, pending
+            self.processing_messages = False
+        return None, None
+
+    @logstring(u'↻ ↻ …')
+    @inlineCallbacks
+    def _process_messages_async(self, message, pending):
+        # Only used once the processing of a message does not complete synchronously; continues draining the inbox
+        # synchronously again until the next message that does not, which is waited for in the same loop, so that no
+        # matter how many messages go asynchronous, there is no recursion.
+        try:
+            while pending:
                 try:
-                    yield self._process_one_message(message)
-                    # if isinstance(ret, Deferred) and not self.receive_is_coroutine:
-                    #     warnings.warn(ConsistencyWarning("prefer yielding Deferreds from Actor.receive rather than returning them"))
-                    # yield d
+                    try:
+                        yield pending
+                    except Unhandled:
+                        self._unhandled(message)
+                    else:
+                        if pending is self._ongoing:
+                            self._ongoing = None
                 except Exception:
                     # dbg("☹")
                     self.report_to_parent()
-                # else:
-                #     dbg(message, u"✓")
                 finally:
                     self.processing_messages = False
-            # dbg("☺")
+                message, pending = self._drain()
         except Exception:  # pragma: no cover
             panic(u"!!BUG!!\n", traceback.format_exc())
             self.report_to_parent()
 
     @logstring(u"↻ ↻ ↻")
-    @inlineCallbacks
     def _process_one_message(self, message):
+        """Processes `message` and returns a `Deferred` if that did not complete synchronously, or `None` if it did."""
         # dbg(message)
-        if '_start' == message:
-            yield self._do_start()
-        elif ('_error', ANY, ANY, ANY) == message:
-            _, sender, exc, tb = message
-            yield self._do_supervise(sender, exc, tb)
-        elif '_stop' == message:
-            self._do_stop()
-        elif '_restart' == message:
-            yield self._do_restart()
-        elif '_resume' == message:
-            yield self._do_resume()
-        elif '_suspend' == message:
-            self._do_suspend()
-        elif ('_child_terminated', ANY) == message:
-            _, child = message
-            self._do_child_terminated(child)
+        tag = _tag_of(message)
+        handler = self._process_dispatch.get(tag)
+        if handler:
+            return _pending(handler(self, message))
+
+        if tag == 'terminated':
+            _, watchee = message
+            # XXX: it's possible to have two termination messages in the queue; this will be solved when actors of
+            # nodes going down do not send individual messages but instead the node sends a single 'going-down'
+            # message:
+            if watchee not in self.watchees:
+                return None
+            self.watchees.remove(watchee)
+            self._unwatch(watchee, silent=True)
+
+        try:
+            if self.dispatcher is None:
+                ret = _pending(self.actor.receive(message))
+            else:
+                ret = self.dispatcher.dispatch(self.actor, message)
+        except Unhandled:
+            self._unhandled(message)
         else:
-            if ('terminated', ANY) == message:
-                _, watchee = message
-                # XXX: it's possible to have two termination messages in the queue; this will be solved when actors of
-                # nodes going down do not send individual messages but instead the node sends a single 'going-down'
-                # message:
-                if watchee not in self.watchees:
-                    return
-                self.watchees.remove(watchee)
-                self._unwatch(watchee, silent=True)
-
-            receive = self.actor.receive
-            try:
-                self._ongoing = receive(message)
-                # dbg("PROCESS-ONE: receive returned...", self._ongoing, self)
-                # dbg("PROCESS-ONE: still processing?", self.processing_messages, self)
-                yield self._ongoing
-                # dbg("PROCESS-ONE: ...receive terminated", self)
-                del self._ongoing
-            except Unhandled:
-                self._unhandled(message)
-            except Exception:
-                raise
+            if ret:
+                # dbg("PROCESS-ONE: receive returned a Deferred", ret, self)
+                self._ongoing = ret
+            return ret
+
+    _process_dispatch = {
+        '_start': lambda self, _: self._do_start(),
+        '_error': lambda self, (_, sender, exc, tb): self._do_supervise(sender, exc, tb),
+        '_stop': lambda self, _: self._do_stop(),
+        '_restart': lambda self, _: self._do_restart(),
+        '_resume': lambda self, _: self._do_resume(),
+        '_suspend': lambda self, _: self._do_suspend(),
+        '_child_terminated': lambda self, (_, child): self._do_child_terminated(child),
+    }
 
     def _unhandled(self, message):
-        if ('terminated', ANY) == message:
+        if _tag_of(message) == 'terminated':
             raise UnhandledTermination(watcher=self.ref, watchee=message[1])
         else:
             Events.log(UnhandledMessage(self.ref, message))
@@ -989,16 +1358,15 @@ class Cell(_BaseCell):
         else:
             self.actor = actor
 
-        actor._parent = self.parent
         actor._set_cell(self)
 
         if hasattr(actor, 'pre_start'):
             pre_start = actor.pre_start
-            args, kwargs = actor._Actor__startargs
+            args, kwargs = getattr(actor, '_Actor__startargs', _NO_STARTARGS)
             try:
                 self._ongoing = pre_start(*args, **kwargs)
                 yield self._ongoing
-                del self._ongoing
+                self._ongoing = None
             except Exception:
                 # dbg(u"☹")
                 raise CreateFailed("Actor failed to start", actor)
@@ -1087,7 +1455,7 @@ class Cell(_BaseCell):
     def _do_stop(self):
         # dbg()
         if self._ongoing:
-            del self._ongoing
+            self._ongoing = None
         # del self.watchers
         self._shutdown().addCallback(self._finish_stop).addErrback(panic)
 
@@ -1098,24 +1466,32 @@ class Cell(_BaseCell):
             ref = self.ref
 
             # TODO: test that system messages are not deadlettered
-            for message in self.inbox:
-                if ('_error', ANY, ANY, ANY) == message:
+            for message in self.inbox or ():
+                tag = _tag_of(message)
+                if tag == '_error':
                     _, sender, exc, tb = message
                     Events.log(ErrorIgnored(sender, exc, tb))
-                elif ('_watched', ANY) == message:
+                elif tag == '_watched':
                     _, watcher = message
                     watcher.send(('terminated', ref))
-                elif (IN(['terminated', '_unwatched']), ANY) != message:
+                elif tag != 'terminated' and tag != '_unwatched':
+                    Events.log(DeadLetter(ref, message))
+            if self._blocked:
+                blocked, self._blocked = self._blocked, None
+                for message, d in blocked:
                     Events.log(DeadLetter(ref, message))
+                    d.callback(None)
 
             assert not self.actor
-            del self.inbox
-            # dbg("self.priority_inbox:", self.priority_inbox)
-            del self.priority_inbox  # don't want no more, just release the memory
+            # don't want no more, just release the memory
+            self.inbox = self.priority_inbox = None
 
             # dbg("unlinking reference")
-            del ref._cell
+            ref._cell = None
             self.stopped = True
+            cells = self.root._cells
+            if cells.get(self.uri.path) is self:
+                del cells[self.uri.path]
 
             # XXX: which order should the following two operations be done?
 
@@ -1143,7 +1519,7 @@ class Cell(_BaseCell):
     @logstring("child-term:")
     def _do_child_terminated(self, child):
         # probably a child that we already stopped as part of a restart
-        if child.uri.name not in self._children:
+        if not self._children or child.uri.name not in self._children:
             # dbg("ignored child termination")
             # Events.log(TerminationIgnored(self, child))
             return
@@ -1287,21 +1663,18 @@ class Cell(_BaseCell):
                 if self.stopped:
                     break
 
-    @property
-    def ref(self):
-        if self.stopped:
-            return Ref(cell=None, uri=self.uri)
-
-        if not self._ref or not self._ref():
-            ref = Ref(self, self.uri)  # must store in a temporary variable to avoid immediate collection
-            self._ref = weakref.ref(ref)
-        return self._ref()
-
     def __repr__(self):
         return "<cell:%s@%s>" % (type(self.actor).__name__ if self.actor else (self.factory.__name__ if isinstance(self.factory, type) else self.factory.cls.__name__),
                                  self.uri.path,)
 
 
+def _pending(d):
+    """Returns `d` if it's a `Deferred` that has not yet completed successfully, otherwise `None`."""
+    if isinstance(d, Deferred) and not (d.called and not d.paused and not isinstance(d.result, Failure)):
+        return d
+    return None
+
+
 class Future(Deferred):
     def send(self, message):
         (self.callback if not isinstance(message, BaseException) else self.errback)(message)
@@ -0,0 +1,318 @@
+"""Dispatchers that run the `receive` method of actors off the reactor thread.
+
+By default, actors process their messages on the reactor thread. An actor that blocks or does heavy computation in
+`receive` can instead be assigned a dispatcher by name, either by setting `dispatcher` on its `Actor` subclass, or per
+spawn with `Props.with_dispatcher`:
+
+* `'reactor'`: the default; `receive` is called on the reactor thread;
+
+* `'threadpool'`: `receive` is called in a thread of a thread pool; suitable for blocking I/O;
+
+* `'processpool'`: `receive` is called in a worker process of a process pool; suitable for CPU bound work as it uses
+  multiple cores. The state of the actor (its `__dict__`) is pickled to the worker together with every message and
+  back again, so the actor class must be importable and its state picklable; `Ref`s in the state and in the message
+  are transferred as references to the original actors. If a worker process dies while processing a message, the
+  actor fails with `WorkerDied` (detected within `ProcessPoolDispatcher.CHECK_INTERVAL` seconds).
+
+The actor still processes only one message at a time and in the order they were received; sends done by `receive` are
+carried out on the reactor thread before the next message is processed. Apart from sending, a dispatched `receive`
+should not use the actor API (e.g. `spawn`, `watch`)--do that in `pre_start`, which always runs on the reactor thread.
+`receive` must also return synchronously, i.e. it can't be a coroutine.
+
+Additional dispatchers can be made available with `register`.
+
+"""
+from __future__ import print_function
+
+import errno
+import multiprocessing
+import os
+import traceback
+from cPickle import Pickler, Unpickler
+from cStringIO import StringIO
+from itertools import count
+from multiprocessing.queues import SimpleQueue
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from spinoff.actor.exceptions import Unhandled, WorkerDied
+from spinoff.util.logging import err
+
+
+_dispatchers = {}
+
+
+def register(name, dispatcher):
+    """Makes `dispatcher` available to actors by `name`; `dispatcher` is an instance of a `Dispatcher` subclass."""
+    if not isinstance(dispatcher, Dispatcher):
+        raise TypeError("Dispatchers should be instances of spinoff.actor.dispatch.Dispatcher")
+    _dispatchers[name] = dispatcher
+
+
+def get(name):
+    """Returns the dispatcher registered under `name`, or `None` for the reactor."""
+    if name not in _dispatchers:
+        raise TypeError("Unknown dispatcher %r; should be one of %s" % (name, ', '.join(sorted(_dispatchers))))
+    return _dispatchers[name]
+
+
+class Dispatcher(object):
+    """Base class for dispatchers; subclasses implement `dispatch`, and `start`/`stop` if they have resources."""
+    started = False
+
+    def dispatch(self, actor, message):
+        """Calls `actor.receive(message)` and returns a `Deferred` that fires with its result."""
+        raise NotImplementedError
+
+    def ensure_started(self):
+        if not self.started:
+            self.started = True
+            self.start()
+            reactor.addSystemEventTrigger('before', 'shutdown', self._shutdown)
+
+    def _shutdown(self):
+        self.started = False
+        self.stop()
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def __repr__(self):
+        return '<dispatcher:%s>' % (type(self).__name__,)
+
+
+class ThreadPoolDispatcher(Dispatcher):
+    """Calls `receive` in the threads of a thread pool of at most `size` threads."""
+
+    def __init__(self, size=10):
+        self.size = size
+
+    def start(self):
+        self.pool = ThreadPool(maxthreads=self.size, name='spinoff-dispatch')
+        self.pool.start()
+
+    def stop(self):
+        self.pool.stop()
+
+    def dispatch(self, actor, message):
+        self.ensure_started()
+        return deferToThreadPool(reactor, self.pool, _receive_in_thread, actor, message)
+
+
+class ProcessPoolDispatcher(Dispatcher):
+    """Calls `receive` in the worker processes of a pool of `size` processes (by default, one per CPU).
+
+    The pool replaces worker processes that die but drops the message they were processing without notice, so workers
+    report the messages they start processing, and those of workers that have died are failed every `CHECK_INTERVAL`.
+
+    """
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, size=None):
+        self.size = size
+
+    def start(self):
+        self.started_tasks = SimpleQueue()  # written to synchronously so that no report is lost as a worker dies
+        self.pool = multiprocessing.Pool(self.size, initializer=_init_worker, initargs=(self.started_tasks,))
+        self.task_ids = count()
+        self.pending = {}  # task ID => (`AsyncResult`, `Deferred`)
+        self.running = {}  # task ID => PID of the worker process processing it
+        self._check_call = None
+
+    def stop(self):
+        if self._check_call:
+            self._check_call.cancel()
+            self._check_call = None
+        self.pool.terminate()
+
+    def dispatch(self, actor, message):
+        self.ensure_started()
+        from spinoff.actor import Ref
+        node = actor.node
+        refs = []
+        payload = _dumps((type(actor), _state_of(actor), actor.ref, message), persistent_id=_persistent_id(Ref, refs))
+
+        d = Deferred()
+        task_id = next(self.task_ids)
+
+        def done(result):
+            if self.pending.pop(task_id, None) is None:  # already failed by `_check`
+                return
+            self.running.pop(task_id, None)
+            try:
+                outcome, state, sends = _loads(result, persistent_load=_persistent_load(node, refs))
+                for ref, message, force_async in sends:
+                    ref.send(message, force_async=force_async)
+                if outcome is None:
+                    _set_state(actor, state)
+                    d.callback(None)
+                else:
+                    exc, tb = outcome
+                    if not isinstance(exc, Unhandled):
+                        err("Error in %r running in a worker process:\n%s" % (actor, tb))
+                    d.errback(exc)
+            except Exception:
+                d.errback()
+        self.pending[task_id] = (
+            self.pool.apply_async(_receive_in_worker, (task_id, payload),
+                                  callback=lambda result: reactor.callFromThread(done, result)),
+            d)
+        if not self._check_call:
+            self._check_call = reactor.callLater(self.CHECK_INTERVAL, self._check)
+        return d
+
+    def _check(self):
+        self._check_call = None
+        while not self.started_tasks.empty():
+            task_id, pid = self.started_tasks.get()
+            if task_id in self.pending:
+                self.running[task_id] = pid
+        for task_id, pid in self.running.items():
+            result, d = self.pending[task_id]
+            # the pool reaps dead workers right away, so they don't linger as zombies, which would still seem alive
+            if not result.ready() and not _is_alive(pid):
+                del self.pending[task_id], self.running[task_id]
+                d.errback(WorkerDied("Worker process %d died while processing a message" % (pid,)))
+        if self.pending:
+            self._check_call = reactor.callLater(self.CHECK_INTERVAL, self._check)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno != errno.ESRCH
+    return True
+
+
+def _receive(actor, message):
+    ret = actor.receive(message)
+    if isinstance(ret, Deferred):
+        raise TypeError("Actors running on a pool dispatcher must not return Deferreds from receive")
+    return ret
+
+
+def _receive_in_thread(actor, message):
+    from spinoff.actor import _actor
+    _actor._offloaded.send = _send_from_thread  # only ever set in the threads of the pool
+    return _receive(actor, message)
+
+
+def _send_from_thread(ref, message, force_async):
+    reactor.callFromThread(ref.send, message, force_async)
+    return True
+
+
+def _state_of(actor):
+    # the attributes used by the framework itself are slots, so they stay in the actor on the reactor side
+    return dict(actor.__dict__)
+
+
+def _set_state(actor, state):
+    actor.__dict__.clear()
+    actor.__dict__.update(state)
+
+
+def _dumps(obj, persistent_id):
+    f = StringIO()
+    p = Pickler(f, protocol=2)
+    p.persistent_id = persistent_id
+    p.dump(obj)
+    return f.getvalue()
+
+
+def _loads(data, persistent_load):
+    u = Unpickler(StringIO(data))
+    u.persistent_load = persistent_load
+    return u.load()
+
+
+# `Ref`s sent to a worker process are transferred as indices into a list of the refs of the dispatch, so that the very
+# same `Ref` objects are used when they come back; refs constructed in the worker are transferred by their URI.
+
+def _persistent_id(Ref, refs):
+    def persistent_id(obj):
+        if isinstance(obj, Ref):
+            refs.append(obj)
+            return '%d:%s' % (len(refs) - 1, obj.uri)
+        return None
+    return persistent_id
+
+
+def _persistent_load(node, refs):
+    from spinoff.actor import Ref, Uri
+    from spinoff.actor.exceptions import LookupFailed
+
+    def persistent_load(pid):
+        index, _, uri = pid.partition(':')
+        if index:
+            return refs[int(index)]
+        try:
+            return node.lookup(uri)
+        except LookupFailed:
+            return Ref(cell=None, uri=Uri.parse(uri))
+    return persistent_load
+
+
+_started_tasks = None  # `SimpleQueue` the worker process reports the messages it starts processing to
+
+
+def _init_worker(started_tasks):
+    global _started_tasks
+    _started_tasks = started_tasks
+
+
+class _WorkerCell(object):
+    def __init__(self, ref):
+        self.ref = ref
+
+
+def _receive_in_worker(task_id, payload):
+    _started_tasks.put((task_id, os.getpid()))
+    from spinoff.actor import _actor
+    Ref, Uri = _actor.Ref, _actor.Uri
+    indices = {}  # id(ref) => (index, ref)
+    sends = []
+
+    def persistent_load(pid):
+        index, _, uri = pid.partition(':')
+        ref = Ref(cell=None, uri=Uri.parse(uri))
+        indices[id(ref)] = int(index), ref
+        return ref
+
+    def persistent_id(obj):
+        if isinstance(obj, Ref):
+            return str(indices[id(obj)][0]) if id(obj) in indices else ':' + str(obj.uri)
+
+    def send(ref, message, force_async):
+        sends.append((ref, message, force_async))
+        return True
+
+    try:
+        cls, state, ref, message = _loads(payload, persistent_load)
+        actor = cls.__new__(cls)
+        actor.__dict__.update(state)
+        actor._set_cell(_WorkerCell(ref))
+        _actor._offloaded.send = send
+        try:
+            _receive(actor, message)
+        finally:
+            _actor._offloaded.send = None
+        return _dumps((None, _state_of(actor), sends), persistent_id)
+    except Exception as exc:
+        tb = traceback.format_exc()
+        try:
+            return _dumps(((exc, tb), None, []), persistent_id)
+        except Exception:  # the exception itself can't be pickled
+            return _dumps(((RuntimeError(repr(exc)), tb), None, []), persistent_id)
+
+
+_dispatchers['reactor'] = None
+register('threadpool', ThreadPoolDispatcher())
+register('processpool', ProcessPoolDispatcher())
@@ -40,6 +40,12 @@ class DeadLetter(Event, fields('actor', 'message')):
         return (super(DeadLetter, self).repr_args() + (', %r' % (self.message, )))
 
 
+class MessageDropped(Event, fields('actor', 'message')):
+    """Logged when a message is discarded because the mailbox it was sent to was full."""
+    def repr_args(self):
+        return (super(MessageDropped, self).repr_args() + (', %r' % (self.message, )))
+
+
 class RemoteDeadLetter(Event, fields('actor', 'message', 'sender_addr')):
     def repr_args(self):
         return (super(RemoteDeadLetter, self).repr_args() + (', %r, from=%s' % (self.message, self.sender_addr)))
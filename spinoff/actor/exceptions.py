@@ -10,6 +10,10 @@ class Unhandled(Exception):
     pass
 
 
+class WorkerDied(RuntimeError):
+    pass
+
+
 class UnhandledTermination(Exception):
     def __init__(self, watcher, watchee):
         self.watcher = watcher
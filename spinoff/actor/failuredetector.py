@@ -0,0 +1,67 @@
+"""The phi-accrual failure detector used by `spinoff.actor.remoting.Hub` to tell when a remote node has gone down.
+
+Instead of a fixed timeout, the detector keeps a history of the intervals at which a node has been heard from, and
+expresses the time since it was last heard from as a suspicion level, phi, which grows continuously with the silence
+relative to what has been normal for the node: phi = 1 means the node being down has a 10% chance of being a mistake,
+phi = 2 a 1% chance, phi = 3 a 0.1% chance, and so on. Nodes with a regular heartbeat are thus detected to be down
+quickly, while nodes with a jittery one (e.g. due to load spikes or GC pauses) are given proportionately more time.
+
+See "The phi accrual failure detector" by Hayashibara et al. (2004).
+
+"""
+from __future__ import division
+
+import math
+from collections import deque
+
+
+class PhiAccrualFailureDetector(object):
+    """Tracks the arrivals of heartbeats (or any other traffic) from a single node.
+
+    `acceptable_pause` is added to the mean interval to allow for the pauses that are normal regardless of the history,
+    and `min_std_deviation` keeps the intervals of a perfectly regular history from making the slightest delay fatal.
+    The mean interval is taken to be at least `min_interval`, as arrivals in quick succession (e.g. bursts of messages)
+    say nothing about how soon the next arrival is due once they stop.
+
+    """
+
+    def __init__(self, max_samples, min_std_deviation, acceptable_pause, min_interval=0.0):
+        self.intervals = deque(maxlen=max_samples)
+        self.min_std_deviation = min_std_deviation
+        self.acceptable_pause = acceptable_pause
+        self.min_interval = min_interval
+        self.last = None
+        self._sum = self._sum_of_squares = 0.0
+
+    def heartbeat(self, t):
+        """Records a heartbeat arriving at `t`."""
+        if self.last is not None:
+            interval = t - self.last
+            intervals = self.intervals
+            if len(intervals) == intervals.maxlen:
+                oldest = intervals[0]
+                self._sum -= oldest
+                self._sum_of_squares -= oldest * oldest
+            intervals.append(interval)
+            self._sum += interval
+            self._sum_of_squares += interval * interval
+        self.last = t
+
+    def phi(self, t):
+        """Returns the suspicion level at `t`, or `None` if there is not enough history yet."""
+        n = len(self.intervals)
+        if not n:
+            return None
+        mean = self._sum / n
+        std_deviation = max(math.sqrt(max(self._sum_of_squares / n - mean * mean, 0.0)), self.min_std_deviation)
+        return _phi(t - self.last, max(mean, self.min_interval) + self.acceptable_pause, std_deviation)
+
+
+def _phi(elapsed, mean, std_deviation):
+    # -log10 of the probability of a normally distributed interval being longer than `elapsed`, with the logistic
+    # approximation of the normal CDF that is accurate to within 0.0002; as used by Akka and Cassandra
+    y = (elapsed - mean) / std_deviation
+    e = math.exp(max(min(-y * (1.5976 + 0.070566 * y * y), 700.0), -700.0))  # within the range of floats
+    if elapsed > mean:
+        return -math.log10(e / (1.0 + e))
+    return -math.log10(1.0 - 1.0 / (1.0 + e))
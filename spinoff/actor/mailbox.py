@@ -0,0 +1,41 @@
+"""Overflow policies for bounded mailboxes.
+
+By default mailboxes are unbounded. A mailbox can be bounded by setting `mailbox_size` (and optionally
+`mailbox_overflow`) on an `Actor` subclass, or per spawn with `Props.with_mailbox`. The remoting `Hub` applies the same
+policies to messages queued for nodes that have not been connected to yet (see `Hub.QUEUE_SIZE`).
+
+Only regular messages count against the limit--system messages are never dropped or held back.
+
+"""
+
+
+class Overflow(object):
+    """Base class for the policies that decide what happens to a message that arrives at a full mailbox."""
+
+    def __repr__(self):
+        return type(self).__name__
+
+
+class DropNewest(Overflow):
+    """Discards the message that did not fit and emits a `MessageDropped` event; this is the default policy."""
+DropNewest = DropNewest()
+
+
+class DropOldest(Overflow):
+    """Discards the oldest message in the mailbox to make room for the new one and emits a `MessageDropped` event."""
+DropOldest = DropOldest()
+
+
+class ToDeadLetters(Overflow):
+    """Discards the message that did not fit and emits a `DeadLetter` event for it."""
+ToDeadLetters = ToDeadLetters()
+
+
+class Backpressure(Overflow):
+    """Holds back the message that did not fit until there is room for it in the mailbox.
+
+    In this mode, `Ref.send` returns a `Deferred` that fires once the message has been accepted. Senders that wait for
+    it before sending more are guaranteed to never hold more than one message in the mailbox's waiting line.
+
+    """
+Backpressure = Backpressure()
@@ -6,6 +6,8 @@ import inspect
 import sys
 import traceback
 import warnings
+from collections import deque
+from itertools import count
 
 from twisted.internet.defer import Deferred, CancelledError
 from txcoroutine import coroutine
@@ -14,7 +16,7 @@ from spinoff.actor import Actor, ActorType
 from spinoff.actor.events import HighWaterMarkReached, Events
 from spinoff.actor.exceptions import InvalidEscalation
 from spinoff.util.async import call_when_idle
-from spinoff.util.pattern_matching import OR
+from spinoff.util.pattern_matching import compile, key_of, keys_of
 from spinoff.util.logging import logstring, flaw, panic
 
 
@@ -70,7 +72,7 @@ class Process(Actor):
         else:
             # dbg("queueing")
             if not self.__queue:
-                self.__queue = []
+                self.__queue = _Stash()
             self.__queue.append(msg)
             l = len(self.__queue)
             if l and l % self.hwm == 0:
@@ -79,19 +81,16 @@ class Process(Actor):
     @logstring("get")
     def get(self, *patterns):
         # dbg("get")
-        pattern = OR(*patterns)
+        matches = compile(*patterns)
         try:
             if self.__queue:
-                try:
-                    ix = self.__queue.index(pattern)
-                except ValueError:
-                    pass
-                else:
+                found, msg = self.__queue.pop_first(patterns, matches)
+                if found:
                     # dbg("next message from queue")
-                    return self.__queue.pop(ix)
+                    return msg
 
             # dbg("ready for message")
-            self.__get_d = _PickyDeferred(pattern, canceller=self.__clear_get_d)
+            self.__get_d = _PickyDeferred(matches, canceller=self.__clear_get_d)
             self.__get_d.addCallback(self.__clear_get_d)
             return self.__get_d
         except Exception:  # pragma: no cover
@@ -135,9 +134,9 @@ class Process(Actor):
 
     def flush(self):
         if self.__queue:  # XXX: added without testing
-            for message in self.__queue:
+            queue, self.__queue = self.__queue, None
+            for message in queue:
                 self._Actor__cell._unhandled(message)
-            del self.__queue[:]
 
     @logstring(u"escalate ↑")
     def escalate(self):
@@ -157,13 +156,84 @@ class Process(Actor):
         return Actor.__repr__(self).replace('<actor-impl:', '<proc-impl:')
 
 
+class _Stash(object):
+    """The messages a `Process` has received but not yet asked for with `Process.get`.
+
+    Messages are put into buckets by their key (see `pattern_matching.key_of`) so that looking for messages that match
+    a set of patterns only inspects the messages in the buckets of the keys the patterns could match (see
+    `pattern_matching.keys_of`).
+    Messages are numbered so that the first matching message in the order of arrival is found even across buckets.
+
+    """
+    def __init__(self):
+        self._buckets = {}  # key => deque of (seqno, message)
+        self._seqnos = count()
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        """Iterates over the messages in the order of arrival."""
+        entries = [entry for bucket in self._buckets.values() for entry in bucket]
+        entries.sort(key=lambda (seqno, _): seqno)
+        return (msg for _, msg in entries)
+
+    def append(self, msg):
+        key = key_of(msg)
+        try:
+            bucket = self._buckets[key]
+        except KeyError:
+            bucket = self._buckets[key] = deque()
+        bucket.append((next(self._seqnos), msg))
+        self._len += 1
+
+    def pop_first(self, patterns, matches):
+        """Removes and returns the first message that matches any of `patterns` as `(True, message)`, or returns
+        `(False, None)` if there is no such message. No patterns match any message. `matches` is the compiled form of
+        `patterns`.
+
+        """
+        keys = None
+        if patterns:
+            keys = set()
+            for pattern in patterns:
+                pattern_keys = keys_of(pattern)
+                if pattern_keys is None:
+                    keys = None
+                    break
+                keys |= pattern_keys
+        buckets = self._buckets
+        if keys is None:
+            candidates = buckets.items()
+        else:
+            candidates = [(key, buckets[key]) for key in keys if key in buckets]
+
+        found = None  # (seqno, key, index in bucket)
+        for key, bucket in candidates:
+            for ix, (seqno, msg) in enumerate(bucket):
+                if found and seqno > found[0]:
+                    break
+                if matches(msg):
+                    found = seqno, key, ix
+                    break
+        if not found:
+            return False, None
+
+        _, key, ix = found
+        bucket = buckets[key]
+        _, msg = bucket[ix]
+        del bucket[ix]
+        if not bucket:
+            del buckets[key]
+        self._len -= 1
+        return True, msg
+
+
 class _PickyDeferred(Deferred):
-    def __init__(self, pattern, *args, **kwargs):
+    def __init__(self, matches, *args, **kwargs):
         Deferred.__init__(self, *args, **kwargs)
-        self.pattern = pattern
-
-    def wants(self, result):
-        return result == self.pattern
+        self.wants = matches
 
     def callback(self, result):
         assert self.wants(result)
@@ -1,37 +1,87 @@
 # coding: utf8
 from __future__ import print_function, absolute_import
 
+import cPickle
 import inspect
+import os
 import random
 import re
 import struct
 import traceback
-from cStringIO import StringIO
+import zlib
 from collections import deque
+from itertools import chain
 from decimal import Decimal
-from pickle import Unpickler, BUILD
-from cPickle import dumps
 
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, Deferred
 from txzmq import ZmqEndpoint
 
 from spinoff.actor import _actor
 from spinoff.actor import Ref, Uri, Node
-from spinoff.actor._actor import _VALID_NODEID_RE, _validate_nodeid
-from spinoff.actor.events import Events, DeadLetter, RemoteDeadLetter
+from spinoff.actor._actor import _VALID_NODEID_RE, _validate_nodeid, _tag_of
+from spinoff.actor.failuredetector import PhiAccrualFailureDetector
+from spinoff.actor.events import Events, DeadLetter, RemoteDeadLetter, MessageDropped
+from spinoff.actor.mailbox import DropNewest, DropOldest, ToDeadLetters, Backpressure
+from spinoff.actor.serialization import Pickle, FastPickle, Compact, FALLBACKS, loads
 from spinoff.util.logging import logstring, dbg, log, panic
 from spinoff.util.pattern_matching import ANY, IN
 from spinoff.util.async import sleep
-from spinoff.actor.resolv import resolve
+from spinoff.util.timerwheel import TimerWheel
+from spinoff.actor.resolv import resolve, resolve_async
 
 
 # TODO: use shorter messages outside of testing
 # MUST be a single char
 PING = b'0'
 DISCONNECT = b'1'
-
+# several messages sent as one frame: `BATCH` followed by each message prefixed with its length as a `_BATCH_LEN`
+BATCH = b'2'
+_BATCH_LEN = struct.Struct('!I')
+# paths of recipients are interned per connection: the first messages to a path are sent as `INTERN`, the ID assigned to
+# the path, and the message; once the receiver has acknowledged the ID with `INTERN_ACK` and the ID, messages to the
+# path are sent as `INTERNED`, the ID, and the message with an empty path. IDs are packed as `_PATH_ID`. A receiver
+# that gets an ID it doesn't know (e.g. having closed the connection while the sender kept its end) drops the message
+# and replies with `INTERN_RESET`, upon which the sender forgets its IDs and interns its paths again.
+INTERN = b'3'
+INTERNED = b'4'
+INTERN_ACK = b'5'
+INTERN_RESET = b'9'
+_PATH_ID = struct.Struct('!I')
+# large binary members of messages are sent without copying as extra frames after the frame of the message itself,
+# which is `OUT_OF_BAND`, the number of such members as a `_OUT_OF_BAND_COUNT`, a `_OUT_OF_BAND_MEMBER` for each, and
+# the message with those members replaced by `None`; see `Hub.OUT_OF_BAND_MIN_SIZE`
+OUT_OF_BAND = b'6'
+_OUT_OF_BAND_COUNT = struct.Struct('!B')
+_OUT_OF_BAND_MEMBER = struct.Struct('!Hc')  # the index of the member in the message (or `_WHOLE`) and its kind
+_WHOLE = 0xffff
+_BYTES, _VIEW = b's', b'v'  # `str` members arrive as `str`, other buffers as `memoryview`s of the received frame
+_BUFFER_TYPES = {str: _BYTES, buffer: _VIEW, memoryview: _VIEW, bytearray: _VIEW}
+# a frame compressed with zlib: `COMPRESSED` followed by the compressed frame; see `Hub.COMPRESSION_MIN_SIZE`
+COMPRESSED = b'7'
+# a grant of credits for sending messages: `CREDIT` followed by the total number of messages received from the node
+# packed as `_CREDIT`; see `Hub.FLOW_CONTROL_WINDOW`
+CREDIT = b'8'
+_CREDIT = struct.Struct('!Q')
+
+# every connection has two lanes, each with its own socket and thus its own queue and TCP connection, which the
+# receiving socket reads from in turn: heartbeats, grants of credits and acknowledgements and resets of interned paths
+# are sent right away on the control lane, so that they are never queued behind messages, while messages are batched
+# and subject to flow control on the bulk lane. Messages handled by the framework (watching, termination, supervision;
+# see `_tag_of`) aren't held up by flow control, but they stay in order with the messages sent before them, as they
+# would locally: the backlog and the batch are sent before them. `DISCONNECT` is sent on the bulk lane after the
+# messages before it too.
+
+# heartbeats are `PING` and the version of the sender packed with `PING_VERSION_FORMAT`, and are followed by a frame
+# advertising the markers of the wire formats the sender can decode (see `spinoff.actor.serialization`), plus `BATCH`,
+# `INTERN`, `OUT_OF_BAND`, `COMPRESSED` and `CREDIT` if it can decode batches, interned paths, out-of-band members and
+# compressed frames, and grants credits, respectively. That frame is a pickle of a message `('_unwatched', <markers>)`
+# to `_FORMATS_PATH`, which nodes from before wire formats were advertised take for an unwatch request to an actor that
+# can't exist and drop silently, so they keep being sent nothing but pickles and heartbeats they can decode.
 PING_VERSION_FORMAT = '!I'
+_FORMATS_PATH = '/$formats'  # names starting with `$` are reserved
+# what all frames advertising formats start with, so that they are told apart without decoding them
+_FORMATS_FRAME_PREFIX = os.path.commonprefix([Pickle.dumps(_FORMATS_PATH, ('_unwatched', x)) for x in ['', 'x' * 256]])
 
 _VALID_ADDR_RE = re.compile('tcp://%s' % (_VALID_NODEID_RE.pattern,))
 _PROTO_ADDR_RE = re.compile('(tcp://)(%s)' % (_VALID_NODEID_RE.pattern,))
@@ -40,48 +90,276 @@ _PROTO_ADDR_RE = re.compile('(tcp://)(%s)' % (_VALID_NODEID_RE.pattern,))
 class Connection(object):
     watching_actors = None
     queue = None
-
-    def __init__(self, owner, addr, sock, our_addr, time, known_remote_version):
+    blocked = None  # messages held back by a full queue along with the `Deferred`s returned to their senders
+    serializer = Pickle  # the format messages are sent in; see `established`
+    batching = False  # whether the remote node can decode batches; see `set_remote_formats`
+    interning = False  # whether the remote node can decode interned paths; see `set_remote_formats`
+    out_of_band = False  # whether the remote node can decode out-of-band members; see `set_remote_formats`
+    compression = False  # whether the remote node can decode compressed frames; see `set_remote_formats`
+    flow_control = False  # whether the remote node takes grants of credits; see `set_remote_formats`
+    remote_formats = None  # the formats the remote node has advertised, if any
+    unadvertised_version = None  # the version in a ping from the remote node awaiting the formats advertised after it
+    idle = True  # whether nothing but heartbeats has been sent since the last check; see `Hub._check_connection`
+    resolved = False  # whether the socket has been connected to the resolved address of the remote node
+    _resolving = False
+
+    # flow control; see `Hub.FLOW_CONTROL_WINDOW`
+    credits = None  # the number of messages that can be sent before more credits are granted, or `None` for no limit
+    sent_count = 0  # the number of messages sent
+    received_count = 0  # the number of messages received from the remote node
+    granted_count = 0  # the `received_count` last granted credits for
+    _congested = ()  # the local actors with too many messages in their inboxes for granting credits
+    # the messages sent without waiting for the handshake along with their `sent_count`s, kept for replay until the
+    # remote node has granted credits for them; see `Hub.OPTIMISTIC_SEND`
+    unconfirmed = None
+    _grant_call = None
+    # metrics: the longest the backlog has been, the number of times messages had to wait for credits, and the number
+    # of times granting credits was put off because of congested local actors
+    max_backlog_length = stalls = withheld_grants = 0
+    _batch = None  # messages to be sent together at the end of the current reactor tick
+    _batch_size = 0
+    _batch_call = None
+
+    def __init__(self, owner, addr, sock, our_addr, time, known_remote_version, control_sock=None):
         self.owner = owner
         self.addr = addr
         self.sock = sock = sock
+        self.control_sock = control_sock or sock  # the socket of the control lane
         self.our_addr = our_addr
         # even if this is a fresh connection, there's no need to set seen to None--in fact it would be illogical, as by
         # connecting, we're making an assumption that it exists; and pragmatically speaking, the heartbeat algorithm
         # also wouldn't be able to deal with seen=None without adding an extra attribute.
         self.seen = time
+        self.failure_detector = PhiAccrualFailureDetector(
+            max_samples=owner.PHI_MAX_SAMPLES,
+            min_std_deviation=owner.PHI_MIN_STD_DEVIATION,
+            acceptable_pause=owner.PHI_ACCEPTABLE_PAUSE,
+            min_interval=owner.HEARTBEAT_INTERVAL)
 
         self.watched_actors = set()
         self.queue = deque()
+        self.backlog = deque()  # messages waiting for credits
+
+        self.path_ids = {}  # the IDs of the paths interned by us
+        self.unacked_path_ids = {}  # the IDs not yet acknowledged by the remote node, with their paths
+        self.remote_paths = {}  # the paths interned by the remote node, by ID
 
         self.known_remote_version = known_remote_version
 
-        sock.addEndpoints([ZmqEndpoint('connect', _resolve_addr(addr))])
+        # until resolved, messages are queued and heartbeats are not sent; the first heartbeat is sent once resolved
+        self._resolve()
 
     @property
     def is_active(self):
         return self.queue is None
 
+    def heard_from(self, t):
+        self.seen = t
+        self.failure_detector.heartbeat(t)
+
+    def phi(self, t):
+        """Returns the suspicion level of the remote node being down at `t`; see `spinoff.actor.failuredetector`."""
+        return self.failure_detector.phi(t)
+
     def send(self, ref, msg):
         if self.queue is not None:
+            size = self.owner.QUEUE_SIZE
+            if size is not None and len(self.queue) >= size and _tag_of(msg) is None:  # as in `Cell.receive`
+                return self._overflow(ref, msg)
             self.queue.append((ref, msg))
+        elif not self.sock:
+            Events.log(DeadLetter(ref, msg))
+        elif _tag_of(msg) is not None:
+            # not held up by flow control, but sent after the messages before it, as death watch relies on that order
+            self._flush_backlog()
+            self._count_sent(ref, msg)  # as the remote node counts it, but without waiting for credits
+            self._send_message(ref.uri.path, msg)
+            if self._batch:
+                self._flush_batch()
+        elif self.backlog or self.credits == 0:
+            size = self.owner.QUEUE_SIZE
+            if size is not None and len(self.backlog) >= size:
+                return self._overflow(ref, msg, queue=self.backlog)
+            if not self.backlog:
+                self.stalls += 1
+            self.backlog.append((ref, msg))
+            if len(self.backlog) > self.max_backlog_length:
+                self.max_backlog_length = len(self.backlog)
         else:
-            if self.sock:
-                self._do_send(dumps((ref.uri.path, msg), protocol=2))
-            else:
-                Events.log(DeadLetter(ref, msg))
+            self._count_sent(ref, msg)
+            self._send_message(ref.uri.path, msg)
+
+    def _count_sent(self, ref, msg):
+        # counted regardless of flow control, as the remote node might only advertise it after receiving messages
+        self.sent_count += 1
+        if self.credits is not None:
+            self.credits = max(self.credits - 1, 0)
+        if self.unconfirmed is not None:
+            self.unconfirmed.append((self.sent_count, ref, msg))
+
+    def _overflow(self, ref, msg, queue=None):
+        queue = self.queue if queue is None else queue
+        overflow = self.owner.QUEUE_OVERFLOW
+        if overflow is Backpressure:
+            if not self.blocked:
+                self.blocked = deque()
+            d = Deferred()
+            self.blocked.append((ref, msg, d))
+            return d
+        elif overflow is DropOldest:
+            Events.log(MessageDropped(*queue.popleft()))
+            queue.append((ref, msg))
+        elif overflow is ToDeadLetters:
+            Events.log(DeadLetter(ref, msg))
+        else:
+            Events.log(MessageDropped(ref, msg))
 
     def established(self, remote_version):
-        log()
         self.known_remote_version = remote_version
+        if not self.resolved:  # established once resolved; see `_resolved`
+            return
+        log()
         self._flush_queue()
         del self.queue
+        self._release_blocked()
+
+    def _release_blocked(self):
+        if self.blocked:
+            blocked, self.blocked = self.blocked, None
+            for ref, msg, d in blocked:
+                self.send(ref, msg)
+                d.callback(None)
+
+    def set_remote_formats(self, remote_formats):
+        """Picks the format to send messages in from the wire formats the remote node has advertised it can decode."""
+        self.remote_formats = remote_formats
+        for serializer in [self.owner.SERIALIZER] + FALLBACKS:
+            if serializer.marker in remote_formats:
+                self.serializer = serializer
+                break
+        self.batching = BATCH in remote_formats
+        self.interning = INTERN in remote_formats
+        if CREDIT in remote_formats and self.owner.FLOW_CONTROL_WINDOW is not None:
+            if self.credits is None:
+                # messages sent before the handshake are in flight already
+                self.credits = max(self.owner.FLOW_CONTROL_WINDOW - self.sent_count, 0)
+        else:
+            self.credits = None
+            self._drain_backlog()
+        if CREDIT not in remote_formats or not self.unconfirmed:
+            self.unconfirmed = None  # never to be confirmed, or nothing to confirm
+        self.out_of_band = OUT_OF_BAND in remote_formats
+        self.compression = COMPRESSED in remote_formats
+        self.flow_control = CREDIT in remote_formats
+        if self.flow_control and self.received_count != self.granted_count and not self._grant_call and self.sock:
+            # the messages received before the formats were advertised haven't been granted credits for
+            self._grant_call = self.owner.reactor.callLater(0, self._grant)
+
+    def remote_restarted(self):
+        # the paths we have interned are gone together with the old process of the remote node
+        self.path_ids.clear()
+        self.unacked_path_ids.clear()
+        self.remote_paths.clear()
+        # as are the messages in flight
+        self.received_count = self.granted_count = self.sent_count = 0
+        unconfirmed, self.unconfirmed = self.unconfirmed, None
+        if self.credits is not None:
+            self.credits = self.owner.FLOW_CONTROL_WINDOW
+            self._drain_backlog()
+        self._emit_termination_messages()
+        # except that the messages sent before the handshake were meant for the new process
+        for _, ref, msg in unconfirmed or ():
+            self.send(ref, msg)
+
+    def credited(self, received_count):
+        """Updates the credits from the number of messages the remote node has received and granted credits for."""
+        unconfirmed = self.unconfirmed
+        if unconfirmed is not None:
+            while unconfirmed and unconfirmed[0][0] <= received_count:
+                unconfirmed.popleft()
+            if not unconfirmed and self.known_remote_version is not None:
+                self.unconfirmed = None  # everything sent before the handshake has arrived; see `_bulk_sock`
+        if self.credits is not None:
+            self.credits = max(self.owner.FLOW_CONTROL_WINDOW - (self.sent_count - received_count), 0)
+            self._drain_backlog()
+
+    def _drain_backlog(self):
+        if not self.is_active:  # the queue is flushed through the backlog once established
+            return
+        backlog = self.backlog
+        while backlog and self.credits != 0 and self.sock:
+            ref, msg = backlog.popleft()
+            self._count_sent(ref, msg)
+            self._send_message(ref.uri.path, msg)
+        size = self.owner.QUEUE_SIZE if self.owner else None
+        if size is None or len(backlog) < size:
+            self._release_blocked()
+
+    def _flush_backlog(self):
+        """Sends the backlog and the messages held back by a full backlog regardless of credits."""
+        backlog = self.backlog
+        while backlog:
+            ref, msg = backlog.popleft()
+            self._count_sent(ref, msg)
+            self._send_message(ref.uri.path, msg)
+        if self.blocked:
+            blocked, self.blocked = self.blocked, None
+            for ref, msg, d in blocked:
+                self._count_sent(ref, msg)
+                self._send_message(ref.uri.path, msg)
+                d.callback(None)
+
+    def delivered(self, cell):
+        """Counts a message from the remote node delivered to `cell` (or nowhere) and grants credits for it in time."""
+        self.received_count += 1
+        owner = self.owner
+        if cell and cell.inbox and len(cell.inbox) > owner.FLOW_CONTROL_INBOX_LIMIT:
+            if not self._congested:
+                self._congested = set()
+            self._congested.add(cell)
+        if not self._grant_call:
+            self._grant_call = owner.reactor.callLater(0, self._grant)
+
+    def _grant(self):
+        self._grant_call = None
+        if not self.sock or not self.flow_control:
+            return
+        if self._congested:
+            limit = self.owner.FLOW_CONTROL_INBOX_LIMIT
+            self._congested = set(x for x in self._congested if x.inbox and len(x.inbox) > limit)
+            if self._congested:
+                self.withheld_grants += 1
+                self._grant_call = self.owner.reactor.callLater(self.owner.FLOW_CONTROL_RECHECK_INTERVAL, self._grant)
+                return
+        if self.received_count != self.granted_count:
+            self.granted_count = self.received_count
+            self._send_control(CREDIT + _CREDIT.pack(self.received_count))
+
+    def interned(self, path_id, path):
+        """Records `path_id` interned by the remote node and acknowledges it."""
+        self.remote_paths[path_id] = path
+        self._send_control(INTERN_ACK + _PATH_ID.pack(path_id))
+
+    def intern_acked(self, path_id):
+        self.unacked_path_ids.pop(path_id, None)
+
+    def intern_unknown(self, path_id):
+        """Tells the remote node that `path_id` is not interned (any more) so that it interns its paths again."""
+        if self.resolved and self.sock:
+            self._send_control(INTERN_RESET)
+
+    def intern_reset(self):
+        self.path_ids.clear()
+        self.unacked_path_ids.clear()
 
     @inlineCallbacks
     def close(self):
         log()
 
-        self.sock.sendMultipart((self.our_addr, DISCONNECT))
+        if self._batch:
+            self._flush_batch()
+        if self.resolved:
+            self._bulk_sock.sendMultipart((self.our_addr, DISCONNECT))
         if not _actor.TESTING:
             # have to avoid this during testing, and it's not needed anyway;
             # during testing, since everything is running in the same thread with no remoting (by default)
@@ -93,30 +371,155 @@ class Connection(object):
         self._kill_queue()
         self._emit_termination_messages()
         self.sock.shutdown()
-        self.sock = self.owner = None
+        if self.control_sock is not self.sock:
+            self.control_sock.shutdown()
+        self.sock = self.control_sock = self.owner = None
 
     @logstring(u" ❤⇝")
     def heartbeat(self):
-        self._do_send(PING + struct.pack(PING_VERSION_FORMAT, self.owner.version))
+        if not self.resolved:
+            return self._resolve()  # retries failed resolutions
+        self.control_sock.sendMultipart((self.our_addr, PING + struct.pack(PING_VERSION_FORMAT, self.owner.version)))
+        formats = Pickle.dumps(_FORMATS_PATH, ('_unwatched', self.owner.formats))
+        self.control_sock.sendMultipart((self.our_addr, formats))
         self.owner.version += 1
 
+    def _resolve(self):
+        if not self._resolving:
+            self._resolving = True
+            _resolve_addr_async(self.addr, self.owner.reactor).addCallbacks(self._resolved, self._resolution_failed)
+
+    def _resolved(self, resolved_addr):
+        self._resolving = False
+        if not self.sock:  # closed in the meantime
+            return
+        endpoint = self.owner._ipc_endpoint(self.addr, resolved_addr) or resolved_addr
+        self.sock.addEndpoints([ZmqEndpoint('connect', endpoint)])
+        if self.control_sock is not self.sock:
+            self.control_sock.addEndpoints([ZmqEndpoint('connect', endpoint)])
+        self.resolved = True
+        self.heartbeat()
+        if self.known_remote_version is not None and not self.is_active:
+            self.established(self.known_remote_version)
+        elif self.owner.OPTIMISTIC_SEND and not self.is_active:
+            self.unconfirmed = deque()
+            self.established(None)
+
+    def _resolution_failed(self, f):
+        self._resolving = False
+        log("failed to resolve %s: %s" % (self.addr, f.getErrorMessage()))
+
+    @property
+    def _bulk_sock(self):
+        # nodes drop messages from nodes they haven't had a ping from, so the messages sent without waiting for the
+        # handshake go on the control lane right after the ping, and so do the messages that follow them until they
+        # have arrived, as the bulk lane could overtake them
+        return self.sock if self.unconfirmed is None else self.control_sock
+
     @logstring(u"⇝")
     def _do_send(self, msg):
-        self.sock.sendMultipart((self.our_addr, msg))
+        self.idle = False
+        self._bulk_sock.sendMultipart((self.our_addr, msg))
+
+    @logstring(u"⇝!")
+    def _send_control(self, data):
+        self.idle = False
+        self.control_sock.sendMultipart((self.our_addr, self._compressed(data)))
+
+    def _send_message(self, path, msg):
+        min_size = self.owner.OUT_OF_BAND_MIN_SIZE
+        members = _out_of_band_members(msg, min_size) if self.out_of_band and min_size is not None else None
+        if not members:
+            return self._send_batched(self._dumps(path, msg))
+        if members[0][0] == _WHOLE:
+            frames, msg = (msg,), None
+        else:
+            frames = tuple(msg[ix] for ix, _ in members)
+            msg = list(msg)
+            for ix, _ in members:
+                msg[ix] = None
+            msg = tuple(msg)
+        header = [OUT_OF_BAND, _OUT_OF_BAND_COUNT.pack(len(members))]
+        header += [_OUT_OF_BAND_MEMBER.pack(ix, kind) for ix, kind in members]
+        header.append(self._dumps(path, msg))
+        if self._batch:  # to keep the order of messages
+            self._flush_batch()
+        self.idle = False
+        self._bulk_sock.sendMultipart((self.our_addr, self._compressed(b''.join(header))) + frames)
+
+    def _dumps(self, path, msg):
+        if not self.interning:
+            return self.serializer.dumps(path, msg)
+        path_id = self.path_ids.get(path)
+        if path_id is None:
+            if len(self.path_ids) >= self.owner.MAX_INTERNED_PATHS:
+                return self.serializer.dumps(path, msg)
+            path_id = self.path_ids[path] = len(self.path_ids)
+            self.unacked_path_ids[path_id] = path
+        if path_id in self.unacked_path_ids:
+            # until acknowledged, the message itself interns the path, so that interning survives lost messages
+            return INTERN + _PATH_ID.pack(path_id) + self.serializer.dumps(path, msg)
+        return INTERNED + _PATH_ID.pack(path_id) + self.serializer.dumps('', msg)
+
+    def _compressed(self, data):
+        if not self.compression:
+            return data
+        owner = self.owner
+        min_size = (owner.compression_by_node.get(self.addr[len('tcp://'):], owner.COMPRESSION_MIN_SIZE)
+                    if owner.compression_by_node else owner.COMPRESSION_MIN_SIZE)
+        if min_size is None or len(data) < min_size:
+            return data
+        compressed = zlib.compress(data, owner.COMPRESSION_LEVEL)
+        return COMPRESSED + compressed if len(compressed) + 1 < len(data) else data
+
+    def _send_batched(self, data):
+        if not self.batching:
+            return self._do_send(self._compressed(data))
+        owner = self.owner
+        if self._batch is None:
+            self._batch = []
+            self._batch_call = owner.reactor.callLater(owner.BATCH_DELAY, self._flush_batch)
+        self._batch.append(data)
+        self._batch_size += len(data)
+        if len(self._batch) >= owner.BATCH_MAX_COUNT or self._batch_size >= owner.BATCH_MAX_BYTES:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        batch, self._batch, self._batch_size = self._batch, None, 0
+        if self._batch_call.active():
+            self._batch_call.cancel()
+        self._batch_call = None
+        if len(batch) == 1:
+            self._do_send(self._compressed(batch[0]))
+        else:
+            frame = [BATCH]
+            for data in batch:
+                frame += (_BATCH_LEN.pack(len(data)), data)
+            self._do_send(self._compressed(b''.join(frame)))
 
     def _flush_queue(self):
         q, self.queue = self.queue, None
         while q:
             ref, msg = q.popleft()
             assert ref.uri.root.url == self.addr
-            self._do_send(dumps((ref.uri.path, msg), protocol=2))
+            self.send(ref, msg)
 
     def _kill_queue(self):
         q, self.queue = self.queue, None
-        while q:
-            ref, msg = q.popleft()
+        for ref, msg in chain(q or (), self.backlog):
             if (IN(['_watched', '_unwatched', 'terminated']), ANY) != msg:
                 Events.log(DeadLetter(ref, msg))
+        self.backlog.clear()
+        if self._grant_call and self._grant_call.active():
+            self._grant_call.cancel()
+        self._grant_call = None
+        self._congested = ()
+        self.unconfirmed = None
+        if self.blocked:
+            blocked, self.blocked = self.blocked, None
+            for ref, msg, d in blocked:
+                Events.log(DeadLetter(ref, msg))
+                d.callback(None)
 
     def watch(self, report_to):
         if not self.watching_actors:
@@ -136,7 +539,9 @@ class Connection(object):
     def __del__(self):
         if hasattr(self, 'sock') and self.sock:
             self.sock.shutdown()
-            del self.sock
+            if self.control_sock is not self.sock:
+                self.control_sock.shutdown()
+            del self.sock, self.control_sock
 
     def __repr__(self):
         return (('<connection:%s->%s>' % (self.owner.nodeid, self.addr[len('tcp://'):]))
@@ -147,20 +552,100 @@ class Connection(object):
 class Hub(object):
     """Handles traffic between actors on different nodes.
 
-    The wire-transport implementation is specified/overridden by the `incoming` and `outgoing` parameters.
+    The wire-transport implementation is specified/overridden by the `incoming` and `outgoing` parameters. `seeds` are
+    the IDs of the nodes to connect to right away.
+
+    With an `ipc_dir`, the node also listens on a Unix socket in that directory, and other nodes on the same host with
+    the same `ipc_dir` connect to it there instead of over TCP; see `_ipc_endpoint`.
 
     """
     __doc_HEARTBEAT_INTERVAL__ = (
-        "Time on seconds after which to send out a heartbeat signal to all known nodes. Regular messages can be "
-        "subsituted by the framework for heartbeats to save network bandwidth.")
+        "Time on seconds after which to send out a heartbeat signal to all known nodes. Regular messages substitute "
+        "for heartbeats, so heartbeats are only sent to nodes nothing else has been sent to during the interval.")
     HEARTBEAT_INTERVAL = 1.0
     ALLOWED_HEARTBEAT_DELAY = HEARTBEAT_INTERVAL * 0.2
 
+    __doc_HEARTBEAT_RESOLUTION__ = (
+        "Time in seconds between checks of the connections that have come due for a heartbeat or a check for silence; "
+        "connections are spread over the checks by the time they were made, so the checks take about the same time "
+        "regardless of the number of connections.")
+    HEARTBEAT_RESOLUTION = HEARTBEAT_INTERVAL / 10.0
+
     HEARTBEAT_MAX_SILENCE = 15.0
 
+    __doc_PHI_THRESHOLD__ = (
+        "Suspicion level of the phi-accrual failure detector above which a node is considered down, or `None` to only "
+        "consider nodes down after `HEARTBEAT_MAX_SILENCE`, which also applies to nodes not heard from often enough "
+        "to have a history. The detector allows for pauses of `PHI_ACCEPTABLE_PAUSE` beyond the mean interval, which "
+        "is taken to be at least `HEARTBEAT_INTERVAL` as nodes that are sent regular messages only send heartbeats "
+        "when idle; see `spinoff.actor.failuredetector`.")
+    PHI_THRESHOLD = 8.0
+    PHI_ACCEPTABLE_PAUSE = HEARTBEAT_INTERVAL * 3
+    PHI_MIN_STD_DEVIATION = HEARTBEAT_INTERVAL / 10.0
+    PHI_MAX_SAMPLES = 100
+
+    __doc_QUEUE_SIZE__ = (
+        "Maximum number of messages queued for a node whose connection has not been established yet, or `None` for no "
+        "limit. What happens to messages beyond that is decided by `QUEUE_OVERFLOW`; see `spinoff.actor.mailbox`.")
+    QUEUE_SIZE = None
+    QUEUE_OVERFLOW = DropNewest
+
+    __doc_SERIALIZER__ = (
+        "The wire format to send messages in to nodes that can decode it; other nodes are sent the best format they can "
+        "decode. See `spinoff.actor.serialization`.")
+    SERIALIZER = FastPickle
+
+    __doc_BATCH_DELAY__ = (
+        "Time in seconds messages to a node are held back to be sent together with the messages that follow them as a "
+        "single frame; 0 sends them at the end of the current reactor tick. A batch is sent right away once it reaches "
+        "`BATCH_MAX_COUNT` messages or `BATCH_MAX_BYTES` bytes; `BATCH_MAX_COUNT = 1` disables batching.")
+    BATCH_DELAY = 0.0
+    BATCH_MAX_COUNT = 1000
+    BATCH_MAX_BYTES = 64 * 1024
+
+    __doc_MAX_INTERNED_PATHS__ = (
+        "Maximum number of recipient paths interned per connection; messages to the paths used after that carry the "
+        "full path. 0 disables interning.")
+    MAX_INTERNED_PATHS = 1000
+
+    __doc_OUT_OF_BAND_MIN_SIZE__ = (
+        "Minimum size in bytes of `str`, `buffer`, `bytearray` and `memoryview` messages and members of tuple messages "
+        "to send as separate frames without copying them into the serialized message, or `None` to send everything "
+        "in band. `str`s arrive as `str`s; the other types arrive as `memoryview`s of the received frame, which allows "
+        "receivers to access the data without copying it.")
+    OUT_OF_BAND_MIN_SIZE = 64 * 1024
+
+    __doc_COMPRESSION_MIN_SIZE__ = (
+        "Minimum size in bytes of frames (single messages or batches) to compress with zlib at `COMPRESSION_LEVEL` "
+        "before sending them, or `None` not to compress at all. Frames are only sent compressed if that makes them "
+        "smaller. Can be overridden for specific nodes in `compression_by_node`, e.g. to only compress on slow links.")
+    COMPRESSION_MIN_SIZE = None
+    COMPRESSION_LEVEL = 6
+
+    __doc_FLOW_CONTROL_WINDOW__ = (
+        "Maximum number of messages in flight to a node, i.e. that the node has not yet granted credits for, or `None` "
+        "for no flow control. Nodes grant credits for the messages they have delivered, except while any of the "
+        "local actors they have delivered messages to has more than `FLOW_CONTROL_INBOX_LIMIT` messages in its inbox; "
+        "this is checked again every `FLOW_CONTROL_RECHECK_INTERVAL` seconds. Messages beyond the window wait in the "
+        "backlog of the connection, which is bounded by `QUEUE_SIZE` as decided by `QUEUE_OVERFLOW`, e.g. with "
+        "`Backpressure` on senders. See `flow_control_metrics`.")
+    FLOW_CONTROL_WINDOW = 1000
+    FLOW_CONTROL_INBOX_LIMIT = 1000
+    FLOW_CONTROL_RECHECK_INTERVAL = 0.05
+
+    __doc_OPTIMISTIC_SEND__ = (
+        "Whether to start sending messages to a node as soon as connected to it instead of after the handshake, i.e. "
+        "the first heartbeat from the node, which saves a round trip on the first messages to every node. The "
+        "messages sent before the handshake are kept until the node has granted credits for them, and sent again if "
+        "the node turns out to have restarted in the meantime. See also the `seeds` of the `Hub`.")
+    OPTIMISTIC_SEND = False
+
+    # the markers of the wire formats this node can decode; advertised to other nodes after heartbeats
+    formats = Pickle.marker + FastPickle.marker + Compact.marker + BATCH + INTERN + OUT_OF_BAND + COMPRESSED + CREDIT
+
     nodeid = None
 
-    def __init__(self, insock, outsock_factory, nodeid, reactor=reactor):
+    def __init__(self, insock, outsock_factory, nodeid, reactor=reactor, seeds=(), ipc_dir=None):
         if not nodeid or not isinstance(nodeid, str):  # pragma: no cover
             raise TypeError("The 'nodeid' argument to Hub must be a str")
         _validate_nodeid(nodeid)
@@ -176,16 +661,35 @@ class Hub(object):
 
         self.insock = insock
         insock.gotMultipart = self._got_message
-        insock.addEndpoints([ZmqEndpoint('bind', _resolve_addr(self.addr))])
+        bind_addr = _resolve_addr(self.addr)
+        endpoints = [ZmqEndpoint('bind', bind_addr)]
+        self.ipc_dir = ipc_dir
+        if ipc_dir:
+            endpoints.append(ZmqEndpoint('bind', 'ipc://' + _ipc_path(ipc_dir, nodeid)))
+        insock.addEndpoints(endpoints)
+        self._local_host = bind_addr[len('tcp://'):].rsplit(':', 1)[0]
 
         self.outsock_factory = outsock_factory
         self.connections = {}
 
-        self._next_heartbeat = reactor.callLater(self.HEARTBEAT_INTERVAL, self._manage_heartbeat_and_visibility)
-        self._next_heartbeat_t = reactor.seconds() + self.HEARTBEAT_INTERVAL
+        self.compression_by_node = {}  # node ID => `COMPRESSION_MIN_SIZE` for that node
+
+        # connections by the time they are next due for a heartbeat or a check for silence
+        self._heartbeat_wheel = TimerWheel(self.HEARTBEAT_RESOLUTION,
+                                           size=int(self.HEARTBEAT_INTERVAL / self.HEARTBEAT_RESOLUTION) + 1,
+                                           t=reactor.seconds())
+        self._next_heartbeat = reactor.callLater(self.HEARTBEAT_RESOLUTION, self._manage_heartbeat_and_visibility)
+
+        # connecting to the seed nodes right away gets the handshakes out of the way of the first messages to them
+        for seed in seeds:
+            _validate_nodeid(seed)
+            if seed != nodeid and 'tcp://' + seed not in self.connections:
+                self._connect('tcp://' + seed)
+        self._next_heartbeat_t = reactor.seconds() + self.HEARTBEAT_RESOLUTION
 
     @logstring(u"⇜")
-    def _got_message(self, (sender_addr, msg)):
+    def _got_message(self, parts):
+        sender_addr, msg = parts[0], parts[1]
         conn = self.connections.get(sender_addr)
         t = self.reactor.seconds()
         if t > self._next_heartbeat_t + self.ALLOWED_HEARTBEAT_DELAY / 2.0:
@@ -193,22 +697,29 @@ class Hub(object):
             self._manage_heartbeat_and_visibility()
 
         if msg[0] == PING:
-            remote_version, = struct.unpack(PING_VERSION_FORMAT, msg[1:])  # not sure this is even necessary
+            remote_version, = struct.unpack_from(PING_VERSION_FORMAT, msg, 1)  # not sure this is even necessary
 
+            # the ping of a node we haven't connected to yet also establishes the connection to it; as regular messages
+            # substitute for heartbeats, there might be no other ping soon
             if not conn:
-                self._connect(sender_addr)
-            else:
-                # first ping arrived:
-                if not conn.is_active:
-                    # mark connection as established (flushes the queue and starts sending):
-                    conn.established(remote_version)
-                # version mismatch:
-                elif not (remote_version > conn.known_remote_version):
-                    # he has restarted. notify our actors of it:
-                    conn._emit_termination_messages()
-
-                conn.known_remote_version = remote_version
-                conn.seen = self.reactor.seconds()
+                conn = self._connect(sender_addr)
+            if conn.remote_formats is None:
+                if conn.unadvertised_version is None:
+                    # the formats are advertised right after the ping, and are needed to establish the connection
+                    conn.unadvertised_version = remote_version
+                    conn.heard_from(t)
+                    return
+                # nodes that haven't advertised their formats after a ping of theirs can only decode pickles
+                conn.set_remote_formats(Pickle.marker)
+            self._got_ping(conn, remote_version, t)
+
+        elif msg.startswith(_FORMATS_FRAME_PREFIX):
+            # not an arrival of its own for the failure detector, as it comes right after a ping
+            if conn:
+                _, (_, remote_formats) = cPickle.loads(msg)
+                conn.set_remote_formats(remote_formats)
+                if conn.unadvertised_version is not None:
+                    self._got_ping(conn, conn.unadvertised_version, t)
 
         elif msg == DISCONNECT:
             if conn:
@@ -216,30 +727,99 @@ class Hub(object):
                 del self.connections[sender_addr]
 
         else:
-            path, msg = self._loads(msg)
-            if conn:
-                conn.seen = t
-                self._deliver_local(path, msg, sender_addr)
-            else:
+            if not conn:
                 self._connect(sender_addr)
-                self._remote_dead_letter(path, msg, sender_addr)
+            else:
+                conn.heard_from(t)
+            if msg[0] == COMPRESSED:
+                msg = zlib.decompress(buffer(msg, 1))
+            if msg[0] == OUT_OF_BAND:
+                n, = _OUT_OF_BAND_COUNT.unpack_from(msg, 1)
+                pos = 1 + _OUT_OF_BAND_COUNT.size
+                members = [_OUT_OF_BAND_MEMBER.unpack_from(msg, pos + i * _OUT_OF_BAND_MEMBER.size) for i in range(n)]
+                pos += n * _OUT_OF_BAND_MEMBER.size
+                self._got_payload(conn, sender_addr, msg[pos:], (members, parts[2:]))
+            else:
+                for data in (_unbatch(msg) if msg[0] == BATCH else [msg]):
+                    self._got_payload(conn, sender_addr, data)
+
+    def _got_ping(self, conn, remote_version, t):
+        conn.unadvertised_version = None
+        # first ping arrived:
+        if not conn.is_active:
+            # mark connection as established (flushes the queue and starts sending):
+            conn.established(remote_version)
+        # version mismatch (unless sent to without waiting for the handshake):
+        elif conn.known_remote_version is not None and not (remote_version > conn.known_remote_version):
+            # he has restarted. notify our actors of it:
+            conn.remote_restarted()
+
+        conn.known_remote_version = remote_version
+        conn.heard_from(t)
+
+    def _got_payload(self, conn, sender_addr, data, out_of_band=None):
+        marker = data[0]
+        if marker == INTERNED:
+            path_id, = _PATH_ID.unpack_from(data, 1)
+            _, msg = self._loads(data[1 + _PATH_ID.size:])
+            path = conn.remote_paths.get(path_id) if conn else None
+            if path is None:
+                # this node has restarted or closed the connection since the path was interned
+                log("dropped message to unknown interned path %d from %s: %r" % (path_id, sender_addr, msg))
+                reply_conn = conn or self.connections.get(sender_addr)
+                if reply_conn:
+                    reply_conn.intern_unknown(path_id)
+                return
+        elif marker == INTERN:
+            path_id, = _PATH_ID.unpack_from(data, 1)
+            path, msg = self._loads(data[1 + _PATH_ID.size:])
+            if conn:
+                conn.interned(path_id, path)
+        elif marker == INTERN_ACK:
+            if conn:
+                conn.intern_acked(*_PATH_ID.unpack_from(data, 1))
+            return
+        elif marker == INTERN_RESET:
+            if conn:
+                conn.intern_reset()
+            return
+        elif marker == CREDIT:
+            if conn:
+                conn.credited(*_CREDIT.unpack_from(data, 1))
+            return
+        else:
+            path, msg = self._loads(data)
+        if out_of_band:
+            msg = _attach_out_of_band(msg, *out_of_band)
+        if conn:
+            conn.delivered(self._deliver_local(path, msg, sender_addr))
+        else:
+            self._remote_dead_letter(path, msg, sender_addr)
 
     @logstring(u"❤")
     def _manage_heartbeat_and_visibility(self):
         t = self.reactor.seconds()
-        self._next_heartbeat_t = t + self.HEARTBEAT_INTERVAL
+        self._next_heartbeat_t = t + self.HEARTBEAT_RESOLUTION
         try:
-            t_gone = t - self.HEARTBEAT_MAX_SILENCE
-            for addr, conn in self.connections.items():
-                if conn.seen < t_gone:
-                    conn.close()
-                    del self.connections[addr]
-                else:
-                    conn.heartbeat()
+            for conn in self._heartbeat_wheel.expire(t):
+                if self.connections.get(conn.addr) is conn:  # otherwise closed in the meantime
+                    self._check_connection(conn, t)
         except Exception:  # pragma: no cover
             panic("heartbeat logic failed:\n", traceback.format_exc())
         finally:
-            self._next_heartbeat = self.reactor.callLater(self.HEARTBEAT_INTERVAL, self._manage_heartbeat_and_visibility)
+            self._next_heartbeat = self.reactor.callLater(self.HEARTBEAT_RESOLUTION,
+                                                          self._manage_heartbeat_and_visibility)
+
+    def _check_connection(self, conn, t):
+        phi = conn.phi(t) if self.PHI_THRESHOLD is not None else None
+        if conn.seen < t - self.HEARTBEAT_MAX_SILENCE or (phi is not None and phi > self.PHI_THRESHOLD):
+            conn.close()
+            del self.connections[conn.addr]
+        else:
+            if conn.idle:
+                conn.heartbeat()
+            conn.idle = True
+            self._heartbeat_wheel.add(conn, t + self.HEARTBEAT_INTERVAL)
 
     def _connect(self, addr):
         assert _valid_addr(addr)
@@ -250,23 +830,28 @@ class Hub(object):
             our_addr=self.addr,
             time=self.reactor.seconds(),
             known_remote_version=None,
+            control_sock=self.outsock_factory(),
         )
 
-        # dbg(u"►► ❤ →", addr)
-        conn.heartbeat()
+        self._heartbeat_wheel.add(conn, self.reactor.seconds() + self.HEARTBEAT_INTERVAL)
         return conn
 
+    def _ipc_endpoint(self, addr, resolved_addr):
+        """Returns the Unix socket to connect to the node at `addr` at if it is listening on one on this host."""
+        if not self.ipc_dir:
+            return None
+        host = resolved_addr[len('tcp://'):].rsplit(':', 1)[0]
+        if host != self._local_host and not host.startswith('127.') and host != 'localhost':
+            return None
+        # the socket files of nodes that are not running are either gone or refuse connections just as their TCP ports
+        path = _ipc_path(self.ipc_dir, addr[len('tcp://'):])
+        return 'ipc://' + path if os.path.exists(path) else None
+
     @logstring(u"⇝")
     def send(self, msg, to_remote_actor_pointed_to_by):
         ref = to_remote_actor_pointed_to_by
         # dbg(u"%r → %r" % (msg, ref))
 
-        t = self.reactor.seconds()
-        if t > self._next_heartbeat_t + self.ALLOWED_HEARTBEAT_DELAY / 2.0:
-            if self._next_heartbeat:
-                self._next_heartbeat.cancel()
-                self._manage_heartbeat_and_visibility()
-
         nodeid = ref.uri.node
 
         if nodeid and nodeid != self.nodeid:
@@ -274,9 +859,9 @@ class Hub(object):
             conn = self.connections.get(addr)
             if not conn:
                 conn = self._connect(addr)
-            conn.send(ref, msg)
+            return conn.send(ref, msg)
         else:
-            self._send_local(msg, ref)
+            return self._send_local(msg, ref)
 
     def watch_node(self, nodeid, report_to):
         node_addr = 'tcp://' + nodeid
@@ -285,6 +870,22 @@ class Hub(object):
             conn = self._connect(node_addr)
         conn.watch(report_to)
 
+    def flow_control_metrics(self):
+        """Returns the state of flow control with each connected node by node ID."""
+        return dict((addr[len('tcp://'):], {
+            'credits': conn.credits,
+            'backlog': len(conn.backlog),
+            'max_backlog_length': conn.max_backlog_length,
+            'stalls': conn.stalls,
+            'unacknowledged': conn.received_count - conn.granted_count,
+            'withheld_grants': conn.withheld_grants,
+        }) for addr, conn in self.connections.items())
+
+    def suspicion(self, nodeid):
+        """Returns the current suspicion level (phi) of the node being down, or `None` if there's not enough history."""
+        conn = self.connections.get('tcp://' + nodeid)
+        return conn.phi(self.reactor.seconds()) if conn else None
+
     def unwatch_node(self, nodeid, report_to):
         node_addr = 'tcp://' + nodeid
         conn = self.connections.get(node_addr)
@@ -296,14 +897,14 @@ class Hub(object):
         if cell:
             ref._cell = cell
             ref.is_local = True
-            ref << msg
+            return ref.send(msg)
         else:
             ref.is_local = True  # next time, just put it straight to DeadLetters
             if msg not in (('terminated', ANY), ('_watched', ANY), ('_unwatched', ANY)):
                 Events.log(DeadLetter(ref, msg))
 
     def _deliver_local(self, path, msg, sender_addr):
-        cell = self.guardian.lookup_cell(Uri.parse(path))
+        cell = self.guardian.lookup_path(path)
         if not cell:
             if ('_watched', ANY) == msg:
                 watched_ref = Ref(cell=None, is_local=True, uri=Uri.parse(self.nodeid + path))
@@ -314,6 +915,7 @@ class Hub(object):
                     self._remote_dead_letter(path, msg, sender_addr)
         else:
             cell.receive(msg)  # XXX: force_async=True perhaps?
+        return cell
 
     @inlineCallbacks
     def stop(self):
@@ -324,7 +926,7 @@ class Hub(object):
             yield conn.close()
 
     def _loads(self, data):
-        return IncomingMessageUnpickler(self, StringIO(data)).load()
+        return loads(data, self)
 
     def _remote_dead_letter(self, path, msg, from_):
         uri = Uri.parse(self.nodeid + path)
@@ -369,37 +971,6 @@ class HubWithNoRemoting(object):
         raise RuntimeError("Attempt to unwatch a remote node but remoting is not available")
 
 
-class IncomingMessageUnpickler(Unpickler):
-    """Unpickler for attaching a `Hub` instance to all deserialized `Ref`s."""
-
-    def __init__(self, hub, file):
-        Unpickler.__init__(self, file)
-        self.hub = hub
-
-    # called by `Unpickler.load` before an uninitalized object is about to be filled with members;
-    def _load_build(self):
-        """See `pickle.py` in Python's source code."""
-        # if the ctor. function (penultimate on the stack) is the `Ref` class...
-        if isinstance(self.stack[-2], Ref):
-            # Ref.__setstate__ will know it's a remote ref if the state is a tuple
-            self.stack[-1] = (self.stack[-1], self.hub)
-
-            self.load_build()  # continue with the default implementation
-
-            # detect our own refs sent back to us
-            ref = self.stack[-1]
-            if ref.uri.node == self.hub.nodeid:
-                ref.is_local = True
-                ref._cell = self.hub.guardian.lookup_cell(ref.uri)
-                # dbg(("dead " if not ref._cell else "") + "local ref detected")
-                del ref.hub  # local refs never need hubs
-        else:  # pragma: no cover
-            self.load_build()
-
-    dispatch = dict(Unpickler.dispatch)  # make a copy of the original
-    dispatch[BUILD] = _load_build  # override the handler of the `BUILD` instruction
-
-
 def _validate_addr(addr):
     # call from app code
     m = _VALID_ADDR_RE.match(addr)
@@ -430,6 +1001,48 @@ def _valid_addr(addr):  # pragma: no cover
     return True
 
 
+def _out_of_band_members(msg, min_size):
+    """Returns the index and kind of each member of `msg` to be sent out of band, or `None` if there are none."""
+    types = _BUFFER_TYPES
+    kind = types.get(type(msg))
+    if kind:
+        return [(_WHOLE, kind)] if len(msg) >= min_size else None
+    if type(msg) is not tuple:
+        return None
+    ret = None
+    for ix, x in enumerate(msg):
+        kind = types.get(type(x))
+        if kind and len(x) >= min_size and ix < _WHOLE:
+            if ret is None:
+                ret = []
+            ret.append((ix, kind))
+            if len(ret) == 0xff:
+                break
+    return ret
+
+
+def _attach_out_of_band(msg, members, frames):
+    """Puts the out-of-band members in `frames` back into `msg`."""
+    values = [(x if type(x) is str else memoryview(x).tobytes()) if kind == _BYTES else memoryview(x)
+              for (_, kind), x in zip(members, frames)]
+    if members[0][0] == _WHOLE:
+        return values[0]
+    msg = list(msg)
+    for (ix, _), x in zip(members, values):
+        msg[ix] = x
+    return tuple(msg)
+
+
+def _unbatch(frame):
+    """Yields the messages in a `BATCH` frame."""
+    pos, end = 1, len(frame)
+    while pos < end:
+        n, = _BATCH_LEN.unpack_from(frame, pos)
+        pos += 4
+        yield frame[pos:pos + n]
+        pos += n
+
+
 class MockNetwork(object):  # pragma: no cover
     """Represents a mock network with only ZeroMQ ROUTER and DEALER sockets on it."""
 
@@ -437,12 +1050,13 @@ class MockNetwork(object):  # pragma: no cover
         self.listeners = {}
         self.queue = []
         self.test_context = inspect.stack()[1][3]
-        self.connections = set()
+        self.connections = {}  # (src, dst) => the number of outgoing sockets connected, i.e. one per lane
+        self.ipc_addrs = {}  # the addresses of the Unix sockets bound by hubs => the addresses of the hubs
         self.clock = clock
 
         self._packet_loss = {}
 
-    def node(self, nodeid):
+    def node(self, nodeid, seeds=(), ipc_dir=None):
         """Creates a new node with the specified name, with `MockSocket` instances as incoming and outgoing sockets.
 
         Returns the implementation object created for the node from the cls, args and address specified, and the sockets.
@@ -454,16 +1068,16 @@ class MockNetwork(object):  # pragma: no cover
         insock = MockInSocket(addEndpoints=lambda endpoints: self.bind(addr, insock, endpoints))
         outsock = lambda: MockOutSocket(addr, self)
 
-        return Node(hub=Hub(insock, outsock, nodeid=nodeid, reactor=self.clock))
+        return Node(hub=Hub(insock, outsock, nodeid=nodeid, reactor=self.clock, seeds=seeds, ipc_dir=ipc_dir))
 
     def outsock_addEndpoints(self, src, endpoints):
         self.connect(src, endpoints)
 
     def outsock_sendMultipart(self, src, dst, msgParts):
-        self.enqueue(src, dst, msgParts)
+        self.enqueue(src, self.ipc_addrs.get(dst, dst), msgParts)
 
     def outsock_shutdown(self, addr, target_addr):
-        self.disconnect(addr, target_addr)
+        self.disconnect(addr, self.ipc_addrs.get(target_addr, target_addr))
 
     # def mapperdaemon(self, addr):
     #     pass
@@ -475,6 +1089,13 @@ class MockNetwork(object):  # pragma: no cover
 
     def bind(self, addr, sock, endpoints):
         assert all(x.type == 'bind' for x in endpoints), "Hubs should only bind in-sockets and never connect"
+        ipc_endpoints = [x for x in endpoints if x.address.startswith('ipc://')]
+        assert len(ipc_endpoints) <= 1, "Hubs should only bind in-sockets to a single Unix socket"
+        for x in ipc_endpoints:
+            assert x.address not in self.ipc_addrs, "Unix socket %r already bound on the network" % (x.address,)
+            self.ipc_addrs[x.address] = addr
+            open(x.address[len('ipc://'):], 'w').close()  # as binding creates the socket file
+        endpoints = [x for x in endpoints if x not in ipc_endpoints]
         assert len(endpoints) == 1, "Hubs should only bind in-sockets to a single network address"
         endpoint, = endpoints
         _assert_valid_addr(addr)
@@ -488,20 +1109,24 @@ class MockNetwork(object):  # pragma: no cover
         _assert_valid_addr(addr)
         for endpoint in endpoints:
             assert endpoint.type == 'connect', "Hubs should only connect MockOutSockets and not bind"
-            _assert_valid_addr(endpoint.address)
-            assert (addr, endpoint.address) not in self.connections
+            dst = self.ipc_addrs.get(endpoint.address, endpoint.address)
+            _assert_valid_addr(dst)
+            key = (addr, dst)
+            assert self.connections.get(key, 0) < 2, "Hubs should only connect one outgoing socket per lane to a node"
             dbg(u"%s → %s" % (addr, endpoint.address))
-            self.connections.add((addr, endpoint.address))
+            self.connections[key] = self.connections.get(key, 0) + 1
 
     def disconnect(self, src, dst):
         assert (src, dst) in self.connections, "Outgoing sockets should only disconnect from addresses they have previously connected to"
-        self.connections.remove((src, dst))
+        self.connections[(src, dst)] -= 1
+        if not self.connections[(src, dst)]:
+            del self.connections[(src, dst)]
 
     @logstring(u"⇝")
     def enqueue(self, src, dst, msg):
         _assert_valid_addr(src)
         _assert_valid_addr(dst)
-        assert isinstance(msg, tuple) and all(isinstance(x, bytes) for x in msg), "Message payloads sent out by Hub should be tuples containing bytse"
+        assert isinstance(msg, tuple) and all(isinstance(x, (bytes, buffer, memoryview, bytearray)) for x in msg), "Message payloads sent out by Hub should be tuples containing bytes or buffers"
         assert (src, dst) in self.connections, "Hubs should only send messages to addresses they have previously connected to"
 
         # dbg(u"%r → %s" % (_dumpmsg(msg), dst))
@@ -621,3 +1246,13 @@ def _resolve_addr(addr):
         host, port = nodeid.split(':')
         return '%s%s:%s' % (proto, resolve(host), port)
     return addr
+
+
+def _ipc_path(ipc_dir, nodeid):
+    return os.path.join(ipc_dir, 'spinoff-%s.sock' % (nodeid,))
+
+
+def _resolve_addr_async(addr, reactor):
+    proto, nodeid = _PROTO_ADDR_RE.match(addr).groups()[0:2]
+    host, port = nodeid.split(':')
+    return resolve_async(host, reactor).addCallback(lambda ip: '%s%s:%s' % (proto, ip, port))
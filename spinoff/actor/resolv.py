@@ -1,10 +1,62 @@
+"""Resolution of the hostnames in node IDs to IP addresses.
+
+`resolve_async` resolves through the resolver of the reactor so that a slow or unresponsive DNS server doesn't block
+the reactor (and thus every actor on the node). Results are cached for `CACHE_TTL` seconds, and failures for
+`NEGATIVE_CACHE_TTL` seconds; concurrent resolutions of the same hostname share a single lookup.
+
+"""
 import socket
 
+from twisted.internet import reactor
+from twisted.internet.abstract import isIPAddress
+from twisted.internet.defer import Deferred, succeed, fail
+from twisted.python.failure import Failure
+
 from spinoff.actor import _actor
 
 
+# the reactor's resolver doesn't report the TTLs of the DNS records, so the same TTL is used for all of them
+CACHE_TTL = 300.0
+NEGATIVE_CACHE_TTL = 10.0
+
+_cache = {}  # hostname => (time of expiry, IP address or `Failure`)
+_pending = {}  # hostname => `Deferred`s waiting for the lookup in progress
+
+
 def resolve(hostname):
+    """Resolves `hostname` synchronously; only for use before the node has started running actors."""
     if not _actor.TESTING:
         return socket.gethostbyname(hostname)
     else:
         return hostname
+
+
+def resolve_async(hostname, reactor=reactor):
+    """Returns a `Deferred` that fires with the IP address of `hostname`."""
+    if _actor.TESTING or isIPAddress(hostname):
+        return succeed(hostname)
+    return _resolve_cached(hostname, reactor)
+
+
+def _resolve_cached(hostname, reactor):
+    cached = _cache.get(hostname)
+    if cached and cached[0] > reactor.seconds():
+        _, result = cached
+        return fail(result) if isinstance(result, Failure) else succeed(result)
+    d = Deferred()
+    if hostname in _pending:
+        _pending[hostname].append(d)
+    else:
+        _pending[hostname] = [d]
+        reactor.resolve(hostname).addBoth(_resolved, hostname, reactor)
+    return d
+
+
+def _resolved(result, hostname, reactor):
+    failed = isinstance(result, Failure)
+    _cache[hostname] = (reactor.seconds() + (NEGATIVE_CACHE_TTL if failed else CACHE_TTL), result)
+    for d in _pending.pop(hostname):
+        if failed:
+            d.errback(result)
+        else:
+            d.callback(result)
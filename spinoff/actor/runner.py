@@ -1,12 +1,15 @@
 from __future__ import print_function
 
+import os
 import re
+import sys
 import traceback
+from collections import deque
 
 from twisted.application.service import Service
-from twisted.internet import reactor
+from twisted.internet import reactor, protocol
 from twisted.internet.error import ReactorNotRunning
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, Deferred, DeferredList
 from twisted.python.failure import Failure
 from txzmq import ZmqFactory, ZmqPushConnection, ZmqPullConnection
 
@@ -15,8 +18,8 @@ from spinoff.actor._actor import _validate_nodeid
 from spinoff.actor.remoting import Hub, HubWithNoRemoting
 from spinoff.util.logging import log, err, panic
 from spinoff.util.async import after
-from spinoff.util.pattern_matching import ANY
-from spinoff.actor.events import Events, Message
+from spinoff.util.pattern_matching import ANY, IN
+from spinoff.actor.events import Events, Message, DeadLetter
 from spinoff.actor.supervision import Stop, Restart, Resume
 
 _EMPTY = object()
@@ -24,7 +27,8 @@ _EMPTY = object()
 
 class ActorRunner(Service):
 
-    def __init__(self, actor_cls, init_params={}, initial_message=_EMPTY, nodeid=None, name=None, supervise='stop', keep_running=False):
+    def __init__(self, actor_cls, init_params={}, initial_message=_EMPTY, nodeid=None, name=None, supervise='stop',
+                 keep_running=False, seeds=(), ipc_dir=None):
         nodeid = 'localhost' + nodeid if nodeid and re.match(r'^:\d+$', nodeid) else nodeid
         if nodeid:
             _validate_nodeid(nodeid)
@@ -36,6 +40,8 @@ class ActorRunner(Service):
         self._name = name
         self._supervise = supervise
         self._keep_running = keep_running
+        self._seeds = seeds
+        self._ipc_dir = ipc_dir
 
     def startService(self):
         actor_path = self._actor_path = '%s.%s' % (self._actor_cls.__module__, self._actor_cls.__name__)
@@ -49,7 +55,7 @@ class ActorRunner(Service):
                     f1 = ZmqFactory()
                     insock = ZmqPullConnection(f1)
                     outsock = lambda: ZmqPushConnection(f1, linger=0)
-                    hub = Hub(insock, outsock, nodeid=self._nodeid)
+                    hub = Hub(insock, outsock, nodeid=self._nodeid, seeds=self._seeds, ipc_dir=self._ipc_dir)
                 except Exception:
                     err("Could not set up remoting")
                     traceback.print_exc()
@@ -120,3 +126,117 @@ class Wrapper(Actor):
 
     def __repr__(self):
         return '#runner#'
+
+
+def worker_nodeids(nodeid, n):
+    """Returns the IDs of the `n` worker nodes of the node group with the ID `nodeid`: the ports following its own."""
+    host, port = nodeid.rsplit(':', 1)
+    return ['%s:%d' % (host, int(port) + i) for i in range(1, n + 1)]
+
+
+class Router(Actor):
+    """Forwards the messages it receives to the actors at `name` on the worker nodes `nodeids` in turn.
+
+    The actor of a node group with several workers, i.e. processes, to spread the load over; the actors of workers that
+    terminate or whose node goes down are left out until `RETRY_INTERVAL` seconds later, by when they are expected to
+    have been restarted. See `WorkerGroup`.
+
+    """
+    RETRY_INTERVAL = 2.0
+
+    def __init__(self, nodeids, name):
+        self.nodeids = nodeids
+        self.name = name
+
+    def pre_start(self):
+        self.routees = deque()
+        self.retries = {}
+        for nodeid in self.nodeids:
+            self._add(nodeid)
+
+    def _add(self, nodeid):
+        self.retries.pop(nodeid, None)
+        self.routees.append(self.watch(self.node.lookup('%s/%s' % (nodeid, self.name))))
+
+    def receive(self, message):
+        if message == ('terminated', IN(self.routees)):
+            _, ref = message
+            self.routees.remove(ref)
+            nodeid = ref.uri.node
+            self.retries[nodeid] = self.node.hub.reactor.callLater(self.RETRY_INTERVAL, self._add, nodeid)
+        elif self.routees:
+            routee = self.routees[0]
+            self.routees.rotate(-1)
+            routee << message
+        else:
+            Events.log(DeadLetter(self.ref, message))
+
+    def post_stop(self):
+        for call in self.retries.values():
+            call.cancel()
+
+    def __repr__(self):
+        return '#router#'
+
+
+class WorkerGroup(Service):
+    """Runs a worker node for each of `nodeids` as a `startnode` child process with `args`, restarting those that exit.
+
+    """
+    RESTART_DELAY = 1.0
+
+    def __init__(self, nodeids, args, reactor=reactor):
+        self.nodeids = nodeids
+        self.args = args
+        self.reactor = reactor
+        self.processes = {}  # node ID => `_WorkerProcess`
+        self.restarts = {}  # node ID => the delayed call that restarts its process
+
+    def startService(self):
+        Service.startService(self)
+        for nodeid in self.nodeids:
+            self._start(nodeid)
+
+    def _start(self, nodeid):
+        self.restarts.pop(nodeid, None)
+        process = self.processes[nodeid] = _WorkerProcess(self, nodeid)
+        args = [sys.executable, '-c', 'from twisted.scripts.twistd import run; run()', '--nodaemon', '--pidfile=',
+                'startnode', '--remoting', nodeid] + self.args
+        self.reactor.spawnProcess(process, sys.executable, args=args, env=os.environ)
+        Events.log(Message("Started worker %s" % (nodeid,)))
+
+    def _exited(self, nodeid, reason):
+        del self.processes[nodeid]
+        if self.running:
+            Events.log(Message("Worker %s exited (%s); restarting" % (nodeid, reason.getErrorMessage())))
+            self.restarts[nodeid] = self.reactor.callLater(self.RESTART_DELAY, self._start, nodeid)
+
+    def stopService(self):
+        Service.stopService(self)
+        for call in self.restarts.values():
+            call.cancel()
+        self.restarts.clear()
+        ds = []
+        for process in self.processes.values():
+            ds.append(process.ended)
+            process.transport.signalProcess('TERM')
+        return DeferredList(ds)
+
+    def __repr__(self):
+        return '<WorkerGroup>'
+
+
+class _WorkerProcess(protocol.ProcessProtocol):
+
+    def __init__(self, group, nodeid):
+        self.group = group
+        self.nodeid = nodeid
+        self.ended = Deferred()
+
+    def childDataReceived(self, fd, data):
+        for line in data.splitlines():
+            log("[%s] %s" % (self.nodeid, line))
+
+    def processEnded(self, reason):
+        self.group._exited(self.nodeid, reason)
+        self.ended.callback(None)
@@ -0,0 +1,89 @@
+"""Fair scheduling of actor message processing.
+
+Actors whose messages are processed asynchronously (see `Actor.SENDING_IS_ASYNC`) are put on the run queue of a
+`Scheduler`. The scheduler processes the actors on the run queue round-robin: in every round, each actor that was ready
+at the start of the round gets to process at most its quantum of messages (see `Actor.throughput`); actors that still
+have messages left after that are put back to the end of the run queue. Between rounds, control is given back to the
+reactor so that I/O and timers are never starved by busy actors. Messages delivered synchronously are processed right
+away regardless of the quantum, as they always have been.
+
+Every `Node` has a scheduler; by default, all nodes share `default_scheduler`.
+
+"""
+from collections import deque
+
+from twisted.internet import reactor as _reactor
+
+
+class Scheduler(object):
+    """A run queue of actors that are ready to process messages, together with metrics about it.
+
+    The metrics are `max_run_queue_length`, and the latencies (in reactor seconds) between an actor being put on the
+    run queue and the actor getting to process its messages: `last_latency`, `max_latency` and `mean_latency`.
+
+    """
+    rounds = 0
+    max_run_queue_length = 0
+    scheduled = 0
+    total_latency = last_latency = max_latency = 0.0
+
+    _round_scheduled = False
+
+    def __init__(self, reactor=_reactor):
+        self.reactor = reactor
+        self.run_queue = deque()
+
+    @property
+    def run_queue_length(self):
+        return len(self.run_queue)
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.scheduled if self.scheduled else 0.0
+
+    def reset_metrics(self):
+        self.rounds = self.max_run_queue_length = self.scheduled = 0
+        self.total_latency = self.last_latency = self.max_latency = 0.0
+
+    def schedule(self, cell):
+        """Puts `cell` at the end of the run queue; it's up to the caller to not schedule a cell more than once."""
+        run_queue = self.run_queue
+        run_queue.append((cell, self.reactor.seconds()))
+        if len(run_queue) > self.max_run_queue_length:
+            self.max_run_queue_length = len(run_queue)
+        if not self._round_scheduled:
+            self._round_scheduled = True
+            self.reactor.callLater(0, self._run_round)
+
+    def run_until_idle(self):
+        """Runs rounds back to back until the run queue is empty without yielding to the reactor; meant for tests."""
+        while self.run_queue:
+            self._run_round()
+
+    def _run_round(self):
+        self._round_scheduled = False
+        run_queue = self.run_queue
+        if not run_queue:  # already run by `run_until_idle`
+            return
+        self.rounds += 1
+        seconds = self.reactor.seconds
+        # actors scheduled during this round, including the ones put back after using up their quantum, are only run
+        # in the next round
+        for _ in xrange(len(run_queue)):
+            cell, scheduled_at = run_queue.popleft()
+            latency = seconds() - scheduled_at
+            self.scheduled += 1
+            self.total_latency += latency
+            self.last_latency = latency
+            if latency > self.max_latency:
+                self.max_latency = latency
+            cell._process_messages(scheduled=True)
+        if run_queue and not self._round_scheduled:
+            self._round_scheduled = True
+            self.reactor.callLater(0, self._run_round)
+
+    def __repr__(self):
+        return '<scheduler:%d ready>' % (len(self.run_queue),)
+
+
+default_scheduler = Scheduler()
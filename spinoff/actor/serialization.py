@@ -0,0 +1,340 @@
+"""Wire formats of the messages sent between nodes.
+
+The `Hub` serializes every remote message together with the path of its recipient with its `SERIALIZER`:
+
+* `Pickle`: pickles the message; this is the original format that all nodes can decode, but decoding it requires the
+  pure-Python unpickler as `Ref`s are bound to the receiving `Hub` by hooking into the unpickling of objects;
+
+* `FastPickle`: pickles the message with `Ref`s as persistent IDs, which lets it be decoded by the C unpickler, with the
+  `Ref`s bound to the receiving `Hub` in `persistent_load`; this is the default, and the fastest format in both
+  directions (see `benchmarks/wire.py`);
+
+* `Compact`: a compact binary encoding of the message types used most in practice: `None`, `bool`s, `int`s, `long`s,
+  `float`s, `str`s (i.e. bytes), `unicode` strings, tuples, and `Ref`s as a dedicated type; anything else is embedded
+  as a `FastPickle` pickle. It produces the smallest messages and decodes several times faster than `Pickle`, but
+  being pure Python, it is slower than `FastPickle`.
+
+Every format starts with its own marker byte, so the receiving `Hub` tells the format of each message on its own. A node
+advertises the formats it can decode in its heartbeats, and only uses its `SERIALIZER` for nodes that have advertised
+it--other nodes are sent the first format of `FALLBACKS` they have advertised.
+
+"""
+from __future__ import absolute_import
+
+import cPickle
+import struct
+from cStringIO import StringIO
+from pickle import Unpickler, BUILD
+
+from spinoff.actor import Ref, Uri
+
+
+class Serializer(object):
+    """Base class for wire formats; every message in a format starts with its `marker` byte."""
+    marker = None
+
+    def dumps(self, path, msg):
+        """Returns `msg` sent to the actor at `path` (a `str`) as a `str` starting with `marker`."""
+        raise NotImplementedError
+
+    def loads(self, data, hub):
+        """Returns the `(path, msg)` pair encoded in `data`; `Ref`s in the message are bound to `hub`."""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return type(self).__name__
+
+
+class Pickle(Serializer):
+    """Pickles messages with pickle protocol 2."""
+    marker = b'\x80'  # the PROTO opcode every protocol 2 pickle starts with
+
+    def dumps(self, path, msg):
+        return cPickle.dumps((path, msg), protocol=2)
+
+    def loads(self, data, hub):
+        return IncomingMessageUnpickler(hub, StringIO(data)).load()
+Pickle = Pickle()
+
+
+class FastPickle(Serializer):
+    """Pickles messages with pickle protocol 2 and `Ref`s as persistent IDs so that the C unpickler can decode them."""
+    marker = b'\x02'
+
+    def dumps(self, path, msg):
+        f = StringIO()
+        f.write(self.marker)
+        _pickler(f).dump((path, msg))
+        return f.getvalue()
+
+    def loads(self, data, hub):
+        f = StringIO(data)
+        f.seek(1)
+        return _unpickler(f, hub).load()
+FastPickle = FastPickle()
+
+
+class Compact(Serializer):
+    """Encodes messages in a compact binary format and falls back to pickle for types it has no encoding for.
+
+    A value is encoded as a type byte followed by its payload; lengths, counts and numbers are big-endian:
+
+        N, T, F             `None`, `True`, `False`
+        i <int32>, q <int64>, l <len:uint32> <decimal digits>       `int`s, `long`s
+        d <float64>
+        b <len:uint8> <bytes>, s <len:uint32> <bytes>               `str`s
+        u <len:uint32> <utf-8>                                      `unicode` strings
+        c <count:uint8> <values>, t <count:uint32> <values>         tuples
+        r <len:uint32> <uri>                                        `Ref`s
+        p <len:uint32> <pickle>         anything else, including subclasses of the above, pickled as by `FastPickle`
+
+    A message is the marker, the path of the recipient as a `str` without the type byte, and the message itself.
+
+    """
+    marker = b'\x01'
+
+    def dumps(self, path, msg):
+        out = [self.marker, _uint32.pack(len(path)), path]
+        _encode(msg, out)
+        return b''.join(out)
+
+    def loads(self, data, hub):
+        n, = _uint32.unpack_from(data, 1)
+        path = data[5:5 + n]
+        msg, _ = _decode(data, 5 + n, hub)
+        return path, msg
+Compact = Compact()
+
+
+SERIALIZERS = dict((x.marker, x) for x in [Pickle, FastPickle, Compact])
+
+# the formats to use, in order of preference, for nodes that can't decode the preferred format of the sending node
+FALLBACKS = [FastPickle, Pickle]
+
+
+def loads(data, hub):
+    """Decodes a message in any of the known formats."""
+    try:
+        serializer = SERIALIZERS[data[0]]
+    except KeyError:
+        raise ValueError("Unknown wire format: %r" % (data[:1],))
+    return serializer.loads(data, hub)
+
+
+_uint8 = struct.Struct('!B')
+_uint32 = struct.Struct('!I')
+_int32 = struct.Struct('!i')
+_int64 = struct.Struct('!q')
+_float64 = struct.Struct('!d')
+
+
+def _encode_int(x, out):
+    if -0x80000000 <= x <= 0x7fffffff:
+        out += (b'i', _int32.pack(x))
+    elif -0x8000000000000000 <= x <= 0x7fffffffffffffff:
+        out += (b'q', _int64.pack(x))
+    else:
+        _encode_long(x, out)
+
+
+def _encode_long(x, out):
+    digits = str(x)
+    out += (b'l', _uint32.pack(len(digits)), digits)
+
+
+def _encode_float(x, out):
+    out += (b'd', _float64.pack(x))
+
+
+def _encode_str(x, out):
+    n = len(x)
+    out += (b'b', _uint8.pack(n), x) if n < 0x100 else (b's', _uint32.pack(n), x)
+
+
+def _encode_unicode(x, out):
+    x = x.encode('utf-8')
+    out += (b'u', _uint32.pack(len(x)), x)
+
+
+def _encode_tuple(x, out):
+    n = len(x)
+    out += (b'c', _uint8.pack(n)) if n < 0x100 else (b't', _uint32.pack(n))
+    encoders = _ENCODERS
+    for item in x:
+        encoders.get(type(item), _encode_pickle)(item, out)
+
+
+def _encode_ref(x, out):
+    uri = str(x.uri)
+    out += (b'r', _uint32.pack(len(uri)), uri)
+
+
+def _encode_pickle(x, out):
+    f = StringIO()
+    _pickler(f).dump(x)
+    data = f.getvalue()
+    out += (b'p', _uint32.pack(len(data)), data)
+
+
+# by exact type so that subclasses (e.g. namedtuples, typed refs) are pickled and thus keep their type
+_ENCODERS = {
+    type(None): lambda x, out: out.append(b'N'),
+    bool: lambda x, out: out.append(b'T' if x else b'F'),
+    int: _encode_int,
+    long: _encode_long,
+    float: _encode_float,
+    str: _encode_str,
+    unicode: _encode_unicode,
+    tuple: _encode_tuple,
+    Ref: _encode_ref,
+}
+
+
+def _encode(x, out):
+    _ENCODERS.get(type(x), _encode_pickle)(x, out)
+
+
+def _decode(data, pos, hub):
+    """Returns the value encoded at `pos` in `data` and the position right after it."""
+    return _DECODERS[data[pos]](data, pos + 1, hub)
+
+
+def _decode_sized(data, pos):
+    n, = _uint32.unpack_from(data, pos)
+    pos += 4
+    return data[pos:pos + n], pos + n
+
+
+def _decode_short_str(data, pos, hub):
+    n, = _uint8.unpack_from(data, pos)
+    pos += 1
+    return data[pos:pos + n], pos + n
+
+
+def _decode_str(data, pos, hub):
+    return _decode_sized(data, pos)
+
+
+def _decode_unicode(data, pos, hub):
+    x, pos = _decode_sized(data, pos)
+    return x.decode('utf-8'), pos
+
+
+def _decode_long(data, pos, hub):
+    x, pos = _decode_sized(data, pos)
+    return long(x), pos
+
+
+def _decode_items(data, pos, hub, n):
+    items = [None] * n
+    decoders = _DECODERS
+    for ix in xrange(n):
+        items[ix], pos = decoders[data[pos]](data, pos + 1, hub)
+    return tuple(items), pos
+
+
+def _decode_short_tuple(data, pos, hub):
+    n, = _uint8.unpack_from(data, pos)
+    return _decode_items(data, pos + 1, hub, n)
+
+
+def _decode_tuple(data, pos, hub):
+    n, = _uint32.unpack_from(data, pos)
+    return _decode_items(data, pos + 4, hub, n)
+
+
+def _decode_ref(data, pos, hub):
+    uri, pos = _decode_sized(data, pos)
+    return _bind_ref(Uri.parse(uri), hub), pos
+
+
+def _decode_pickle(data, pos, hub):
+    x, pos = _decode_sized(data, pos)
+    return _unpickler(StringIO(x), hub).load(), pos
+
+
+_DECODERS = {
+    b'N': lambda data, pos, hub: (None, pos),
+    b'T': lambda data, pos, hub: (True, pos),
+    b'F': lambda data, pos, hub: (False, pos),
+    b'i': lambda data, pos, hub: (_int32.unpack_from(data, pos)[0], pos + 4),
+    b'q': lambda data, pos, hub: (_int64.unpack_from(data, pos)[0], pos + 8),
+    b'l': _decode_long,
+    b'd': lambda data, pos, hub: (_float64.unpack_from(data, pos)[0], pos + 8),
+    b'b': _decode_short_str,
+    b's': _decode_str,
+    b'u': _decode_unicode,
+    b'c': _decode_short_tuple,
+    b't': _decode_tuple,
+    b'r': _decode_ref,
+    b'p': _decode_pickle,
+}
+
+
+def _pickler(f):
+    p = cPickle.Pickler(f, 2)
+    # unlike `persistent_id`, only called for objects that are not of the built-in types
+    p.inst_persistent_id = _persistent_id
+    return p
+
+
+def _persistent_id(obj):
+    if type(obj) is Ref:
+        return str(obj.uri)
+    elif isinstance(obj, Ref):  # subclasses are sent together with their type so that they keep it
+        return (str(obj.uri), type(obj))
+    return None
+
+
+def _unpickler(f, hub):
+    u = cPickle.Unpickler(f)
+    u.persistent_load = lambda pid: _load_ref(pid, hub)
+    return u
+
+
+def _load_ref(pid, hub):
+    if type(pid) is str:
+        return _bind_ref(Uri.parse(pid), hub)
+    uri, cls = pid
+    bound = _bind_ref(Uri.parse(uri), hub)
+    ref = cls.__new__(cls)
+    Ref.__init__(ref, cell=bound._cell, uri=bound.uri, is_local=bound.is_local, hub=bound.hub)
+    return ref
+
+
+def _bind_ref(uri, hub):
+    """Returns a `Ref` to `uri` as received by `hub`: refs to actors on the node of `hub` are local refs."""
+    if uri.node == hub.nodeid:
+        return Ref(cell=hub.guardian.lookup_cell(uri), uri=uri, is_local=True)
+    return Ref(cell=None, uri=uri, is_local=False, hub=hub)
+
+
+class IncomingMessageUnpickler(Unpickler):
+    """Unpickler for attaching a `Hub` instance to all deserialized `Ref`s."""
+
+    def __init__(self, hub, file):
+        Unpickler.__init__(self, file)
+        self.hub = hub
+
+    # called by `Unpickler.load` before an uninitalized object is about to be filled with members;
+    def _load_build(self):
+        """See `pickle.py` in Python's source code."""
+        # if the ctor. function (penultimate on the stack) is the `Ref` class...
+        if isinstance(self.stack[-2], Ref):
+            # Ref.__setstate__ will know it's a remote ref if the state is a tuple
+            self.stack[-1] = (self.stack[-1], self.hub)
+
+            self.load_build()  # continue with the default implementation
+
+            # detect our own refs sent back to us
+            ref = self.stack[-1]
+            if ref.uri.node == self.hub.nodeid:
+                ref.is_local = True
+                ref._cell = self.hub.guardian.lookup_cell(ref.uri)
+                # dbg(("dead " if not ref._cell else "") + "local ref detected")
+                ref.hub = None  # local refs never need hubs
+        else:  # pragma: no cover
+            self.load_build()
+
+    dispatch = dict(Unpickler.dispatch)  # make a copy of the original
+    dispatch[BUILD] = _load_build  # override the handler of the `BUILD` instruction
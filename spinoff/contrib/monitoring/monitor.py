@@ -4,7 +4,7 @@ from spinoff.actor import Actor
 from spinoff.actor.exceptions import Unhandled
 from spinoff.util.async import after
 from spinoff.util.logging import dbg
-from spinoff.util.pattern_matching import ANY, IN
+from spinoff.util.pattern_matching import ANY, IN, compile, compilable
 from .http import run_server
 
 
@@ -14,6 +14,16 @@ __all__ = []
 CLIENT_RECONNECT_INTERVAL = 30.0
 
 
+def _compile_filter(filter):
+    """Returns a function that tells if a subject equals `filter`, i.e. `subject == filter`.
+
+    Filters that can't be compiled are compared as is with the subject on the left, as compiling only keeps the result
+    of comparisons with plain values and matchers regardless of the order; e.g. `Ref.__eq__` gets the first say.
+
+    """
+    return compile(filter) if compilable(filter) else (lambda subject: subject == filter)
+
+
 class Monitor(Actor):
     def pre_start(self, reactor=reactor):
         self.reactor = reactor
@@ -85,22 +95,26 @@ class Monitor(Actor):
 
         elif ('get-up', ANY, ANY) == msg:
             _, d, filter = msg
-            msg[1].callback([(str(k.uri), v) for k, v in self.up.items() if k == filter])
+            matches = _compile_filter(filter)
+            msg[1].callback([(str(k.uri), v) for k, v in self.up.items() if matches(k)])
 
         elif ('get-state', ANY, ANY) == msg:
             _, d, filter = msg
-            msg[1].callback([(str(k.uri), v) for k, v in self.state.items() if k == filter])
+            matches = _compile_filter(filter)
+            msg[1].callback([(str(k.uri), v) for k, v in self.state.items() if matches(k)])
 
         elif ('get-log', ANY, ANY) == msg:
             _, d, filter = msg
-            msg[1].callback([x for x in self.log if x == filter])
+            matches = _compile_filter(filter)
+            msg[1].callback([x for x in self.log if matches(x)])
 
         elif ('get-all', ANY, ANY) == msg:
             _, d, filter = msg
+            matches = _compile_filter(filter)
             data = {}
             for client in self.up:
                 uri = str(client.uri)
-                if uri == filter:
+                if matches(uri):
                     status, seen = self.up[client]
                     state = self.state[client] if client in self.state else None
                     data[uri] = (status, seen, state)
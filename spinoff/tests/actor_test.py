@@ -1,21 +1,35 @@
 from __future__ import print_function
 
+import cPickle
 import gc
+import os
+import pickle
 import random
 import re
+import shutil
+import struct
+import tempfile
 import weakref
 
 from nose.tools import eq_, ok_
 from twisted.internet.defer import Deferred, inlineCallbacks, DeferredQueue, fail, CancelledError, returnValue
 from twisted.internet.task import Clock
+from twisted.python.threadable import isInIOThread
+from txzmq import ZmqEndpoint
 
 from spinoff.actor import (
-    Actor, Props, Node, Unhandled, NameConflict, UnhandledTermination, CreateFailed, BadSupervision, Ref, Uri)
-from spinoff.actor.events import Events, UnhandledMessage, DeadLetter, ErrorIgnored, HighWaterMarkReached
+    Actor, Props, Node, Unhandled, NameConflict, UnhandledTermination, CreateFailed, BadSupervision, Ref, Uri, on)
+from spinoff.actor.events import Events, UnhandledMessage, DeadLetter, ErrorIgnored, HighWaterMarkReached, MessageDropped
+from spinoff.actor.mailbox import DropOldest, ToDeadLetters, Backpressure
+from spinoff.actor.scheduler import Scheduler, default_scheduler
 from spinoff.actor.process import Process
 from spinoff.actor.supervision import Resume, Restart, Stop, Escalate, Default
-from spinoff.actor.remoting import Hub, MockNetwork, HubWithNoRemoting
-from spinoff.actor.exceptions import InvalidEscalation
+from spinoff.actor.remoting import (
+    Hub, MockNetwork, MockInSocket, MockOutSocket, HubWithNoRemoting, PING, DISCONNECT, BATCH, INTERN, INTERNED,
+    OUT_OF_BAND, COMPRESSED, _unbatch)
+from spinoff.actor.serialization import Pickle, FastPickle, Compact
+from spinoff.actor.runner import Router, worker_nodeids
+from spinoff.actor.exceptions import InvalidEscalation, LookupFailed, WorkerDied
 from spinoff.util.async import with_timeout, sleep
 from spinoff.util.pattern_matching import ANY, IS_INSTANCE
 from spinoff.util.testing import (
@@ -203,6 +217,39 @@ def test_receive_of_the_same_actor_never_executes_concurrently_even_with_deferre
     _do_test(ActorReturningDeferreds)
 
 
+def test_synchronous_and_deferred_receives_can_be_interleaved():
+    """Messages queued up behind a deferred receive are processed in order once it completes.
+
+    Synchronous receives are run back to back; processing only waits when a receive actually returns or yields a
+    `Deferred` that has not fired yet.
+
+    """
+    spawn = TestNode().spawn
+
+    received = MockMessages()
+    triggers = {}
+
+    class MyActor(Actor):
+        def receive(self, message):
+            received.append(message)
+            if message in triggers:
+                return triggers[message]
+
+    triggers.update({'wait1': Trigger(), 'wait2': Trigger()})
+    a = spawn(MyActor)
+    a << 1 << 'wait1' << 2 << 3 << 'wait2' << 4 << 5
+    eq_(received.clear(), [1, 'wait1'])
+
+    triggers['wait1']()
+    eq_(received.clear(), [2, 3, 'wait2'])
+
+    triggers['wait2']()
+    eq_(received.clear(), [4, 5])
+
+    a << 6
+    eq_(received.clear(), [6])
+
+
 def test_unhandled_message_is_reported():
     """Unhandled messages are reported to Events"""
     spawn = TestNode().spawn
@@ -229,6 +276,455 @@ def test_with_no_receive_method_all_messages_are_unhandled():
         a << 'dummy'
 
 
+def test_messages_only_resembling_system_messages_are_received_normally():
+    """System messages are recognized by their tag and length--anything else is an ordinary message."""
+    spawn = TestNode().spawn
+
+    messages = MockMessages()
+    a = spawn(Props(MockActor, messages))
+    lookalikes = [('_watched',), ('_watched', 1, 2), ('terminated', 1, 2), ('_stop',), '_stopped', ('_error', 1)]
+    for msg in lookalikes:
+        a << msg
+    eq_(messages.clear(), lookalikes)
+
+
+def test_system_messages_can_be_unicode_strings():
+    spawn = TestNode().spawn
+
+    messages = MockMessages()
+    a = spawn(Props(MockActor, messages))
+    a << (u'_unwatched', a) << u'_stop'
+    eq_(messages.clear(), [])
+    ok_(a.is_stopped)
+
+
+def test_on_handlers_receive_the_messages_matching_their_patterns():
+    spawn = TestNode().spawn
+    received = []
+
+    class MyActor(Actor):
+        @on(('publish', ANY, ANY))
+        def publish(self, msg):
+            received.append(('publish', msg))
+
+        @on('purge', ('purge', ANY))
+        def purge(self, msg):
+            received.append(('purge', msg))
+
+        @on(IS_INSTANCE(int))
+        def number(self, msg):
+            received.append(('number', msg))
+
+        @on(ANY)
+        def anything(self, msg):
+            received.append(('anything', msg))
+
+    a = spawn(MyActor)
+    a << ('publish', 1, 2) << 'purge' << ('purge', 1) << 3 << ('publish', 1) << 'foo'
+    eq_(received, [('publish', ('publish', 1, 2)), ('purge', 'purge'), ('purge', ('purge', 1)), ('number', 3),
+                   ('anything', ('publish', 1)), ('anything', 'foo')])
+
+
+def test_messages_not_matching_any_on_handler_are_unhandled():
+    spawn = TestNode().spawn
+
+    class MyActor(Actor):
+        @on('foo')
+        def foo(self, msg):
+            pass
+
+    a = spawn(MyActor)
+    with assert_one_event(UnhandledMessage(a, 'bar')):
+        a << 'bar'
+
+
+def test_on_handlers_of_subclasses_take_precedence_and_can_be_overridden():
+    spawn = TestNode().spawn
+    received = []
+
+    class Base(Actor):
+        @on(('foo', ANY))
+        def foo(self, msg):
+            received.append(('base-foo', msg[1]))
+
+        @on(('bar', ANY))
+        def bar(self, msg):
+            received.append(('base-bar', msg[1]))
+
+    class Derived(Base):
+        @on(('foo', 1))
+        def foo1(self, msg):
+            received.append(('derived-foo1', msg[1]))
+
+        @on(('bar', ANY))
+        def bar(self, msg):
+            received.append(('derived-bar', msg[1]))
+
+    a = spawn(Derived)
+    a << ('foo', 1) << ('foo', 2) << ('bar', 3)
+    eq_(received, [('derived-foo1', 1), ('base-foo', 2), ('derived-bar', 3)])
+
+
+def test_subclasses_of_actors_with_on_handlers_can_override_receive():
+    spawn = TestNode().spawn
+    received = []
+
+    class Base(Actor):
+        @on(('foo', ANY))
+        def foo(self, msg):
+            received.append(msg)
+
+    class Derived(Base):
+        def receive(self, msg):
+            super(Derived, self).receive(('foo', msg))
+
+    a = spawn(Derived)
+    a << 1
+    eq_(received, [('foo', 1)])
+
+
+def test_on_handlers_can_be_coroutines():
+    spawn = TestNode().spawn
+    d = Deferred()
+    received = []
+
+    class MyActor(Actor):
+        @on(('foo', ANY))
+        def foo(self, msg):
+            yield d
+            received.append(msg)
+
+    a = spawn(MyActor)
+    a << ('foo', 1) << ('foo', 2)
+    eq_(received, [])
+    d.callback(None)
+    eq_(received, [('foo', 1), ('foo', 2)])
+
+
+def test_on_handlers_cannot_be_combined_with_receive():
+    with assert_raises(TypeError):
+        class MyActor(Actor):
+            def receive(self, msg):
+                pass
+
+            @on('foo')
+            def foo(self, msg):
+                pass
+
+    with assert_raises(TypeError):
+        class MyProcess(Process):
+            def run(self):
+                yield
+
+            @on('foo')
+            def foo(self, msg):
+                pass
+
+
+##
+## MAILBOXES
+
+def _spawn_busy_actor(factory_cls, received):
+    # returns an actor that blocks on its first message until the returned trigger is called
+    release = Trigger()
+
+    def receive(self, message):
+        received.append(message)
+        if message == 'block':
+            return release
+    a = TestNode().spawn(type(factory_cls.__name__, (factory_cls,), {'receive': receive}))
+    a << 'block'
+    return a, release
+
+
+def test_messages_that_do_not_fit_in_a_full_mailbox_are_dropped_by_default():
+    class MyActor(Actor):
+        mailbox_size = 2
+
+    received = MockMessages()
+    a, release = _spawn_busy_actor(MyActor, received)
+
+    with assert_one_event(MessageDropped(a, 3)):
+        a << 1 << 2 << 3
+
+    release()
+    eq_(received.clear(), ['block', 1, 2])
+
+
+def test_mailbox_can_drop_the_oldest_message_instead():
+    class MyActor(Actor):
+        mailbox_size = 2
+        mailbox_overflow = DropOldest
+
+    received = MockMessages()
+    a, release = _spawn_busy_actor(MyActor, received)
+
+    with assert_one_event(MessageDropped(a, 1)):
+        a << 1 << 2 << 3
+
+    release()
+    eq_(received.clear(), ['block', 2, 3])
+
+
+def test_mailbox_can_send_messages_that_do_not_fit_to_dead_letters():
+    class MyActor(Actor):
+        mailbox_size = 1
+        mailbox_overflow = ToDeadLetters
+
+    received = MockMessages()
+    a, release = _spawn_busy_actor(MyActor, received)
+
+    with assert_one_event(DeadLetter(a, 2)):
+        a << 1 << 2
+
+    release()
+    eq_(received.clear(), ['block', 1])
+
+
+def test_mailbox_with_backpressure_holds_back_messages_and_notifies_the_sender_when_they_are_accepted():
+    class MyActor(Actor):
+        mailbox_size = 1
+        mailbox_overflow = Backpressure
+
+    received = MockMessages()
+    a, release = _spawn_busy_actor(MyActor, received)
+
+    ok_(a.send(1) is None)
+    d2, d3 = a.send(2), a.send(3)
+    ok_(isinstance(d2, Deferred) and isinstance(d3, Deferred))
+    ok_(not d2.called and not d3.called)
+
+    release()
+    ok_(d2.called and d3.called)
+    eq_(received.clear(), ['block', 1, 2, 3])
+
+
+def test_senders_notified_by_backpressure_do_not_get_messages_processed_ahead_of_the_one_that_made_room():
+    class MyActor(Actor):
+        mailbox_size = 1
+        mailbox_overflow = Backpressure
+
+    received = MockMessages()
+    a, release = _spawn_busy_actor(MyActor, received)
+    a << 1
+    a.send(2).addCallback(lambda _: a << '_suspend' << '_resume' << 3)
+
+    release()
+    eq_(received.clear(), ['block', 1, 2, 3])
+
+
+def test_messages_held_back_by_backpressure_go_to_dead_letters_if_the_actor_stops():
+    class MyActor(Actor):
+        mailbox_size = 1
+        mailbox_overflow = Backpressure
+
+    a, release = _spawn_busy_actor(MyActor, [])
+    a << 1
+    d = a.send(2)
+    a.stop()
+
+    dead_letters = []
+    Events.subscribe(DeadLetter, dead_letters.append)
+    release()
+    eq_(dead_letters, [DeadLetter(a, 1), DeadLetter(a, 2)])
+    ok_(d.called)
+
+
+def test_mailbox_can_be_bounded_via_props():
+    received = MockMessages()
+    a = TestNode().spawn(Props(MockActor, received).with_mailbox(1, overflow=ToDeadLetters))
+    a << 'block-free'
+    eq_(received.clear(), ['block-free'])
+
+    a << '_suspend'
+    a << 1
+    with assert_one_event(DeadLetter(a, 2)):
+        a << 2
+    a << '_resume'
+    eq_(received.clear(), [1])
+
+    with assert_raises(TypeError):
+        Props(MockActor, received).with_mailbox(0)
+    with assert_raises(TypeError):
+        Props(MockActor, received).with_mailbox(1, overflow='drop')
+
+
+##
+## SCHEDULING
+
+@simtime
+def test_actors_that_use_up_their_throughput_take_turns_with_other_actors(clock):
+    scheduler = Scheduler(reactor=clock)
+    node = Node(hub=HubWithNoRemoting(), scheduler=scheduler)
+    received = []
+
+    class MyActor(Actor):
+        throughput = 2
+
+        def receive(self, message):
+            received.append(message)
+
+    a, b = node.spawn(MyActor), node.spawn(MyActor)
+    clock.advance(0)
+    scheduler.reset_metrics()
+    for i in range(1, 5):
+        a.send('a%d' % (i,), force_async=True)
+        b.send('b%d' % (i,), force_async=True)
+    eq_(received, [])
+    eq_(scheduler.run_queue_length, 2)
+
+    clock.advance(0)
+    eq_(received, ['a1', 'a2', 'b1', 'b2', 'a3', 'a4', 'b3', 'b4'])
+    eq_(scheduler.run_queue_length, 0)
+    eq_(scheduler.rounds, 2)
+    eq_(scheduler.max_run_queue_length, 2)
+
+
+def test_throughput_does_not_limit_synchronous_delivery():
+    received = []
+    release = Trigger()
+
+    class MyActor(Actor):
+        throughput = 1
+
+        def receive(self, message):
+            received.append(message)
+            if message == 'block':
+                return release
+
+    a = TestNode().spawn(MyActor)
+    a << '_suspend'
+    for i in range(150):
+        a << i
+    a << '_resume'
+    eq_(received, range(150))
+    del received[:]
+
+    a << 'block'
+    for i in range(150):
+        a << i
+    release()
+    eq_(received, ['block'] + range(150))
+
+
+@simtime
+def test_scheduler_measures_the_latency_of_running_scheduled_actors(clock):
+    scheduler = Scheduler(reactor=clock)
+    received = MockMessages()
+    a = Node(hub=HubWithNoRemoting(), scheduler=scheduler).spawn(Props(MockActor, received))
+
+    a.send('foo', force_async=True)
+    eq_(scheduler.run_queue_length, 1)
+    clock.advance(1.0)
+    eq_(received, ['foo'])
+    eq_(scheduler.last_latency, 1.0)
+
+    a.send('bar', force_async=True)
+    clock.advance(3.0)
+    eq_(scheduler.max_latency, 3.0)
+    eq_(scheduler.mean_latency, 2.0)
+
+
+def test_throughput_can_be_set_via_props():
+    received = MockMessages()
+    a = TestNode().spawn(Props(MockActor, received).with_throughput(1))
+    default_scheduler.run_until_idle()
+    default_scheduler.reset_metrics()
+    a.send(1, force_async=True)
+    a.send(2, force_async=True)
+    default_scheduler.run_until_idle()
+    eq_(received.clear(), [1, 2])
+    eq_(default_scheduler.rounds, 2)
+
+    with assert_raises(TypeError):
+        Props(MockActor, received).with_throughput(0)
+
+
+##
+## DISPATCHERS
+
+def test_receive_can_run_in_a_thread_pool_with_sends_carried_out_on_the_reactor_thread():
+    replies = DeferredQueue()
+
+    class Collector(Actor):
+        def receive(self, message):
+            replies.put((message, isInIOThread()))
+
+    class Worker(Actor):
+        dispatcher = 'threadpool'
+        count = 0
+
+        def receive(self, reply_to):
+            self.count += 1
+            reply_to << (self.count, isInIOThread())
+
+    node = TestNode()
+    collector, worker = node.spawn(Collector), node.spawn(Worker)
+    worker << collector << collector << collector
+
+    for i in range(1, 4):
+        eq_((yield replies.get()), ((i, False), True))
+
+
+class _Summer(Actor):
+    dispatcher = 'processpool'
+    total = 0
+
+    def receive(self, (n, reply_to)):
+        self.total += n
+        reply_to << (self.total, os.getpid())
+
+
+def test_receive_can_run_in_a_process_pool_with_the_state_of_the_actor_carried_along():
+    replies = DeferredQueue()
+
+    class Collector(Actor):
+        def receive(self, message):
+            replies.put(message)
+
+    node = TestNode()
+    collector, summer = node.spawn(Collector), node.spawn(_Summer)
+    summer << (1, collector) << (2, collector) << (3, collector)
+
+    for expected in [1, 3, 6]:
+        total, pid = yield replies.get()
+        eq_(total, expected)
+        ok_(pid != os.getpid())
+test_receive_can_run_in_a_process_pool_with_the_state_of_the_actor_carried_along.timeout = 10.0
+
+
+class _Crasher(Actor):
+    dispatcher = 'processpool'
+
+    def receive(self, message):
+        os._exit(1)
+
+
+def test_receive_in_a_process_pool_fails_if_the_worker_process_dies():
+    failures = DeferredQueue()
+
+    class Parent(Actor):
+        def pre_start(self):
+            self.spawn(_Crasher) << 'crash'
+
+        def supervise(self, exc):
+            failures.put(exc)
+            return Stop
+
+    TestNode().spawn(Parent)
+    ok_(isinstance((yield failures.get()), WorkerDied))
+test_receive_in_a_process_pool_fails_if_the_worker_process_dies.timeout = 10.0
+
+
+def test_dispatcher_can_be_set_via_props():
+    with assert_raises(TypeError):
+        Props(MockActor, []).with_dispatcher('nonexistent')
+    received = MockMessages()
+    a = TestNode().spawn(Props(MockActor, received).with_dispatcher('reactor'))
+    a << 1
+    eq_(received, [1])
+
+
 ##
 ## SPAWNING
 
@@ -1137,6 +1633,21 @@ def test_cells_are_garbage_collected_on_termination():
     assert not cell()
 
 
+def test_cells_are_compact_and_always_refer_to_their_actor_through_the_same_ref():
+    a = TestNode().spawn(Actor)
+    cell = a._cell
+    ok_(cell.ref is a)
+    ok_(not hasattr(cell, '__dict__'))
+    ok_(not hasattr(a, '__dict__'))
+    ok_(not hasattr(a.uri, '__dict__'))
+    ok_(cell.priority_inbox is None, "the priority inbox is released once empty")
+    ok_(cell.inbox is None, "the inbox is not allocated before the first message")
+
+    a.stop()
+    ok_(cell.ref is a)
+    ok_(a.is_stopped)
+
+
 def test_messages_to_dead_actors_are_sent_to_dead_letters():
     spawn = TestNode().spawn
 
@@ -1246,6 +1757,8 @@ def test_relative_uri():
 
     eq_(uri, Uri.parse('foo'))
     eq_(uri, 'foo', "Uri.__eq__ supports str")
+    eq_(uri, u'foo', "Uri.__eq__ supports unicode")
+    ok_(uri != u'bar')
 
     ok_(not uri.parent)
     ok_(not uri.node)
@@ -1390,6 +1903,21 @@ def test_uri_hash():
     eq_(hash(Uri.parse('foo')), hash(Uri.parse('foo')))
     eq_(hash(Uri.parse('/foo')), hash(Uri.parse('/foo')))
     eq_(hash(Uri.parse('localhost:123/foo')), hash(Uri.parse('localhost:123/foo')))
+    eq_(hash(Uri.parse('localhost:123') / 'foo'), hash(Uri.parse('localhost:123/foo')))
+
+
+def test_parsing_the_same_uri_again_returns_the_same_instance():
+    ok_(Uri.parse('localhost:123/foo/bar') is Uri.parse('localhost:123/foo/bar'))
+    ok_(pickle.loads(pickle.dumps(Uri.parse('/foo/bar'))) is Uri.parse('/foo/bar'))
+
+
+def test_uris_are_immutable():
+    uri = Uri.parse('localhost:123/foo')
+    with assert_raises(AttributeError):
+        uri.name = 'bar'
+    with assert_raises(AttributeError):
+        uri.whatever = 'bar'
+    eq_(uri, 'localhost:123/foo')
 
 
 ## LOOKUP
@@ -1436,6 +1964,23 @@ def test_looking_up_an_absolute_path_as_if_it_were_relative_just_does_an_absolut
     eq_(a / '/b', root_b)
 
 
+def test_looking_up_a_stopped_actor_fails_and_finds_its_replacement_once_there_is_one():
+    node = TestNode()
+    a = node.spawn(Actor, name='a')
+    b = a._cell.spawn(Actor, name='b')
+    a.stop()
+    with assert_raises(LookupFailed):
+        node.lookup('/a/b')
+    with assert_raises(LookupFailed):
+        node.lookup('/a')
+    ok_(b.is_stopped)
+
+    a2 = node.spawn(Actor, name='a')
+    ok_(node.lookup('/a') is a2)
+    with assert_raises(LookupFailed):
+        node.lookup('/a/b')
+
+
 def test_looking_up_a_non_existent_local_actor_raises_runtime_error():
     node = TestNode()
 
@@ -2730,6 +3275,384 @@ def test_messages_sent_to_nonexistent_remote_actors_are_deadlettered(clock):
         network.simulate(0.2)
 
 
+class _Point(tuple):
+    pass
+
+
+@simtime
+def test_messages_survive_the_wire_formats_unchanged(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor2')
+    local = node1.spawn(Actor, name='actor1')
+
+    messages = [
+        None, True, False, 0, -1, 2 ** 31, -2 ** 63, 5L, 2 ** 100, 1.5, '', 'foo', 'x' * 300, u'\u0161', (), ('foo',),
+        ('foo', (1, ('bar', None)), u'baz'), tuple(range(300)), [1, 2], {'foo': (1,)}, _Point((1, 2)), ('ref', local),
+    ]
+    for serializer in [Compact, FastPickle, Pickle]:
+        node1.hub.SERIALIZER = serializer
+        for msg in messages:
+            node1.lookup('host2:123/actor2') << msg
+        network.simulate(duration=2.0)
+        eq_(received, messages)
+        eq_([type(x) for x in received], [type(x) for x in messages])
+        _, received_ref = received[-1]
+        ok_(not received_ref.is_local and received_ref.uri == local.uri)
+        del received[:]
+
+
+class _TaggedRef(Ref):
+    __slots__ = ()
+
+
+@simtime
+def test_subclasses_of_ref_keep_their_type_and_are_bound_to_the_receiving_node_in_every_wire_format(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor2')
+    local = node1.spawn(Actor, name='actor1')
+    tagged = _TaggedRef(cell=local._cell, uri=local.uri)
+
+    for serializer in [Compact, FastPickle, Pickle]:
+        node1.hub.SERIALIZER = serializer
+        node1.lookup('host2:123/actor2') << ('ref', tagged)
+        network.simulate(duration=2.0)
+        (_, received_ref), = received
+        ok_(type(received_ref) is _TaggedRef)
+        ok_(not received_ref.is_local and received_ref.hub is node2.hub and received_ref.uri == local.uri)
+        del received[:]
+
+
+@simtime
+def test_messages_are_sent_in_the_preferred_wire_format_only_to_nodes_that_can_decode_it(clock):
+    network = MockNetwork(clock)
+    node1 = network.node('host1:123')
+    node1.hub.SERIALIZER = Compact
+    nodes = [network.node('host%d:123' % (i,)) for i in (2, 3, 4)]
+    nodes[1].hub.formats = Pickle.marker + FastPickle.marker
+    nodes[2].hub.formats = Pickle.marker  # like nodes from before wire formats were advertised
+
+    received = []
+    for node in nodes:
+        node.spawn(Props(MockActor, received), name='actor')
+    for node in nodes:
+        node1.lookup('%s/actor' % (node.hub.nodeid,)) << node.hub.nodeid
+    network.simulate(duration=1.0)
+    eq_(sorted(received), ['host2:123', 'host3:123', 'host4:123'])
+
+    for node in nodes:
+        node1.lookup('%s/actor' % (node.hub.nodeid,)) << node.hub.nodeid
+    clock.advance(0)  # messages are sent at the end of the tick
+    sent = dict((dst, payload) for _, dst, (_, payload) in network.queue)
+    eq_(sent['tcp://host2:123'][0], INTERNED)
+    eq_(sent['tcp://host2:123'][5], Compact.marker)
+    eq_(sent['tcp://host3:123'][0], FastPickle.marker)
+    eq_(sent['tcp://host4:123'][0], Pickle.marker)
+
+
+class _BaselinePeer(object):
+    """A node speaking the wire protocol from before wire formats were advertised, as far as tests need it."""
+
+    def __init__(self, network, nodeid):
+        self.addr = 'tcp://' + nodeid
+        self.network = network
+        self.frames, self.received = [], []
+        self.version = 1
+        insock = MockInSocket(addEndpoints=lambda endpoints: network.bind(self.addr, insock, endpoints))
+        insock.gotMultipart = self._got_message
+        insock.addEndpoints([ZmqEndpoint('bind', self.addr)])
+        self.outsocks = {}
+
+    def _outsock(self, addr):
+        if addr not in self.outsocks:
+            self.outsocks[addr] = MockOutSocket(self.addr, self.network)
+            self.outsocks[addr].addEndpoints([ZmqEndpoint('connect', addr)])
+        return self.outsocks[addr]
+
+    def heartbeat(self, addr):
+        self._outsock(addr).sendMultipart((self.addr, PING + struct.pack('!I', self.version)))
+        self.version += 1
+
+    def send(self, addr, path, msg):
+        self._outsock(addr).sendMultipart((self.addr, cPickle.dumps((path, msg), protocol=2)))
+
+    def _got_message(self, (sender_addr, msg)):
+        if msg[0] == PING:
+            struct.unpack('!I', msg[1:])
+        elif msg != DISCONNECT:
+            self.frames.append(msg)
+            self.received.append(pickle.loads(msg))
+
+
+@simtime
+def test_nodes_from_before_wire_formats_were_advertised_can_talk_to_new_nodes(clock):
+    network = MockNetwork(clock)
+    node = network.node('new-host:123')
+    eq_(node.hub.SERIALIZER, FastPickle)
+    old = _BaselinePeer(network, 'old-host:123')
+
+    class Echo(Actor):
+        def receive(self, (sender, i)):
+            sender << ('echo', i, self.ref)
+    echo = node.spawn(Echo, name='echo')
+
+    for _ in range(2):
+        old.heartbeat('tcp://new-host:123')
+        network.simulate(duration=1.0)
+    old_ref = Ref(cell=None, uri=Uri.parse('old-host:123/actor'))  # a ref to an actor of its own, as pickled by it
+    for i in range(3):
+        old.send('tcp://new-host:123', '/echo', (old_ref, i))
+    network.simulate(duration=1.0)
+
+    ok_(all(x[0] == Pickle.marker for x in old.frames), "nodes from before wire formats only get pickles")
+    replies = [msg for path, msg in old.received if path == '/actor']
+    eq_([(tag, i) for tag, i, _ in replies], [('echo', i) for i in range(3)])
+    ok_(all(type(ref) is Ref and ref.uri == echo.uri for _, _, ref in replies))
+    ok_(all(msg == ('_unwatched', node.hub.formats) for path, msg in old.received if path != '/actor'))
+
+
+@simtime
+def test_messages_sent_to_a_node_in_the_same_tick_are_sent_together_in_order(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+    ref = node1.lookup('host2:123/actor')
+    ref << 'init'
+    network.simulate(duration=1.0)
+    del received[:]
+
+    for i in range(10):
+        ref << i
+    eq_(network.queue, [], "messages are held back until the end of the tick")
+    clock.advance(0)
+    eq_(len(network.queue), 1)
+    _, _, (_, frame) = network.queue[0]
+    eq_(frame[0], BATCH)
+    network.simulate(duration=0.1)
+    eq_(received, range(10))
+    del received[:]
+
+    # batches are sent as soon as they are full
+    node1.hub.BATCH_MAX_COUNT = 4
+    for i in range(10):
+        ref << i
+    eq_(len(network.queue), 2)
+    clock.advance(0)
+    eq_(len(network.queue), 3)
+    network.simulate(duration=0.1)
+    eq_(received, range(10))
+    del received[:]
+
+    node1.hub.BATCH_MAX_COUNT = 1000
+    node1.hub.BATCH_DELAY = 0.5
+    ref << 'delayed'
+    network.simulate(duration=0.3)
+    eq_(received, [])
+    network.simulate(duration=0.4)
+    eq_(received, ['delayed'])
+
+
+@simtime
+def test_messages_are_not_batched_to_nodes_that_cannot_decode_batches(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    node2.hub.formats = Pickle.marker + FastPickle.marker
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+    ref = node1.lookup('host2:123/actor')
+    ref << 'init'
+    network.simulate(duration=1.0)
+    del received[:]
+
+    for i in range(3):
+        ref << i
+    eq_([payload[0] for _, _, (_, payload) in network.queue], [FastPickle.marker] * 3)
+    network.simulate(duration=0.1)
+    eq_(received, range(3))
+
+
+@simtime
+def test_paths_of_recipients_are_interned_per_connection_once_acknowledged(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+    ref = node1.lookup('host2:123/actor')
+
+    def sent():
+        clock.advance(0)
+        ret = [payload for _, _, (_, payload) in network.queue]
+        network.simulate(duration=0.1)
+        return ret
+
+    node2.spawn(Props(MockActor, []), name='other')
+    node1.lookup('host2:123/other') << 'init'
+    network.simulate(duration=1.0)
+
+    # the messages sent before the acknowledgement arrives intern the path themselves
+    ref << 1
+    ref << 2
+    frame, = sent()
+    eq_([x[0] for x in _unbatch(frame)], [INTERN, INTERN])
+    ok_('/actor' in frame)
+
+    ref << 3
+    payload, = sent()
+    eq_(payload[0], INTERNED)
+    ok_('/actor' not in payload)
+    eq_(received, [1, 2, 3])
+
+    # interned paths are forgotten when the remote node restarts
+    node1.hub.connections['tcp://host2:123'].remote_restarted()
+    ref << 4
+    payload, = sent()
+    eq_(payload[0], INTERN)
+    eq_(received, [1, 2, 3, 4])
+
+
+@simtime
+def test_paths_are_interned_again_if_the_receiving_node_has_closed_the_connection_without_the_sender_knowing(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    received = []
+    node2.spawn(Props(MockActor, received), name='sink')
+    ref = node1.lookup('host2:123/sink')
+    for i in range(40):
+        ref << i
+        network.simulate(duration=0.05)
+    network.simulate(duration=1.0)
+    eq_(received, range(40))
+    conn = node1.hub.connections['tcp://host2:123']
+
+    # node2 closes its end but its `DISCONNECT` is lost
+    network.packet_loss(100.0, src='tcp://host2:123', dst='tcp://host1:123')
+    node2.hub.connections.pop('tcp://host1:123').close()
+    network.simulate(duration=0.5)
+    network.packet_loss(0.0, src='tcp://host2:123', dst='tcp://host1:123')
+    ok_(node1.hub.connections['tcp://host2:123'] is conn)
+
+    del received[:]
+    for i in range(50):
+        ref << i
+        network.simulate(duration=0.05)
+    network.simulate(duration=1.0)
+    ok_(len(received) >= 48, received)  # only those in flight until the sender has been told are lost
+    eq_(received[-10:], range(40, 50))
+
+
+@simtime
+def test_paths_are_not_interned_beyond_the_limit_or_to_nodes_that_cannot_decode_interned_paths(clock):
+    network = MockNetwork(clock)
+    node1, node2, node3 = network.node('host1:123'), network.node('host2:123'), network.node('host3:123')
+    node1.hub.MAX_INTERNED_PATHS = 1
+    node3.hub.formats = FastPickle.marker
+    received = []
+    for node in (node2, node3):
+        node.spawn(Props(MockActor, received), name='actor1')
+        node.spawn(Props(MockActor, received), name='actor2')
+    for node in (node2, node3):
+        node1.lookup('%s/actor1' % (node.hub.nodeid,)) << 'init'
+    network.simulate(duration=1.0)
+
+    for node in (node2, node3):
+        node1.lookup('%s/actor1' % (node.hub.nodeid,)) << 1
+        node1.lookup('%s/actor2' % (node.hub.nodeid,)) << 2
+    clock.advance(0)
+    sent = dict((dst, payload) for _, dst, (_, payload) in network.queue)
+    eq_([x[0] for x in _unbatch(sent['tcp://host2:123'])], [INTERNED, FastPickle.marker])
+    network.simulate(duration=0.1)
+    eq_(sorted(received), [1, 1, 2, 2, 'init', 'init'])
+
+
+@simtime
+def test_large_binary_members_of_messages_are_sent_out_of_band_without_copying(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    node1.hub.OUT_OF_BAND_MIN_SIZE = 100
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+    ref = node1.lookup('host2:123/actor')
+    ref << 'init'
+    network.simulate(duration=1.0)
+    del received[:]
+
+    chunk, view = 'x' * 100, memoryview(bytearray('y' * 200))
+    ref << 'first'
+    ref << ('chunk', chunk, 'z' * 99, view)
+    ref << 'last'
+    clock.advance(0)
+    packets = [parts for _, _, parts in network.queue]
+    eq_(len(packets[1]), 4)
+    ok_(packets[1][2] is chunk and packets[1][3] is view)
+    eq_(packets[1][1][0], OUT_OF_BAND)
+    network.simulate(duration=0.1)
+    eq_(received[0], 'first')
+    eq_(received[2], 'last')
+    _, got_chunk, small, got_view = received[1]
+    eq_((got_chunk, small), (chunk, 'z' * 99))
+    eq_(type(got_chunk), str)
+    ok_(isinstance(got_view, memoryview))
+    eq_(got_view.tobytes(), 'y' * 200)
+    del received[:]
+
+    ref << chunk
+    eq_(len(network.queue[0][2]), 3)
+    network.simulate(duration=0.1)
+    eq_(received, [chunk])
+    del received[:]
+
+    node1.hub.OUT_OF_BAND_MIN_SIZE = None
+    ref << ('chunk', chunk)
+    clock.advance(0)
+    eq_(len(network.queue[0][2]), 2)
+    network.simulate(duration=0.1)
+    eq_(received, [('chunk', chunk)])
+
+
+@simtime
+def test_large_frames_are_compressed_if_that_makes_them_smaller(clock):
+    network = MockNetwork(clock)
+    node1 = network.node('host1:123')
+    node1.hub.COMPRESSION_MIN_SIZE = 1000
+    nodes = [network.node('host%d:123' % (i,)) for i in (2, 3, 4)]
+    node1.hub.compression_by_node['host3:123'] = None
+    nodes[2].hub.formats = FastPickle.marker
+    received = []
+    for node in nodes:
+        node.spawn(Props(MockActor, received), name='actor')
+    refs = [node1.lookup('%s/actor' % (node.hub.nodeid,)) for node in nodes]
+    for ref in refs:
+        ref << 'init'
+    network.simulate(duration=1.0)
+    del received[:]
+
+    def sent(ref, msg):
+        ref << msg
+        clock.advance(0)
+        (_, _, (_, frame)), = network.queue
+        network.simulate(duration=0.1)
+        eq_(received, [msg])
+        del received[:]
+        return frame
+
+    state = ('state', 'abc' * 1000)
+    eq_(sent(refs[0], state)[0], COMPRESSED)
+    ok_(len(sent(refs[0], state)) < 1000)
+    ok_(sent(refs[0], ('state', 'abc' * 100))[0] != COMPRESSED)
+    ok_(sent(refs[0], ('state', os.urandom(2000)))[0] != COMPRESSED)
+    ok_(sent(refs[1], state)[0] != COMPRESSED)
+    ok_(sent(refs[2], state)[0] != COMPRESSED)
+
+
+
+
+
 ## HEARTBEAT
 
 @simtime
@@ -2770,6 +3693,309 @@ def test_sending_to_an_unknown_host_that_becomes_visible_in_time(clock):
     assert actor2_msgs == ['foo']
 
 
+@simtime
+def test_messages_queued_for_an_unconnected_node_are_subject_to_the_queue_size_limit(clock):
+    network = MockNetwork(clock)
+
+    node1 = network.node('host1:123')
+    node1.hub.QUEUE_SIZE = 1
+
+    ref = node1.lookup('host2:123/actor1')
+    ref << 'foo'
+    with assert_one_event(MessageDropped(ref, 'bar')):
+        ref << 'bar'
+
+    node1.hub.QUEUE_OVERFLOW = Backpressure
+    d = ref.send('baz')
+    ok_(isinstance(d, Deferred))
+
+    node2 = network.node('host2:123')
+    actor2_msgs = []
+    node2.spawn(Props(MockActor, actor2_msgs), name='actor1')
+
+    network.simulate(duration=3.0)
+
+    ok_(d.called)
+    eq_(actor2_msgs, ['foo', 'baz'])
+
+
+@simtime
+def test_system_messages_queued_for_an_unconnected_node_are_not_subject_to_the_queue_size_limit(clock):
+    network = MockNetwork(clock)
+
+    node1 = network.node('host1:123')
+    node1.hub.QUEUE_SIZE = 1
+
+    ref = node1.lookup('host2:123/actor1')
+    ref << 'foo'
+    with assert_event_not_emitted(MessageDropped):
+        ref << '_stop'
+
+    node2 = network.node('host2:123')
+    actor2 = node2.spawn(Actor, name='actor1')
+
+    network.simulate(duration=3.0)
+
+    ok_(actor2.is_stopped)
+
+
+@simtime
+def test_messages_to_a_node_whose_address_is_being_resolved_are_queued_until_it_is_resolved(clock):
+    from spinoff.actor import remoting
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+
+    pending = Deferred()
+    resolve_async, remoting.resolve_async = remoting.resolve_async, lambda hostname, reactor: pending
+    try:
+        ref = node1.lookup('host2:123/actor')
+        ref << 'foo'
+        ref << 'bar'
+    finally:
+        remoting.resolve_async = resolve_async
+    network.simulate(duration=3.0)
+    eq_(received, [])
+    eq_(network.queue, [])
+
+    pending.callback('host2')
+    network.simulate(duration=1.0)
+    eq_(received, ['foo', 'bar'])
+
+
+@simtime
+def test_nodes_stop_granting_credits_while_their_actors_cannot_keep_up(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    node1.hub.FLOW_CONTROL_WINDOW = 4
+    node1.hub.QUEUE_SIZE = 10
+    node1.hub.QUEUE_OVERFLOW = Backpressure
+    node2.hub.FLOW_CONTROL_INBOX_LIMIT = 2
+
+    received = []
+    busy = Deferred()
+
+    class SlowActor(Actor):
+        def receive(self, msg):
+            received.append(msg)
+            return busy
+
+    node2.spawn(Actor, name='other')
+    slow = node2.spawn(SlowActor, name='slow')
+    node1.lookup('host2:123/other') << 'init'
+    network.simulate(duration=1.0)
+
+    ref = node1.lookup('host2:123/slow')
+    ds = [ref.send(i) for i in range(20)]
+    network.simulate(duration=1.0)
+    eq_(received, [0])
+    eq_(len(slow._cell.inbox), 3)
+    metrics = node1.hub.flow_control_metrics()['host2:123']
+    eq_((metrics['credits'], metrics['backlog']), (0, 10))
+    ok_(node2.hub.flow_control_metrics()['host1:123']['withheld_grants'] > 0)
+    ok_(not any(isinstance(d, Deferred) for d in ds[:14]))
+    ok_(all(isinstance(d, Deferred) and not d.called for d in ds[14:]))
+
+    busy.callback(None)
+    network.simulate(duration=2.0)
+    eq_(received, range(20))
+    ok_(all(d.called for d in ds[14:]))
+    metrics = node1.hub.flow_control_metrics()['host2:123']
+    eq_((metrics['credits'], metrics['backlog']), (4, 0))
+
+
+@simtime
+def test_framework_messages_and_heartbeats_are_not_held_up_by_a_backlog_of_regular_messages(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    node1.hub.FLOW_CONTROL_WINDOW = 2
+    node2.hub.FLOW_CONTROL_INBOX_LIMIT = 0
+    busy = Deferred()
+
+    class SlowActor(Actor):
+        def receive(self, msg):
+            return busy
+
+    slow = node2.spawn(SlowActor, name='slow')
+    watchee = node2.spawn(Actor, name='watchee')
+    for i in range(10):
+        node1.lookup('host2:123/slow') << i
+    network.simulate(duration=1.0)
+    eq_(node1.hub.flow_control_metrics()['host2:123']['backlog'], 8)
+
+    terminated = []
+
+    class Watcher(Actor):
+        def pre_start(self):
+            self.watch(self.root.node.lookup('host2:123/watchee'))
+
+        def receive(self, msg):
+            terminated.append(msg)
+    node1.spawn(Watcher)
+    network.simulate(duration=1.0)
+    eq_(node1.hub.flow_control_metrics()['host2:123']['backlog'], 0, "the backlog is sent before the watch request")
+    eq_(len(slow._cell.inbox), 9)
+    watchee.stop()
+    network.simulate(duration=5.0)
+    eq_(terminated, [('terminated', node1.lookup('host2:123/watchee'))])
+    ok_(node1.hub.connections.get('tcp://host2:123') and node2.hub.connections.get('tcp://host1:123'))
+    busy.callback(None)
+
+
+@simtime
+def test_remote_watchers_get_the_messages_sent_by_an_actor_before_its_termination(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    node2.hub.FLOW_CONTROL_WINDOW = 2
+    node1.hub.FLOW_CONTROL_INBOX_LIMIT = 0
+    busy = Deferred()
+    received = []
+
+    class Watcher(Actor):
+        def pre_start(self):
+            self.watch(self.root.node.lookup('host2:123/watchee'))
+
+        def receive(self, msg):
+            received.append(msg)
+            return busy if msg == 0 else None
+
+    class Watchee(Actor):
+        def receive(self, msg):
+            for i in range(10):
+                self.root.node.lookup('host1:123/watcher') << i
+            self.stop()
+
+    watchee = node2.spawn(Watchee, name='watchee')
+    node1.spawn(Watcher, name='watcher')
+    network.simulate(duration=1.0)
+    watchee << 'go'
+    network.simulate(duration=1.0)
+    busy.callback(None)
+    network.simulate(duration=2.0)
+    eq_(received, range(10) + [('terminated', node1.lookup('host2:123/watchee'))])
+
+
+@simtime
+def test_messages_can_be_sent_without_waiting_for_the_handshake_and_are_sent_again_if_the_node_has_restarted(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+    ref = node1.lookup('host2:123/actor')
+
+    ref << 'foo'
+    network.transmit()
+    eq_(received, [])  # still waiting for the handshake
+    network.simulate(duration=1.0)
+    eq_(received, ['foo'])
+    del received[:]
+
+    node3 = network.node('host3:123')
+    node3.hub.OPTIMISTIC_SEND = True
+    node3.lookup('host2:123/actor') << 'bar'
+    network.transmit()
+    eq_(received, ['bar'])
+    conn = node3.hub.connections['tcp://host2:123']
+    eq_([msg for _, _, msg in conn.unconfirmed], ['bar'])
+
+    # the handshake shows that host2 has restarted (before it has granted credits for 'bar')
+    network.transmit()
+    eq_(len(conn.unconfirmed), 1)
+    conn.remote_restarted()
+    network.simulate(duration=1.0)
+    eq_(received, ['bar', 'bar'])
+
+    # otherwise, they are no longer kept once the node has granted credits for them
+    node4 = network.node('host4:123')
+    node4.hub.OPTIMISTIC_SEND = True
+    node4.lookup('host2:123/actor') << 'baz'
+    network.transmit()
+    ok_(node4.hub.connections['tcp://host2:123'].unconfirmed)
+    network.simulate(duration=1.0)
+    eq_(node4.hub.connections['tcp://host2:123'].unconfirmed, None)
+    eq_(received, ['bar', 'bar', 'baz'])
+
+
+@simtime
+def test_connections_to_seed_nodes_are_established_at_startup(clock):
+    network = MockNetwork(clock)
+    node2 = network.node('host2:123')
+    node1 = network.node('host1:123', seeds=['host2:123', 'host1:123'])
+    eq_(node1.hub.connections.keys(), ['tcp://host2:123'])
+    network.simulate(duration=0.5)
+    ok_(node1.hub.connections['tcp://host2:123'].is_active)
+
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+    node1.lookup('host2:123/actor') << 'foo'
+    clock.advance(0)
+    network.transmit()
+    eq_(received, ['foo'])
+
+
+@simtime
+def test_nodes_on_the_same_host_connect_over_unix_sockets(clock):
+    ipc_dir = tempfile.mkdtemp()
+    try:
+        network = MockNetwork(clock)
+        node1 = network.node('localhost:123', ipc_dir=ipc_dir)
+        node2 = network.node('localhost:124', ipc_dir=ipc_dir)
+        node3 = network.node('localhost:125')
+        node4 = network.node('host4:123', ipc_dir=ipc_dir)
+        received = []
+        for node in (node2, node3, node4):
+            node.spawn(Props(MockActor, received), name='actor')
+
+        for nodeid in ('localhost:124', 'localhost:125', 'host4:123'):
+            node1.lookup(nodeid + '/actor') << nodeid
+        network.simulate(duration=1.0)
+        eq_(sorted(received), ['host4:123', 'localhost:124', 'localhost:125'])
+
+        endpoint = lambda nodeid: node1.hub.connections['tcp://' + nodeid].sock.endpoint_addr
+        eq_(endpoint('localhost:124'), 'ipc://' + os.path.join(ipc_dir, 'spinoff-localhost:124.sock'))
+        eq_(endpoint('localhost:125'), 'tcp://localhost:125')  # not listening on a Unix socket
+        eq_(endpoint('host4:123'), 'tcp://host4:123')  # not on this host
+        eq_(node2.hub.connections['tcp://localhost:123'].control_sock.endpoint_addr,
+            'ipc://' + os.path.join(ipc_dir, 'spinoff-localhost:123.sock'))
+    finally:
+        shutil.rmtree(ipc_dir)
+
+
+@simtime
+def test_routers_forward_messages_to_the_workers_of_a_node_group_in_turn(clock):
+    network = MockNetwork(clock)
+    nodeids = worker_nodeids('host1:123', 2)
+    eq_(nodeids, ['host1:124', 'host1:125'])
+    node = network.node('host1:123', seeds=nodeids)
+    workers = [network.node(nodeid) for nodeid in nodeids]
+    received = [[], []]
+    actors = [worker.spawn(Props(MockActor, x), name='actor') for worker, x in zip(workers, received)]
+    router = node.spawn(Router.using(nodeids=nodeids, name='actor'), name='actor')
+    network.simulate(duration=1.0)
+
+    for i in range(4):
+        router << i
+    network.simulate(duration=1.0)
+    eq_(received, [[0, 2], [1, 3]])
+
+    # workers that are down are left out until they are expected to be back
+    actors[0].stop()
+    network.simulate(duration=1.0)
+    for i in range(4, 6):
+        router << i
+    network.simulate(duration=0.5)
+    eq_(received, [[0, 2], [1, 3, 4, 5]])
+
+    workers[0].spawn(Props(MockActor, received[0]), name='actor')
+    network.simulate(duration=Router.RETRY_INTERVAL)
+    for i in range(6, 8):
+        router << i
+    network.simulate(duration=1.0)
+    eq_(sorted(received[0][2:] + received[1][4:]), [6, 7])
+    ok_(received[0][2:])
+
+
 @simtime
 def test_sending_stops_if_visibility_is_lost(clock):
     network = MockNetwork(clock)
@@ -2823,6 +4049,99 @@ def test_sending_resumes_if_visibility_is_restored(clock):
         network.simulate(duration=2.0)
 
 
+@simtime
+def test_heartbeats_are_only_sent_to_nodes_nothing_else_is_sent_to(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('host1:123'), network.node('host2:123')
+    received = []
+    node2.spawn(Props(MockActor, received), name='actor')
+    ref = node1.lookup('host2:123/actor')
+    ref << 'init'
+    network.simulate(duration=2.0)
+
+    heartbeats = []
+    conn = node1.hub.connections['tcp://host2:123']
+    heartbeat = conn.heartbeat
+    conn.heartbeat = lambda: (heartbeats.append(clock.seconds()), heartbeat())
+
+    for _ in range(50):
+        ref << 'tick'
+        network.simulate(duration=0.1)
+    eq_(heartbeats, [])
+    eq_(len(received), 51)
+
+    # the other direction is idle, so heartbeats keep flowing there, and the connection stays up in both directions
+    network.simulate(duration=node1.hub.HEARTBEAT_MAX_SILENCE + 1.0)
+    ok_(node1.hub.connections.get('tcp://host2:123') is conn and node2.hub.connections)
+    ok_(heartbeats)
+    del conn.heartbeat
+
+
+@simtime
+def test_nodes_with_a_history_of_regular_heartbeats_are_detected_to_be_down_long_before_the_maximum_silence(clock):
+    def test_it(phi_threshold):
+        network = MockNetwork(clock)
+        node1, node2 = network.node('watcher-host:123'), network.node('watchee-host:123')
+        node1.hub.PHI_THRESHOLD = phi_threshold
+
+        received = Latch()
+
+        class Watcher(Actor):
+            def pre_start(self):
+                self.watch(self.root.node.lookup('watchee-host:123/remote-watchee'))
+
+            def receive(self, msg):
+                received()
+        node1.spawn(Watcher)
+        node2.spawn(Actor, name='remote-watchee')
+
+        network.simulate(duration=10.0)
+        ok_(node1.hub.suspicion('watchee-host:123') < 1.0)
+        assert not received
+
+        network.packet_loss(100.0, src='tcp://watchee-host:123', dst='tcp://watcher-host:123')
+        network.simulate(duration=4.0)
+        ok_(not received)
+        network.simulate(duration=3.5)
+        return bool(received)
+
+    ok_(test_it(phi_threshold=8.0))
+    ok_(not test_it(phi_threshold=None))
+
+
+@simtime
+def test_nodes_that_go_idle_after_heavy_traffic_are_not_detected_to_be_down_by_a_short_stall(clock):
+    network = MockNetwork(clock)
+    node1, node2 = network.node('watcher-host:123'), network.node('watchee-host:123')
+
+    received = Latch()
+
+    class Watcher(Actor):
+        def pre_start(self):
+            self.watch(self.root.node.lookup('watchee-host:123/remote-watchee'))
+
+        def receive(self, msg):
+            if msg != 'traffic':
+                received()
+    node1.spawn(Watcher, name='watcher')
+    node2.spawn(Actor, name='remote-watchee')
+    network.simulate(duration=2.0)
+
+    watcher = node2.lookup('watcher-host:123/watcher')
+    for _ in range(300):
+        watcher << 'traffic'
+        network.simulate(duration=0.01, step=0.01)
+    network.simulate(duration=0.5)
+
+    network.packet_loss(100.0, src='tcp://watchee-host:123', dst='tcp://watcher-host:123')
+    network.simulate(duration=0.9)
+    network.packet_loss(0.0, src='tcp://watchee-host:123', dst='tcp://watcher-host:123')
+    for _ in range(50):
+        ok_(node1.hub.suspicion('watchee-host:123') < node1.hub.PHI_THRESHOLD)
+        network.simulate(duration=0.1)
+    ok_(not received)
+
+
 ## REMOTE NAME-TO-PORT MAPPING
 
 def test_TODO_node_identifiers_are_mapped_to_addresses_on_the_network():
@@ -3361,6 +4680,28 @@ def test_process_can_get_messages_selectively():
     assert 321 not in messages and 32.1 in messages
 
 
+def test_process_gets_stashed_messages_in_order_of_arrival_whatever_the_patterns():
+    spawn = TestNode().spawn
+
+    messages = []
+    release = Trigger()
+
+    class MyProc(Process):
+        def run(self):
+            yield release
+            messages.append((yield self.get(('reply', 2))))
+            messages.append((yield self.get(('reply', ANY), 'done')))
+            messages.append((yield self.get(IS_INSTANCE(int), ('other', ANY))))
+            messages.append((yield self.get('done')))
+            while True:
+                messages.append((yield self.get()))
+
+    p = spawn(MyProc)
+    p << ('other', 1) << ('reply', 1) << 5 << ('reply', 2) << 'done' << u'late'
+    release()
+    eq_(messages, [('reply', 2), ('reply', 1), ('other', 1), 'done', 5, u'late'])
+
+
 def test_process_can_delegate_handling_of_caught_exceptions_to_parent():
     spawn = TestNode().spawn
 
@@ -0,0 +1,53 @@
+from twisted.trial import unittest
+
+from spinoff.actor.failuredetector import PhiAccrualFailureDetector
+
+
+class PhiAccrualFailureDetectorTestCase(unittest.TestCase):
+
+    def _detector(self, intervals, **kwargs):
+        x = PhiAccrualFailureDetector(**dict(dict(max_samples=100, min_std_deviation=0.1, acceptable_pause=0.0),
+                                             **kwargs))
+        t = 0.0
+        x.heartbeat(t)
+        for interval in intervals:
+            t += interval
+            x.heartbeat(t)
+        return x, t
+
+    def test_there_is_no_suspicion_without_history(self):
+        x = PhiAccrualFailureDetector(max_samples=100, min_std_deviation=0.1, acceptable_pause=0.0)
+        self.assertIsNone(x.phi(10.0))
+        x.heartbeat(0.0)
+        self.assertIsNone(x.phi(10.0))
+        x.heartbeat(1.0)
+        self.assertIsNotNone(x.phi(10.0))
+
+    def test_suspicion_grows_with_silence(self):
+        x, t = self._detector([1.0] * 10)
+        phis = [x.phi(t + dt) for dt in (0.0, 0.5, 1.0, 1.5, 2.0, 3.0, 100.0)]
+        self.assertEqual(phis, sorted(phis))
+        self.assertLess(phis[1], 0.1)
+        self.assertGreater(phis[4], 8.0)
+        x.heartbeat(t + 1.0)
+        self.assertLess(x.phi(t + 1.5), 0.1)
+
+    def test_jittery_histories_are_given_more_time(self):
+        regular, t1 = self._detector([1.0] * 20)
+        jittery, t2 = self._detector([0.2, 1.8] * 10)
+        self.assertGreater(regular.phi(t1 + 2.0), jittery.phi(t2 + 2.0))
+
+    def test_acceptable_pause_delays_suspicion(self):
+        x, t = self._detector([1.0] * 10, acceptable_pause=2.0)
+        self.assertLess(x.phi(t + 2.5), 0.1)
+        self.assertGreater(x.phi(t + 4.0), 8.0)
+
+    def test_bursts_of_arrivals_do_not_shorten_the_time_allowed_beyond_the_minimum_interval(self):
+        x, t = self._detector([0.01] * 100, min_interval=1.0, acceptable_pause=2.0)
+        self.assertLess(x.phi(t + 2.5), 0.1)
+        self.assertGreater(x.phi(t + 4.0), 8.0)
+
+    def test_only_the_latest_samples_are_considered(self):
+        x, t = self._detector([5.0] * 10 + [1.0] * 10, max_samples=10)
+        y, t = self._detector([1.0] * 10, max_samples=10)
+        self.assertAlmostEqual(x.phi(x.last + 1.5), y.phi(y.last + 1.5))
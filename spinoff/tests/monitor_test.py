@@ -0,0 +1,65 @@
+from nose.tools import eq_
+from twisted.internet.defer import Deferred
+
+from spinoff.actor import Actor
+from spinoff.contrib.monitoring import monitor
+from spinoff.util.pattern_matching import ANY
+from spinoff.util.testing import deferred_result, TestNode
+from spinoff.util.testing.actor import wrap_globals
+
+
+def test_filters_that_cannot_be_compiled_are_compared_with_the_subject_on_the_left():
+    m = _spawn_monitor()
+    client = TestNode().spawn(Actor, name='client')
+    m << ('state', client, 'fine')
+
+    eq_(_ask(m, 'get-state', client), [(str(client.uri), 'fine')])
+    eq_(_ask(m, 'get-state', _Everything()), [], "Ref.__eq__ has the first say and only takes Refs")
+    eq_([uri for uri, _, _, _ in _ask(m, 'get-all', _Everything())], [str(client.uri)],
+        "str.__eq__ leaves it to the filter")
+
+
+def test_filters_of_plain_values_and_matchers_are_compiled_with_the_same_result():
+    m = _spawn_monitor()
+    client = TestNode().spawn(Actor, name='client')
+    m << ('state', client, 'fine')
+
+    eq_(_ask(m, 'get-all', str(client.uri)), [(str(client.uri), 'up', _ANY_TIME, 'fine')])
+    eq_(_ask(m, 'get-all', 'whatever'), [])
+    eq_(_ask(m, 'get-state', ANY), [(str(client.uri), 'fine')])
+    eq_(_ask(m, 'get-state', str(client.uri)), [], "Refs don't equal strings")
+
+
+# SUPPORT
+
+class _Everything(object):
+    def __eq__(self, other):
+        return True
+
+
+class _AnyTime(object):
+    def __eq__(self, other):
+        return isinstance(other, float)
+_ANY_TIME = _AnyTime()
+
+
+class _NoServer(object):
+    def stopListening(self):
+        pass
+
+
+def _spawn_monitor():
+    run_server, monitor.run_server = monitor.run_server, lambda actor: _NoServer()
+    try:
+        return TestNode().spawn(monitor.Monitor)
+    finally:
+        monitor.run_server = run_server
+
+
+def _ask(m, query, filter):
+    d = Deferred()
+    m << (query, d, filter)
+    return deferred_result(d)
+
+
+wrap_globals(globals())
@@ -0,0 +1,64 @@
+from twisted.internet.defer import Deferred
+from twisted.internet.error import DNSLookupError
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+
+from spinoff.actor import resolv
+
+
+class _Reactor(Clock):
+    """A `Clock` with a resolver whose lookups are answered by the test."""
+
+    def __init__(self):
+        Clock.__init__(self)
+        self.lookups = []
+
+    def resolve(self, hostname):
+        d = Deferred()
+        self.lookups.append((hostname, d))
+        return d
+
+
+class ResolveAsyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        resolv._cache.clear()
+        self.reactor = _Reactor()
+
+    def _resolve(self, hostname):
+        results = []
+        resolv._resolve_cached(hostname, self.reactor).addBoth(results.append)
+        return results
+
+    def test_concurrent_resolutions_share_a_lookup_and_results_are_cached(self):
+        r1, r2 = self._resolve('example.com'), self._resolve('example.com')
+        self.assertEqual(len(self.reactor.lookups), 1)
+        self.assertEqual((r1, r2), ([], []))
+        self.reactor.lookups[0][1].callback('10.0.0.1')
+        self.assertEqual((r1, r2), (['10.0.0.1'], ['10.0.0.1']))
+
+        self.reactor.advance(resolv.CACHE_TTL - 1)
+        self.assertEqual(self._resolve('example.com'), ['10.0.0.1'])
+        self.assertEqual(len(self.reactor.lookups), 1)
+
+        self.reactor.advance(2)
+        self.assertEqual(self._resolve('example.com'), [])
+        self.assertEqual(len(self.reactor.lookups), 2)
+
+    def test_failures_are_cached_for_a_shorter_time(self):
+        r = self._resolve('nonexistent.example.com')
+        self.reactor.lookups[0][1].errback(DNSLookupError())
+        r[0].trap(DNSLookupError)
+
+        self._resolve('nonexistent.example.com')[0].trap(DNSLookupError)
+        self.assertEqual(len(self.reactor.lookups), 1)
+
+        self.reactor.advance(resolv.NEGATIVE_CACHE_TTL + 1)
+        self._resolve('nonexistent.example.com')
+        self.assertEqual(len(self.reactor.lookups), 2)
+
+    def test_ip_addresses_are_not_looked_up(self):
+        results = []
+        resolv.resolve_async('10.0.0.1', self.reactor).addCallback(results.append)
+        self.assertEqual(results, ['10.0.0.1'])
+        self.assertEqual(self.reactor.lookups, [])
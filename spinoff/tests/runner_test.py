@@ -0,0 +1,62 @@
+from twisted.internet.error import ProcessDone, ProcessTerminated
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+
+from spinoff.actor.runner import WorkerGroup
+
+
+class _Transport(object):
+
+    def __init__(self):
+        self.signals = []
+
+    def signalProcess(self, signal):
+        self.signals.append(signal)
+
+
+class _Reactor(Clock):
+    """A `Clock` that records the processes spawned instead of spawning them."""
+
+    def __init__(self):
+        Clock.__init__(self)
+        self.spawned = []
+
+    def spawnProcess(self, process, executable, args, env):
+        process.makeConnection(_Transport())
+        self.spawned.append((process, args))
+
+
+class WorkerGroupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = _Reactor()
+        self.group = WorkerGroup(['localhost:124', 'localhost:125'], ['--actor', 'x.Y', '--name', 'y'],
+                                 reactor=self.reactor)
+        self.group.startService()
+
+    def test_workers_are_started_as_startnode_processes_and_restarted_when_they_exit(self):
+        self.assertEqual(len(self.reactor.spawned), 2)
+        for (_, args), nodeid in zip(self.reactor.spawned, ['localhost:124', 'localhost:125']):
+            self.assertEqual(args[-7:], ['startnode', '--remoting', nodeid, '--actor', 'x.Y', '--name', 'y'])
+
+        process, _ = self.reactor.spawned[0]
+        process.processEnded(Failure(ProcessTerminated(exitCode=1)))
+        self.assertEqual(len(self.reactor.spawned), 2)
+        self.reactor.advance(WorkerGroup.RESTART_DELAY)
+        self.assertEqual(len(self.reactor.spawned), 3)
+        self.assertIn('localhost:124', self.reactor.spawned[2][1])
+
+    def test_workers_are_terminated_and_not_restarted_when_the_group_is_stopped(self):
+        process, _ = self.reactor.spawned[0]
+        process.processEnded(Failure(ProcessTerminated(exitCode=1)))
+        stopped = []
+        self.group.stopService().addCallback(stopped.append)
+        running = [process for process, _ in self.reactor.spawned[1:]]
+        self.assertEqual([x.transport.signals for x in running], [['TERM']])
+        self.assertEqual(stopped, [])
+
+        running[0].processEnded(Failure(ProcessDone(0)))
+        self.assertEqual(len(stopped), 1)
+        self.reactor.advance(WorkerGroup.RESTART_DELAY)
+        self.assertEqual(len(self.reactor.spawned), 2)
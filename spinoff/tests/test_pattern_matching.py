@@ -1,5 +1,6 @@
 from spinoff.util.testing import assert_not_raises
-from spinoff.util.pattern_matching import match, ANY, IGNORE, IS_INSTANCE, NOT
+from spinoff.util.pattern_matching import (
+    match, compile, compile_always, compilable, PatternIndex, ANY, IGNORE, IS_INSTANCE, NOT, OR, EQ, IN)
 
 
 FLATTEN = True
@@ -126,3 +127,78 @@ def test_or():
     assert (IS_INSTANCE(int) | IS_INSTANCE(float)) == 3
     assert (IS_INSTANCE(int) | IS_INSTANCE(float)) == 3.3
     assert not ((IS_INSTANCE(int) | IS_INSTANCE(float)) == 'hello')
+
+
+def test_long_tuples():
+    subject = tuple(range(1000))
+    assert match(subject, subject)
+    assert not match(subject, subject + (1000,))
+    assert not match(subject + (1000,), subject)
+    assert match((ANY,) * 1000, subject, flatten=False) == (True, subject)
+
+
+def test_compiled_patterns_are_equivalent_to_comparison():
+    class Foo(object):
+        pass
+    foo = Foo()
+
+    class Strict(object):
+        def __eq__(self, other):
+            return type(other) is Strict
+    strict = Strict()
+    patterns = [
+        'foo', 1, None, (), ('foo',), ('foo', ANY), ('foo', 1, ANY), ('foo', ('bar', ANY)), ('foo', IS_INSTANCE(int)),
+        ('foo', NOT(IS_INSTANCE(int))), ('foo', IS_INSTANCE(int) | IS_INSTANCE(float)), ('foo', EQ(1)), ('foo', foo),
+        ('foo', IN([1, 2])), ANY, IS_INSTANCE(tuple), OR(), OR('foo', ('bar', ANY)), ('foo', IN([strict])),
+    ]
+    subjects = [
+        'foo', u'foo', 'bar', 1, 1.0, True, None, (), ('foo',), ('foo', 1), ('foo', 1.0), ('foo', 'bar'), ('foo', 1, 2),
+        ('foo', ('bar', 1)), ('foo', ('bar',)), ('bar', 1), ('foo', foo), ('foo', Foo()), ('foo', 3), foo,
+        ('foo', strict),
+    ]
+    for pattern in patterns:
+        for matches in [compile(pattern), compile_always(pattern)]:
+            for subject in subjects:
+                assert bool(matches(subject)) == bool(pattern == subject), (pattern, subject)
+
+    matches = compile(('foo', 1), 'bar')
+    assert matches(('foo', 1)) and matches('bar') and not matches('foo')
+    for matches in [compile(('foo', foo), 'bar'), compile_always(('foo', foo), 'bar')]:
+        assert matches(('foo', foo)) and matches('bar') and not matches(('foo', 1))
+    assert compile()('whatever')
+
+
+def test_compiled_patterns_are_cached():
+    assert compile(('foo', 1, ANY)) is compile(('foo', 1, ANY))
+    assert compile(('foo', IS_INSTANCE(int))) is compile(('foo', IS_INSTANCE(int)))
+    assert compile(('foo', 1)) is not compile(('foo', True))
+    assert compile(('foo', 1)) is not compile(('foo', 1.0))
+
+
+def test_only_patterns_of_plain_values_and_basic_matchers_are_compilable():
+    assert compilable('foo') and compilable(('foo', 1, ANY)) and compilable(('foo', IS_INSTANCE(int) | EQ(1)))
+    assert compilable() and compilable(('foo', 1), 'bar')
+    assert not compilable(object()) and not compilable(('foo', IN([1, 2]))) and not compilable('foo', object())
+
+
+def test_pattern_index():
+    index = PatternIndex()
+    index.add(('get', ANY), 'get')
+    index.add(('get', ANY, ANY), 'get-with-default')
+    index.add('stop', 'stop')
+    index.add(OR(('put', ANY, ANY), 'flush'), 'write')
+    index.add(IS_INSTANCE(int), 'int')
+    index.add(ANY, 'any')
+    assert len(index) == 6
+
+    assert index.matching(('get', 'x')) == ['get', 'any']
+    assert index.matching(('get', 'x', 1)) == ['get-with-default', 'any']
+    assert index.matching(('put', 'x', 1)) == ['write', 'any']
+    assert index.matching('flush') == ['write', 'any']
+    assert index.matching(u'stop') == ['stop', 'any']
+    assert index.matching(3) == ['int', 'any']
+    assert index.matching(('get',)) == ['any']
+
+    assert index.first(('get', 'x')) == 'get'
+    assert index.first(('unknown',)) == 'any'
+    assert PatternIndex().first('foo', default='none') == 'none'
@@ -0,0 +1,38 @@
+from twisted.trial import unittest
+
+from spinoff.util.timerwheel import TimerWheel
+
+
+class TimerWheelTestCase(unittest.TestCase):
+
+    def test_items_expire_once_due(self):
+        wheel = TimerWheel(resolution=0.1, size=10)
+        wheel.add('a', 0.25)
+        wheel.add('b', 0.5)
+        wheel.add('c', 0.5)
+        self.assertEqual(len(wheel), 3)
+
+        self.assertEqual(wheel.expire(0.2), [])
+        self.assertEqual(wheel.expire(0.3), ['a'])
+        self.assertEqual(wheel.expire(0.3), [], "expired items should be removed")
+        self.assertEqual(sorted(wheel.expire(0.6)), ['b', 'c'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_items_due_beyond_a_full_turn_expire_only_once_due(self):
+        wheel = TimerWheel(resolution=0.1, size=10)
+        wheel.add('later', 2.55)
+        for i in range(25):
+            self.assertEqual(wheel.expire(i / 10.0), [])
+        self.assertEqual(wheel.expire(2.6), ['later'])
+
+    def test_items_added_in_the_past_expire_on_the_next_call(self):
+        wheel = TimerWheel(resolution=0.1, size=10)
+        wheel.expire(5.0)
+        wheel.add('overdue', 1.0)
+        self.assertEqual(wheel.expire(5.05), ['overdue'])
+
+    def test_a_long_gap_between_calls_expires_everything_due(self):
+        wheel = TimerWheel(resolution=0.1, size=10)
+        for i in range(30):
+            wheel.add(i, i / 10.0)
+        self.assertEqual(sorted(wheel.expire(100.0)), range(30))
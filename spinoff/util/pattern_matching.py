@@ -2,6 +2,10 @@ import copy
 import inspect
 import re
 import warnings
+from functools import partial
+from heapq import merge
+from itertools import count
+from operator import eq
 
 
 class _Values(list):
@@ -13,31 +17,24 @@ def _is_collect(pattern):
 
 
 def match(pattern, subject, flatten=True):
-    # XXX: try to optimize this function
-    def _match(pattern, subject, success):
+    def _match(pattern, subject, success, values):
         if not isinstance(pattern, tuple):
-            values = _Values([subject] if _is_collect(pattern) else [])
-            return (success and pattern == subject, values)
+            if _is_collect(pattern):
+                values.append(subject)
+            return success and pattern == subject
+        elif isinstance(subject, tuple):
+            n = len(subject)
+            for ix, subpattern in enumerate(pattern):
+                success = _match(subpattern, subject[ix] if ix < n else None, success, values)
+            # if not all of the subject has been consumed, the match has failed:
+            return success if n <= len(pattern) else False
         else:
-            values = _Values()
-            subject_is_tuple = isinstance(subject, tuple)
-
             for subpattern in pattern:
-                success, subvalues = _match(subpattern, subject[0] if subject_is_tuple and subject else None, success)
-
-                assert isinstance(subvalues, _Values)
-                values.extend(subvalues)
-
-                subject = subject[1:] if subject_is_tuple and subject else None
-
-            # if not all of the subject has been consumed, the match has failed:
-            if subject:
-                success = False
-
-            return success, values
+                success = _match(subpattern, None, success, values)
+            return success if pattern or not subject else False
 
-    success, values = _match(pattern, subject, True)
-    assert isinstance(values, _Values)
+    values = _Values()
+    success = _match(pattern, subject, True, values)
 
     return ((success, tuple(values))
             if not flatten else
@@ -52,6 +49,19 @@ class _Marker(object):
         return "%s(<unknown>)" % (type(self).__name__,)
 
 
+_nargs = {}  # Matcher subclass => number of arguments of its __init__, or None if it takes any number of them
+
+
+def _nargs_of(cls):
+    try:
+        argspec = inspect.getargspec(cls.__init__)
+    except TypeError:
+        return None
+    if argspec.varargs or argspec.keywords:
+        return None
+    return len(argspec.args) - 1
+
+
 class Matcher(_Marker):
     ignore = False
 
@@ -59,15 +69,11 @@ class Matcher(_Marker):
         obj = super(Matcher, self).__new__(self, *args if args else [])
 
         try:
-            argspec = inspect.getargspec(type(obj).__init__)
-        except TypeError:
-            return obj
-        else:
-            if argspec.varargs or argspec.keywords:
-                return obj
-
-        nargs = len(argspec.args) - 1
-        if len(args) <= nargs:  # <= because for example (at least) copy.copy causes us to be called with no arguments
+            nargs = _nargs[self]
+        except KeyError:
+            nargs = _nargs[self] = _nargs_of(self)
+        if nargs is None or len(args) <= nargs:
+            # <= because for example (at least) copy.copy causes us to be called with no arguments
             return obj
         else:
             obj.__init__(*args[:nargs])
@@ -250,3 +256,244 @@ class HASSUBSET(Matcher):
 def HASITEMS(*args, **kwargs):
     warnings.warn("HASITEMS has been deprecated in favor of HASSUBSET", DeprecationWarning)
     return HASSUBSET(*args, **kwargs)
+
+
+# Compiled patterns
+
+COMPILE_CACHE_MAX = 10000
+
+_compiled = {}  # cache key of patterns => function
+_PLAIN_TYPES = frozenset([str, unicode, int, long, float, bool, type(None)])
+_FLAT_TYPES = _PLAIN_TYPES | frozenset([type(ANY)])
+
+
+def compile(*patterns):
+    """Returns a function that tells if a subject matches any of `patterns`, i.e. `compile(*patterns)(x)` is
+    equivalent to `OR(*patterns) == x`; no patterns match anything, just like `OR()`.
+
+    Patterns made up of plain values (strings, numbers, `None`) and the basic matchers (`ANY`, `IS_INSTANCE`, `EQ`,
+    `NOT`, `OR`, `AND`) are compiled to a single specialized function (see `compile_always`) which is cached, so
+    compiling the same pattern again is a dictionary lookup. Other patterns (e.g. containing `Ref`s or `IN`) are
+    typically built anew for every use so they are not worth compiling and are compared as is.
+
+    """
+    if len(patterns) == 1 and type(patterns[0]) is tuple:
+        # fast path for the most common case of a flat tuple of plain values and `ANY`s: the pattern itself can be
+        # used in the key, as long as the types of its items are part of the key too (e.g. `1 == True`)
+        types = tuple(map(type, patterns[0]))
+        key = (types, patterns[0]) if _FLAT_TYPES.issuperset(types) else _cache_key(patterns)
+    else:
+        key = _cache_key(patterns)
+    if key is None:
+        return partial(eq, patterns[0] if len(patterns) == 1 else OR(*patterns))
+    try:
+        return _compiled[key]
+    except KeyError:
+        if len(_compiled) >= COMPILE_CACHE_MAX:
+            _compiled.clear()
+        ret = _compiled[key] = compile_always(*patterns)
+        return ret
+
+
+def compilable(*patterns):
+    """Tells if `compile(*patterns)` compiles the patterns instead of comparing them as is."""
+    return _cache_key(patterns) is not None
+
+
+def compile_always(*patterns):
+    """Like `compile` but always compiles and never caches; meant for long lived patterns.
+
+    The generated code is specialized to the structure of the patterns: tuple patterns check the type and length of the
+    subject and then compare the items in line; `ANY` items are skipped altogether, `IS_INSTANCE` becomes a call to
+    `isinstance` and `OR`, `AND` and `NOT` become boolean operators. Any other matchers and values are compared with
+    `==` as usual.
+
+    """
+    consts = {}
+    expr = ' or '.join('(%s)' % (_expr(x, 'x', consts),) for x in patterns) if patterns else 'True'
+    namespace = dict(consts)
+    exec 'def matches(x):\n    return %s\n' % (expr,) in namespace
+    return namespace['matches']
+
+
+def _expr(pattern, subject, consts):
+    # returns the Python expression that tells if the subject expression `subject` matches `pattern`
+    t = type(pattern)
+    if t is tuple:
+        n = len(pattern)
+        items = [_expr(x, '%s[%d]' % (subject, ix), consts) for ix, x in enumerate(pattern) if x is not ANY]
+        # subclasses of tuple and other types are left to their own `__eq__`
+        return '(%s if type(%s) is tuple else %s == %s)' % (
+            ' and '.join(['len(%s) == %d' % (subject, n)] + items), subject, _const(pattern, consts), subject)
+    elif pattern is ANY:
+        return 'True'
+    elif t is IS_INSTANCE:
+        return 'isinstance(%s, %s)' % (subject, _const(pattern.t, consts))
+    elif t is EQ:
+        return _expr(pattern.pattern, subject, consts)
+    elif t is NOT and isinstance(pattern.matcher, (Matcher, tuple)):
+        return '(not %s)' % (_expr(pattern.matcher, subject, consts),)
+    elif t is OR:
+        return ('(%s)' % ' or '.join(_expr(x, subject, consts) for x in pattern.matchers)
+                if pattern.matchers else
+                'True')
+    elif t is AND:
+        return '(%s and %s)' % (_expr(pattern.matcher1, subject, consts), _expr(pattern.matcher2, subject, consts))
+    elif t in _PLAIN_TYPES:
+        return '%s == %s' % (_const(pattern, consts), subject)
+    # keep the identity-then-equality semantics of tuple comparison for arbitrary objects, with the pattern on the left
+    # so that its `__eq__` is the one called first, as with `pattern == subject`
+    const = _const(pattern, consts)
+    return '(%s is %s or %s == %s)' % (subject, const, const, subject)
+
+
+def _const(value, consts):
+    name = '_c%d' % (len(consts),)
+    consts[name] = value
+    return name
+
+
+def _cache_key(pattern):
+    # keys must not contain matchers or arbitrary objects: dict lookups compare keys with `==`; tuple keys start with
+    # `tuple` itself so they never compare equal to the keys of the fast path in `compile`
+    t = type(pattern)
+    if t in _PLAIN_TYPES:
+        return (t, pattern)
+    elif t is tuple:
+        keys = []
+        for x in pattern:
+            tx = type(x)
+            key = (tx, x) if tx in _PLAIN_TYPES else _cache_key(x)  # inlined for the most common case
+            if key is None:
+                return None
+            keys.append(key)
+        return (tuple, tuple(keys))
+    elif pattern is ANY:
+        return 'ANY'
+    elif t is IS_INSTANCE:
+        return (IS_INSTANCE, pattern.t) if isinstance(pattern.t, type) else None
+    elif t is EQ:
+        key = _cache_key(pattern.pattern)
+        return None if key is None else (EQ, key)
+    elif t is NOT:
+        key = _cache_key(pattern.matcher)
+        return None if key is None else (NOT, key)
+    elif t is OR or t is AND:
+        keys = _cache_key(pattern.matchers if t is OR else (pattern.matcher1, pattern.matcher2))
+        return None if keys is None else (t, keys)
+    return None
+
+
+def key_of(msg):
+    """Returns the key of `msg` for indexing: its tag if it's a tag-like `str` or a tuple starting with one, or else its
+    type.
+
+    Strings serve as their own keys so that e.g. `u'foo'` and `'foo'`, which compare equal, share a key.
+
+    """
+    if isinstance(msg, tuple):
+        if msg and isinstance(msg[0], basestring):
+            return msg[0]
+    elif isinstance(msg, basestring):
+        return msg
+    return type(msg)
+
+
+def keys_of(pattern):
+    """Returns the set of keys (see `key_of`) of subjects that can match `pattern`, or `None` if it can't be told."""
+    if isinstance(pattern, Matcher):
+        if type(pattern) is OR and pattern.matchers:
+            keys = set()
+            for subpattern in pattern.matchers:
+                subkeys = keys_of(subpattern)
+                if subkeys is None:
+                    return None
+                keys |= subkeys
+            return keys
+        return None
+    elif isinstance(pattern, basestring):
+        return set([pattern])
+    elif isinstance(pattern, tuple) and pattern and isinstance(pattern[0], basestring):
+        return set([pattern[0]])
+    # anything else can be equal to subjects of other types as well, e.g. `1 == 1.0`
+    return None
+
+
+def _slots_of(pattern):
+    # like `keys_of` but with the length of tuples (or `None` for non-tuples) as the second level of the index
+    if type(pattern) is OR and pattern.matchers:
+        slots = set()
+        for subpattern in pattern.matchers:
+            subslots = _slots_of(subpattern)
+            if subslots is None:
+                return None
+            slots |= subslots
+        return slots
+    elif isinstance(pattern, basestring):
+        return set([(pattern, None)])
+    elif type(pattern) is tuple and pattern and isinstance(pattern[0], basestring):
+        return set([(pattern[0], len(pattern))])
+    return None
+
+
+class PatternIndex(object):
+    """A set of patterns with a value associated to each that tells which of the patterns match a subject without
+    testing all of them.
+
+    The patterns are indexed by the tag of the subjects they can match (see `key_of`) and then by tuple length; only the
+    (compiled) patterns indexed under the tag and length of a subject, and the patterns that can't be indexed such as
+    bare matchers, are actually tested. Matches are returned in the order in which the patterns were added.
+
+        index = PatternIndex()
+        index.add(('get', ANY), 'getter')
+        index.add(('put', ANY, ANY), 'putter')
+        index.add(ANY, 'fallback')
+        index.matching(('put', 'x', 1))  # => ['putter', 'fallback']
+        index.first(('get', 'x'))  # => 'getter'
+
+    """
+    def __init__(self):
+        self._slots = {}  # (key, length or None) => [(seqno, test, value)]
+        self._unindexed = []  # [(seqno, test, value)]
+        self._seqnos = count()
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, pattern, value=None):
+        entry = (next(self._seqnos), compile_always(pattern), value)
+        slots = _slots_of(pattern)
+        if slots is None:
+            self._unindexed.append(entry)
+        else:
+            for slot in slots:
+                self._slots.setdefault(slot, []).append(entry)
+        self._len += 1
+
+    def _candidates(self, subject):
+        # only subjects with a tag can be in a slot (see `key_of` and `_slots_of`)
+        if isinstance(subject, tuple):
+            indexed = (self._slots.get((subject[0], len(subject)))
+                       if subject and isinstance(subject[0], basestring) else
+                       None)
+        elif isinstance(subject, basestring):
+            indexed = self._slots.get((subject, None))
+        else:
+            indexed = None
+        if not indexed:
+            return self._unindexed
+        elif not self._unindexed:
+            return indexed
+        return merge(indexed, self._unindexed)
+
+    def matching(self, subject):
+        """Returns the values of all the patterns that match `subject`."""
+        return [value for _, test, value in self._candidates(subject) if test(subject)]
+
+    def first(self, subject, default=None):
+        """Returns the value of the first pattern that matches `subject`, or `default` if none do."""
+        for _, test, value in self._candidates(subject):
+            if test(subject):
+                return value
+        return default
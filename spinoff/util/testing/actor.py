@@ -14,6 +14,7 @@ from spinoff.actor import Actor, Node
 from spinoff.actor.events import Events, ErrorIgnored, UnhandledError, ErrorReportingFailure
 from spinoff.actor.exceptions import WrappingException
 from spinoff.actor.remoting import HubWithNoRemoting
+from spinoff.actor.scheduler import default_scheduler
 from spinoff.util.async import _process_idle_calls, deferred_with
 
 from .common import deferred_result, assert_raises
@@ -276,6 +277,7 @@ def wrap_globals(globals):
                 deferred_with(ErrorCollector(), fn)
                 .addBoth(lambda result: Node.stop_all().addCallback(lambda _: result))
                 .addBoth(lambda result: (_process_idle_calls(), result)[-1])
+                .addBoth(lambda result: (default_scheduler.run_until_idle(), result)[-1])
                 .addBoth(lambda result: (check_memleaks(), result)[-1])
             )
 
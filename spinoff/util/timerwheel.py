@@ -0,0 +1,44 @@
+from __future__ import division
+
+
+class TimerWheel(object):
+    """A hashed timer wheel for a large number of timers that are checked periodically.
+
+    Items are hashed by their due time into one of `size` slots of `resolution` seconds each, so that `expire` only has
+    to look at the slots that have come due since it was last called rather than at all items. Items due more than a
+    full turn of the wheel ahead share the slots with earlier items and are left in place until they are due.
+
+    There is no way to remove or reschedule an item; items that are no longer relevant or have become due later should
+    be ignored or re-added, respectively, by the code that expires them.
+
+    """
+
+    def __init__(self, resolution, size, t=0.0):
+        self.resolution = resolution
+        self.slots = [[] for _ in xrange(size)]
+        self.tick = int(t // resolution)  # the tick of the earliest slot that may contain due items
+        self.count = 0
+
+    def add(self, item, due):
+        tick = max(int(due // self.resolution), self.tick)
+        self.slots[tick % len(self.slots)].append((due, item))
+        self.count += 1
+
+    def expire(self, t):
+        """Removes and returns the items that are due at `t`, in no particular order."""
+        ret = []
+        slots = self.slots
+        now = int(t // self.resolution)
+        for tick in xrange(self.tick, min(now, self.tick + len(slots) - 1) + 1):
+            slot = slots[tick % len(slots)]
+            if slot:
+                due = [x for x in slot if x[0] <= t]
+                if due:
+                    slot[:] = [x for x in slot if x[0] > t]
+                    ret.extend(item for _, item in due)
+        self.tick = now
+        self.count -= len(ret)
+        return ret
+
+    def __len__(self):
+        return self.count
@@ -10,7 +10,7 @@ from zope.interface import implements
 
 
 from spinoff.actor._actor import _validate_nodeid
-from spinoff.actor.runner import ActorRunner
+from spinoff.actor.runner import ActorRunner, Router, WorkerGroup, worker_nodeids
 from spinoff.util.logging import fatal, log
 
 
@@ -33,6 +33,12 @@ class Options(usage.Options):
         ['message', 'm', _EMPTY, "[m]essage to send to the actor"],
         ['remoting', 'r', None, "Set up [r]emoting with the specified hostname/IP:port pair; hostname/IP is optional and defaults to localhost"],
         ['name', 'n', None, "Set the [n]ame of the actor"],
+        ['seeds', None, None, "Comma-separated IDs of the nodes to connect to at startup"],
+        ['ipcdir', None, None, "Directory of the Unix sockets to use between nodes on the same host instead of TCP"],
+        ['workers', 'w', 1, ("Number of [w]orker processes to run the actor in, each a node on one of the ports "
+                             "following the one given to --remoting; the actor at its name on the node given to "
+                             "--remoting forwards the messages it receives to the workers in turn. Requires "
+                             "--remoting and --name."), int],
         ['supervise', 's', 'stop', "Set how the spawned actor is [s]upervised in case of failures"],
 
         ['remotedebuggingport', 'p', 6022, "[p]rt on which to start the SSH remote debug console server"],
@@ -116,6 +122,20 @@ class ActorRunnerMaker(object):
             else:
                 kwargs['nodeid'] = nodeid
 
+        if options['seeds']:
+            seeds = [x.strip() for x in options['seeds'].split(',') if x.strip()]
+            try:
+                for seed in seeds:
+                    _validate_nodeid(seed)
+            except ValueError as e:
+                fatal("invalid seed node ID: %s" % (e,))
+                sys.exit(1)
+            else:
+                kwargs['seeds'] = seeds
+
+        if options['ipcdir']:
+            kwargs['ipc_dir'] = options['ipcdir']
+
         if options['supervise']:
             supervise_option = options['supervise']
             if supervise_option not in ('stop', 'restart', 'resume'):
@@ -126,7 +146,17 @@ class ActorRunnerMaker(object):
         kwargs['keep_running'] = options['keeprunning']
 
         m = MultiService()
-        actor_runner = ActorRunner(actor_cls, **kwargs)
+        if options['workers'] > 1:
+            if not kwargs.get('nodeid') or not kwargs.get('name'):
+                fatal("--workers requires --remoting and --name")
+                sys.exit(1)
+            nodeid, name = kwargs['nodeid'], kwargs['name']
+            nodeids = worker_nodeids(nodeid, options['workers'])
+            WorkerGroup(nodeids, self.worker_args(options)).setServiceParent(m)
+            actor_runner = ActorRunner(Router, init_params={'nodeids': nodeids, 'name': name}, nodeid=nodeid,
+                                       name=name, keep_running=True, seeds=nodeids, ipc_dir=kwargs.get('ipc_dir'))
+        else:
+            actor_runner = ActorRunner(actor_cls, **kwargs)
         actor_runner.setServiceParent(m)
 
         # manhole
@@ -147,6 +177,19 @@ class ActorRunnerMaker(object):
 
         return m
 
+    def worker_args(self, options):
+        """Returns the arguments to start the worker nodes with, apart from their node IDs."""
+        args = ['--actor', options['actor'], '--name', options['name'], '--supervise', options['supervise']]
+        if options['params'] is not _EMPTY:
+            args += ['--params', options['params']]
+        if options['message'] is not _EMPTY:
+            args += ['--message', options['message']]
+        if options['keeprunning']:
+            args.append('--keeprunning')
+        if options['ipcdir']:
+            args += ['--ipcdir', options['ipcdir']]
+        return args
+
     def make_manhole_server(self, port, username, password):
         from twisted.application.internet import TCPServer
         from twisted.cred.portal import Portal